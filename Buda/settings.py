@@ -84,6 +84,18 @@ DATABASES = {
 }
 
 
+# Cache
+# Menu snapshots and versions live here. LocMemCache is per-process, so use a
+# shared backend (Redis/Memcached) when running more than one worker.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'buda-default',
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
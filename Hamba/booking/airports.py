@@ -0,0 +1,170 @@
+"""
+In-process airport autocomplete index.
+
+The active Airport rows are loaded once into a sorted list of
+(folded token, airport) pairs. Folding lowercases and strips accents, so
+"sao" finds São Paulo and "zur" finds Zürich. A lookup bisects that list
+once per query word: every word has to be a prefix of some token of the
+airport's code, city, name or country. Matches are ranked:
+
+    exact IATA code > city starts with the query > word-prefix match,
+
+then large before medium before smaller airports, then by city and name.
+Recent lookups are memoised, so repeated keystrokes cost a dict lookup.
+
+The index is built on first use. It rebuilds when Airport rows change: at
+most every CHECK_SECONDS it compares a (count, last updated_at) fingerprint,
+which also catches load_airports run from another process. Calling
+invalidate() forces the check on the next lookup.
+"""
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from collections import OrderedDict
+
+from django.db.models import Count, Max
+
+from .models import Airport
+
+CHECK_SECONDS = 60
+MEMO_SIZE = 2048
+DEFAULT_LIMIT = 10
+
+SIZE_RANK = {
+    Airport.Size.LARGE: 0,
+    Airport.Size.MEDIUM: 1,
+    Airport.Size.SMALL: 2,
+}
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def fold(text):
+    """Lowercase ``text`` and strip accents: "Zürich" -> "zurich"."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def tokens(text):
+    return _TOKEN.findall(fold(text))
+
+
+class AirportIndex:
+    def __init__(self, airports):
+        """``airports`` is an iterable of dicts with code, city, name, country and size."""
+        # Positions follow the static order (size, city, name), so among equally
+        # good matches the lowest position wins and ranking is integer work
+        ordered = []
+        for airport in airports:
+            order = (SIZE_RANK.get(airport.get("size"), 3), fold(airport["city"]), fold(airport["name"]))
+            ordered.append((order, {key: airport[key] for key in ("code", "city", "name", "country")}))
+        ordered.sort(key=lambda pair: pair[0])
+        self.airports = [airport for _, airport in ordered]
+        self._codes = {}
+        words, cities = [], []
+        for position, airport in enumerate(self.airports):
+            self._codes[fold(airport["code"])] = position
+            cities.append((" ".join(tokens(airport["city"])), position))
+            airport_words = set(tokens(airport["code"]) + tokens(airport["city"])
+                                + tokens(airport["name"]) + tokens(airport["country"]))
+            words.extend((word, position) for word in airport_words)
+        words.sort()
+        cities.sort()
+        self._words = [word for word, _ in words]
+        self._word_positions = [position for _, position in words]
+        self._cities = [city for city, _ in cities]
+        self._city_positions = [position for _, position in cities]
+        self._memo = OrderedDict()
+        self._memo_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.airports)
+
+    @staticmethod
+    def _range(keys, values, prefix):
+        start = bisect_left(keys, prefix)
+        return values[start:bisect_left(keys, prefix + "\uffff", start)]
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        words = tokens(query)
+        if not words:
+            return []
+        phrase = " ".join(words)
+        memo_key = (phrase, limit)
+        with self._memo_lock:
+            hit = self._memo.get(memo_key)
+            if hit is not None:
+                self._memo.move_to_end(memo_key)
+                return hit
+
+        # Every word must prefix some token; longest first has the fewest candidates
+        words.sort(key=len, reverse=True)
+        candidates = set(self._range(self._words, self._word_positions, words[0]))
+        for word in words[1:]:
+            if not candidates:
+                break
+            candidates &= set(self._range(self._words, self._word_positions, word))
+
+        ranked = []
+        exact = self._codes.get(phrase)
+        if exact is not None and exact in candidates:
+            ranked.append(exact)
+            candidates.discard(exact)
+        city_matches = candidates.intersection(self._range(self._cities, self._city_positions, phrase))
+        ranked.extend(heapq.nsmallest(limit - len(ranked), city_matches))
+        if len(ranked) < limit:
+            ranked.extend(heapq.nsmallest(limit - len(ranked), candidates - city_matches))
+
+        results = [self.airports[position] for position in ranked]
+        with self._memo_lock:
+            self._memo[memo_key] = results
+            if len(self._memo) > MEMO_SIZE:
+                self._memo.popitem(last=False)
+        return results
+
+
+def _fingerprint():
+    return tuple(Airport.objects.aggregate(count=Count("id"), updated=Max("updated_at")).values())
+
+
+def _load():
+    rows = Airport.objects.filter(is_active=True).values("iata_code", "city", "name", "country", "size")
+    return AirportIndex(
+        {"code": row["iata_code"], "city": row["city"], "name": row["name"],
+         "country": row["country"], "size": row["size"]}
+        for row in rows.iterator()
+    )
+
+
+_index = None
+_fingerprint_value = None
+_checked_at = float("-inf")
+_lock = threading.Lock()
+
+
+def get_index():
+    """The current index, rebuilt if the airports changed since it was built."""
+    global _index, _fingerprint_value, _checked_at
+    if _index is not None and time.monotonic() - _checked_at < CHECK_SECONDS:
+        return _index
+    with _lock:
+        if _index is None or time.monotonic() - _checked_at >= CHECK_SECONDS:
+            fingerprint = _fingerprint()
+            if _index is None or fingerprint != _fingerprint_value:
+                _index = _load()
+                _fingerprint_value = fingerprint
+            _checked_at = time.monotonic()
+        return _index
+
+
+def invalidate():
+    """Re-check the airports on the next lookup (after loading or editing them)."""
+    global _checked_at
+    _checked_at = float("-inf")
+
+
+def search_airports(query, limit=DEFAULT_LIMIT):
+    return get_index().search(query, limit)
@@ -0,0 +1,361 @@
+"""
+Flight fare search across several fare providers.
+
+A FareProvider answers one FareQuery with a list of Fare legs (outbound and,
+for return trips, return). FareSearchEngine asks every provider at once on a
+thread pool. Each provider has its own timeout, so a search takes as long as
+the slowest provider that answers in time, never the sum of all of them.
+Providers that fail, time out or have their circuit open are left out and
+the search is flagged partial. The legs are then paired into Itinerary
+objects, sorted by total price.
+
+Providers are configured with HAMBA_FARE_PROVIDERS, a list of
+{"class": "dotted.path", **kwargs}. The default is three StubProvider
+airlines, so search works offline. Their latency_ms and failure_rate can be
+raised to exercise timeouts and the circuit breaker.
+"""
+import hashlib
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Optional
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+OUTBOUND = "outbound"
+RETURN = "return"
+
+DEFAULT_TIMEOUT = 3.0
+MAX_ITINERARIES = 12
+
+DEFAULT_PROVIDERS = [
+    {"class": "booking.fares.StubProvider", "name": "lift", "airline": "LIFT", "code": "GE",
+     "base_fare": "899.00", "taxes": "423.00"},
+    {"class": "booking.fares.StubProvider", "name": "saa", "airline": "South African Airways", "code": "SA",
+     "base_fare": "1097.00", "taxes": "523.00"},
+    {"class": "booking.fares.StubProvider", "name": "cemair", "airline": "CemAir", "code": "5Z",
+     "base_fare": "749.00", "taxes": "380.00"},
+]
+
+
+@dataclass(frozen=True)
+class FareQuery:
+    origin: str
+    destination: str
+    departure_date: date
+    return_date: Optional[date] = None
+    adults: int = 1
+    children: int = 0
+    trip_type: str = "return"
+
+    @property
+    def is_return(self):
+        # The form can post a return date with a one-way search; ignore it
+        return self.trip_type == "return"
+
+    @classmethod
+    def from_search_params(cls, params):
+        """Build a query from the search form data kept in the session (dates as ISO strings)."""
+        def parse(value):
+            if isinstance(value, date) or not value:
+                return value or None
+            try:
+                return date.fromisoformat(value)
+            except ValueError:
+                return None
+
+        return cls(
+            origin=(params.get("origin") or "JNB").strip().upper(),
+            destination=(params.get("destination") or "DUR").strip().upper(),
+            departure_date=parse(params.get("departure_date")) or date.today(),
+            return_date=parse(params.get("return_date")),
+            adults=int(params.get("adults") or 1),
+            children=int(params.get("children") or 0),
+            trip_type=params.get("trip_type") or "return",
+        )
+
+
+@dataclass
+class Fare:
+    """One priced flight leg, normalised across providers."""
+
+    provider: str
+    direction: str
+    airline: str
+    flight_number: str
+    origin: str
+    destination: str
+    departure_time: str
+    arrival_time: str
+    price: Decimal
+    taxes: Decimal
+    cabin: str = "Economy"
+
+    def as_dict(self):
+        return asdict(self)
+
+
+@dataclass
+class Itinerary:
+    outbound: Fare
+    inbound: Optional[Fare] = None
+
+    @property
+    def total_base(self):
+        return self.outbound.price + (self.inbound.price if self.inbound else Decimal("0.00"))
+
+    @property
+    def total_taxes(self):
+        return self.outbound.taxes + (self.inbound.taxes if self.inbound else Decimal("0.00"))
+
+    @property
+    def total_price(self):
+        return self.total_base + self.total_taxes
+
+    def as_option(self):
+        """The dict shape search_results.html and the booking session use."""
+        return {
+            "outbound": self.outbound.as_dict(),
+            "return": self.inbound.as_dict() if self.inbound else None,
+            "total_base": self.total_base,
+            "total_taxes": self.total_taxes,
+            "total_price": self.total_price,
+        }
+
+
+@dataclass
+class SearchResult:
+    itineraries: list = field(default_factory=list)
+    # provider name -> "ok", "error", "timeout" or "circuit_open"
+    providers: dict = field(default_factory=dict)
+    elapsed: float = 0.0
+
+    @property
+    def partial(self):
+        return any(status != "ok" for status in self.providers.values())
+
+
+class FareProviderError(Exception):
+    pass
+
+
+class FareProvider:
+    """Base class for fare sources. Subclasses implement search()."""
+
+    name = "provider"
+    timeout = DEFAULT_TIMEOUT
+
+    def __init__(self, name=None, timeout=None):
+        if name:
+            self.name = name
+        if timeout is not None:
+            self.timeout = float(timeout)
+
+    def search(self, query):
+        """Return a list of Fare for ``query``; raise FareProviderError on failure."""
+        raise NotImplementedError
+
+
+class StubProvider(FareProvider):
+    """
+    Offline provider for one airline.
+
+    Fares are derived from the query, so the same search gives the same
+    flights. latency_ms (plus up to jitter_ms) is slept on every call, and
+    failure_rate is the chance that a call raises FareProviderError.
+    """
+
+    DEPARTURES = ["06:00", "08:30", "12:15", "16:45", "19:10"]
+
+    def __init__(self, airline, code, base_fare="900.00", taxes="420.00", flights=2,
+                 latency_ms=50, jitter_ms=50, failure_rate=0.0, duration_minutes=65, **kwargs):
+        super().__init__(**kwargs)
+        self.airline = airline
+        self.code = code
+        self.base_fare = Decimal(base_fare)
+        self.taxes = Decimal(taxes)
+        self.flights = flights
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.duration = timedelta(minutes=duration_minutes)
+
+    def search(self, query):
+        time.sleep((self.latency_ms + random.uniform(0, self.jitter_ms)) / 1000)
+        if random.random() < self.failure_rate:
+            raise FareProviderError(f"{self.name} is unavailable")
+
+        fares = self._legs(query, OUTBOUND, query.origin, query.destination, query.departure_date)
+        if query.is_return:
+            fares += self._legs(
+                query, RETURN, query.destination, query.origin, query.return_date or query.departure_date,
+            )
+        return fares
+
+    def _legs(self, query, direction, origin, destination, day):
+        seed = hashlib.sha1(f"{self.name}:{origin}:{destination}:{day}".encode()).hexdigest()
+        rng = random.Random(seed)
+        travellers = query.adults + query.children
+        legs = []
+        for departure in sorted(rng.sample(self.DEPARTURES, min(self.flights, len(self.DEPARTURES)))):
+            leaves = datetime.combine(day, datetime.strptime(departure, "%H:%M").time())
+            # Return legs are often bundled cheaply, as the old mock fares were
+            factors = ["0", "0.15", "0.6", "1", "1.2"] if direction == RETURN else ["0.85", "1", "1.1", "1.3"]
+            price = self.base_fare * Decimal(rng.choice(factors))
+            legs.append(Fare(
+                provider=self.name,
+                direction=direction,
+                airline=self.airline,
+                flight_number=f"{self.code}{rng.randint(100, 999)}",
+                origin=origin,
+                destination=destination,
+                departure_time=departure,
+                arrival_time=(leaves + self.duration).strftime("%H:%M"),
+                price=(price * travellers).quantize(Decimal("1.00")),
+                taxes=(self.taxes * travellers).quantize(Decimal("1.00")),
+            ))
+        return legs
+
+
+class CircuitBreaker:
+    """
+    Stops calling a provider after ``threshold`` failures in a row.
+
+    Once open, the provider is skipped for ``reset_after`` seconds. Then one
+    trial call is let through (half-open): success closes the circuit again,
+    failure re-opens it.
+    """
+
+    def __init__(self, threshold=3, reset_after=30.0):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_after:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+
+class FareSearchEngine:
+    def __init__(self, providers, max_workers=None, breaker_threshold=3, breaker_reset=30.0):
+        self.providers = list(providers)
+        self.breakers = {
+            provider.name: CircuitBreaker(breaker_threshold, breaker_reset) for provider in self.providers
+        }
+        # Timed-out calls keep their thread until they return, so leave headroom
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or max(4, len(self.providers) * 4), thread_name_prefix="fare-search",
+        )
+
+    def search(self, query):
+        started = time.monotonic()
+        result = SearchResult()
+        pending = {}
+        for provider in self.providers:
+            if not self.breakers[provider.name].allow():
+                result.providers[provider.name] = "circuit_open"
+                continue
+            future = self._executor.submit(provider.search, query)
+            pending[future] = (provider, started + provider.timeout)
+
+        fares = []
+        while pending:
+            now = time.monotonic()
+            for future, (provider, deadline) in list(pending.items()):
+                if not future.done() and now >= deadline:
+                    del pending[future]
+                    future.cancel()
+                    self.breakers[provider.name].record_failure()
+                    result.providers[provider.name] = "timeout"
+            if not pending:
+                break
+            done, _ = wait(
+                pending, timeout=min(deadline for _, deadline in pending.values()) - now,
+                return_when=FIRST_COMPLETED,
+            )
+            for future in done:
+                provider, _ = pending.pop(future)
+                try:
+                    fares.extend(future.result())
+                except Exception:
+                    self.breakers[provider.name].record_failure()
+                    result.providers[provider.name] = "error"
+                else:
+                    self.breakers[provider.name].record_success()
+                    result.providers[provider.name] = "ok"
+
+        result.itineraries = combine(fares, query)
+        result.elapsed = time.monotonic() - started
+        return result
+
+
+def combine(fares, query, limit=MAX_ITINERARIES):
+    """Pair outbound and return legs into the cheapest ``limit`` itineraries."""
+    outbound = [fare for fare in fares if fare.direction == OUTBOUND]
+    if not query.is_return:
+        itineraries = [Itinerary(fare) for fare in outbound]
+    else:
+        inbound = [fare for fare in fares if fare.direction == RETURN]
+        itineraries = [Itinerary(out, back) for out in outbound for back in inbound]
+    itineraries.sort(key=lambda itinerary: (itinerary.total_price, itinerary.outbound.departure_time))
+    return itineraries[:limit]
+
+
+def build_providers(config):
+    providers = []
+    for entry in config:
+        options = dict(entry)
+        providers.append(import_string(options.pop("class"))(**options))
+    return providers
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_search_engine():
+    """Process-wide engine, so circuit breaker state survives between requests."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = FareSearchEngine(
+                build_providers(getattr(settings, "HAMBA_FARE_PROVIDERS", DEFAULT_PROVIDERS)),
+                breaker_threshold=getattr(settings, "HAMBA_FARE_BREAKER_THRESHOLD", 3),
+                breaker_reset=getattr(settings, "HAMBA_FARE_BREAKER_RESET", 30.0),
+            )
+        return _engine
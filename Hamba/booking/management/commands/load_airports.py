@@ -1,12 +1,19 @@
 """
 Load airports from OurAirports CSV (data/airports.csv).
-Usage: python manage.py load_airports [--clear] [--path PATH]
+Usage: python manage.py load_airports [--clear] [--path PATH] [--dry-run [--show N]] [--chunk-size N]
+
+The CSV is read one row at a time and resolved to one row per IATA code in
+memory, then changed airports are upserted in chunks with a single
+INSERT ... ON CONFLICT per chunk, all in one transaction.
 """
 import csv
 import os
+import time
 
 from django.core.management.base import BaseCommand
+from django.db import transaction
 
+from booking.airports import invalidate as invalidate_airport_index
 from booking.models import Airport
 
 
@@ -65,6 +72,58 @@ def get_country_name(iso_code):
     return COUNTRY_NAMES.get(iso_code.upper(), iso_code.upper())
 
 
+CHUNK_SIZE = 500
+FIELDS = ["name", "city", "country", "size", "is_active"]
+PREFERRED_TYPES = {Airport.Size.LARGE, Airport.Size.MEDIUM}
+
+
+def parse_row(row):
+    """Airport field values for one CSV row, or None if it has no usable IATA code or name."""
+    iata = (row.get("iata_code") or "").strip()
+    name = (row.get("name") or "").strip()[:255]
+    if not iata or len(iata) > 3 or not name:
+        return None
+    row_type = (row.get("type") or "").strip()
+    municipality = (row.get("municipality") or "").strip()[:100]
+    return iata.upper() if len(iata) == 3 else iata, {
+        "name": name,
+        "city": municipality or name[:100],
+        "country": get_country_name((row.get("iso_country") or "").strip())[:100],
+        "size": row_type if row_type in Airport.Size.values else Airport.Size.OTHER,
+        "is_active": True,
+    }
+
+
+def resolve_rows(rows, existing):
+    """
+    Pick one row per IATA code, streaming.
+
+    The first row for a code wins unless a later one is a large or medium
+    airport. A code already in the database is only overwritten by large or
+    medium rows, unless its size is still "other" (loaded before sizes were
+    recorded, see migration 0002): then the first row fills it in. Memory is
+    bounded by the number of distinct codes, not the size of the file.
+    Returns ``(chosen, skipped)``.
+    """
+    chosen = {}
+    skipped = 0
+    for row in rows:
+        parsed = parse_row(row)
+        if parsed is None:
+            skipped += 1
+            continue
+        code, values = parsed
+        preferred = values["size"] in PREFERRED_TYPES
+        protected = code in existing and existing[code]["size"] != Airport.Size.OTHER
+        if (code in chosen or protected) and not preferred:
+            skipped += 1
+            continue
+        if code in chosen:
+            skipped += 1
+        chosen[code] = values
+    return chosen, skipped
+
+
 class Command(BaseCommand):
     help = "Load airports from OurAirports CSV (data/airports.csv)."
 
@@ -80,6 +139,23 @@ class Command(BaseCommand):
             default=None,
             help="Path to airports.csv (default: data/airports.csv under project root).",
         )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Show what would change without writing anything.",
+        )
+        parser.add_argument(
+            "--show",
+            type=int,
+            default=50,
+            help="With --dry-run, how many changed airports to list (0 for all).",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=CHUNK_SIZE,
+            help=f"Airports per INSERT ... ON CONFLICT statement (default {CHUNK_SIZE}).",
+        )
 
     def handle(self, *args, **options):
         project_root = os.path.dirname(
@@ -90,48 +166,69 @@ class Command(BaseCommand):
             self.stderr.write(self.style.ERROR(f"File not found: {path}"))
             return
 
-        if options["clear"]:
-            n = Airport.objects.count()
-            Airport.objects.all().delete()
-            self.stdout.write(self.style.WARNING(f"Cleared {n} airports."))
+        started = time.perf_counter()
+        existing = {}
+        if not options["clear"]:
+            for code, *values in Airport.objects.values_list("iata_code", *FIELDS).iterator():
+                existing[code] = dict(zip(FIELDS, values))
 
-        created = 0
-        updated = 0
-        preferred_types = {"large_airport", "medium_airport"}
         with open(path, "r", encoding="utf-8", newline="") as f:
-            rows = list(csv.DictReader(f))
-        for row in rows:
-            iata = (row.get("iata_code") or "").strip()
-            if not iata or len(iata) > 3:
-                continue
-            name = (row.get("name") or "").strip()[:255]
-            municipality = (row.get("municipality") or "").strip()[:100]
-            iso_country = (row.get("iso_country") or "").strip()
-            country = get_country_name(iso_country)[:100]
-            if not name:
-                continue
-            code = iata.upper() if len(iata) == 3 else iata
-            row_type = (row.get("type") or "").strip()
-            try:
-                existing = Airport.objects.get(iata_code=code)
-                if row_type not in preferred_types:
-                    continue
-            except Airport.DoesNotExist:
-                pass
-            obj, was_created = Airport.objects.update_or_create(
-                iata_code=code,
-                defaults={
-                    "name": name,
-                    "city": municipality or name[:100],
-                    "country": country,
-                    "is_active": True,
-                },
-            )
-            if was_created:
-                created += 1
-            else:
-                updated += 1
+            chosen, skipped = resolve_rows(csv.DictReader(f), existing)
+
+        inserts, updates = [], []
+        for code, values in chosen.items():
+            current = existing.get(code)
+            if current is None:
+                inserts.append(code)
+            elif current != values:
+                updates.append(code)
+        unchanged = len(chosen) - len(inserts) - len(updates)
+
+        if options["dry_run"]:
+            self._show_diff(inserts, updates, chosen, existing, options["show"])
+        else:
+            changed = inserts + updates
+            with transaction.atomic():
+                if options["clear"]:
+                    n, _ = Airport.objects.all().delete()
+                    self.stdout.write(self.style.WARNING(f"Cleared {n} airports."))
+                for start in range(0, len(changed), options["chunk_size"]):
+                    Airport.objects.bulk_create(
+                        [Airport(iata_code=code, **chosen[code])
+                         for code in changed[start:start + options["chunk_size"]]],
+                        update_conflicts=True,
+                        unique_fields=["iata_code"],
+                        update_fields=FIELDS + ["updated_at"],
+                    )
+            invalidate_airport_index()
 
-        self.stdout.write(
-            self.style.SUCCESS(f"Done. Created {created}, updated {updated} airports.")
+        elapsed = time.perf_counter() - started
+        summary = (
+            f"Inserted {len(inserts)}, updated {len(updates)}, unchanged {unchanged}, "
+            f"skipped {skipped} rows in {elapsed:.1f}s."
         )
+        if options["dry_run"]:
+            self.stdout.write(f"Dry run, nothing written. Would have: {summary}")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Done. {summary}"))
+
+    def _show_diff(self, inserts, updates, chosen, existing, limit):
+        lines = 0
+        for code in inserts:
+            if limit and lines >= limit:
+                break
+            values = chosen[code]
+            self.stdout.write(f"+ {code}  {values['city']} - {values['name']} ({values['country']})")
+            lines += 1
+        for code in updates:
+            if limit and lines >= limit:
+                break
+            changes = ", ".join(
+                f"{field}: {existing[code][field]!r} -> {chosen[code][field]!r}"
+                for field in FIELDS if existing[code][field] != chosen[code][field]
+            )
+            self.stdout.write(f"~ {code}  {changes}")
+            lines += 1
+        hidden = len(inserts) + len(updates) - lines
+        if hidden > 0:
+            self.stdout.write(f"... and {hidden} more (use --show 0 to list all)")
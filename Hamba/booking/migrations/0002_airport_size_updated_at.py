@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-18 09:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='airport',
+            name='size',
+            field=models.CharField(choices=[('large_airport', 'Large'), ('medium_airport', 'Medium'), ('small_airport', 'Small'), ('other', 'Other')], default='other', help_text='OurAirports type; larger airports rank higher in autocomplete.', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='airport',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
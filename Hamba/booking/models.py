@@ -244,10 +244,23 @@ class Airport(models.Model):
     city = models.CharField(max_length=100, help_text="City or metro area.")
     country = models.CharField(max_length=100, help_text="Country name.")
 
+    class Size(models.TextChoices):
+        LARGE = "large_airport", "Large"
+        MEDIUM = "medium_airport", "Medium"
+        SMALL = "small_airport", "Small"
+        OTHER = "other", "Other"
+
+    size = models.CharField(
+        max_length=20,
+        choices=Size.choices,
+        default=Size.OTHER,
+        help_text="OurAirports type; larger airports rank higher in autocomplete.",
+    )
     is_active = models.BooleanField(
         default=True,
         help_text="Use this to disable closed / inactive airports.",
     )
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["city", "name"]
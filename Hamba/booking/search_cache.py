@@ -0,0 +1,163 @@
+"""
+Cache for flight search results, in front of booking.fares.
+
+Entries are keyed by the normalised search (route, dates, passengers, trip
+type). Each entry has two lifetimes:
+
+- For HAMBA_SEARCH_FRESH_SECONDS it is served as-is ("hit").
+- For a further HAMBA_SEARCH_STALE_SECONDS it is still served ("stale"),
+  while one background thread fetches a replacement. Customers never wait
+  on a refresh.
+
+Partial results (a provider failed or timed out) are only fresh for
+PARTIAL_FRESH_SECONDS, so a short provider outage doesn't hide that
+airline's fares for long. A background refresh that comes back partial
+doesn't replace a complete entry; the complete one keeps being served.
+
+A miss fetches upstream. Concurrent identical misses in this process share
+that one fetch ("coalesced") instead of each calling every provider. The
+counters behind stats() record how each lookup was answered.
+"""
+import hashlib
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .fares import get_search_engine
+
+KEY_PREFIX = "hamba:search:"
+PARTIAL_FRESH_SECONDS = 15
+
+HIT = "hit"
+STALE = "stale"
+MISS = "miss"
+COALESCED = "coalesced"
+
+
+def search_key(query):
+    """Cache key for a FareQuery; a one-way search ignores any return date."""
+    is_return = query.is_return
+    parts = [
+        query.origin.strip().upper(),
+        query.destination.strip().upper(),
+        query.departure_date.isoformat(),
+        query.return_date.isoformat() if is_return and query.return_date else "",
+        str(query.adults),
+        str(query.children or 0),
+        "return" if is_return else "oneway",
+    ]
+    return KEY_PREFIX + hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+
+class SearchCache:
+    def __init__(self, fetch, fresh_seconds=120, stale_seconds=600, backend=cache):
+        self.fetch = fetch
+        self.fresh_seconds = fresh_seconds
+        self.stale_seconds = stale_seconds
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._inflight = {}  # key -> Future of the upstream fetch
+        self._refreshing = set()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="search-refresh")
+        self._counts = {HIT: 0, STALE: 0, MISS: 0, COALESCED: 0, "refreshes": 0, "errors": 0}
+
+    def search(self, query):
+        """Return ``(SearchResult, status)``; status is one of hit, stale, miss or coalesced."""
+        key = search_key(query)
+        entry = self.backend.get(key)
+        if entry is not None:
+            age = time.time() - entry["fetched_at"]
+            if age < entry["fresh_for"]:
+                self._count(HIT)
+                return entry["result"], HIT
+            self._count(STALE)
+            self._refresh_in_background(key, query, keep_complete=not entry["result"].partial)
+            return entry["result"], STALE
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            self._count(COALESCED)
+            return future.result(), COALESCED
+
+        self._count(MISS)
+        try:
+            result = self._fetch_and_store(key, query)
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        else:
+            future.set_result(result)
+            return result, MISS
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+        lookups = counts[HIT] + counts[STALE] + counts[MISS] + counts[COALESCED]
+        counts["lookups"] = lookups
+        counts["hit_ratio"] = round((lookups - counts[MISS]) / lookups, 3) if lookups else 0.0
+        return counts
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def _fetch_and_store(self, key, query, keep_complete=False):
+        try:
+            result = self.fetch(query)
+        except Exception:
+            self._count("errors")
+            raise
+        if keep_complete and result.partial:
+            return result
+        fresh_for = min(self.fresh_seconds, PARTIAL_FRESH_SECONDS) if result.partial else self.fresh_seconds
+        if result.itineraries:
+            self.backend.set(
+                key, {"result": result, "fetched_at": time.time(), "fresh_for": fresh_for},
+                timeout=fresh_for + self.stale_seconds,
+            )
+        return result
+
+    def _refresh_in_background(self, key, query, keep_complete=False):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            self._counts["refreshes"] += 1
+
+        def refresh():
+            try:
+                self._fetch_and_store(key, query, keep_complete)
+            except Exception:
+                # Keep serving the stale entry; the next lookup tries again
+                pass
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._executor.submit(refresh)
+
+
+_search_cache = None
+_search_cache_lock = threading.Lock()
+
+
+def get_search_cache():
+    global _search_cache
+    with _search_cache_lock:
+        if _search_cache is None:
+            _search_cache = SearchCache(
+                lambda query: get_search_engine().search(query),
+                fresh_seconds=getattr(settings, "HAMBA_SEARCH_FRESH_SECONDS", 120),
+                stale_seconds=getattr(settings, "HAMBA_SEARCH_STALE_SECONDS", 600),
+            )
+        return _search_cache
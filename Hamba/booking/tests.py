@@ -0,0 +1,361 @@
+import csv
+import io
+import os
+import tempfile
+import threading
+import time
+from datetime import date
+from unittest import mock
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from . import airports, search_cache
+from .airports import AirportIndex
+from .fares import RETURN, CircuitBreaker, FareQuery, FareSearchEngine, SearchResult, StubProvider
+from .models import Airport
+from .search_cache import COALESCED, HIT, MISS, STALE, SearchCache
+from .views import AIRPORT_SEARCH_MAX_AGE
+
+
+def stub(name, **kwargs):
+    options = {"airline": name.upper(), "code": name[:2].upper(), "latency_ms": 0, "jitter_ms": 0}
+    options.update(kwargs)
+    return StubProvider(name=name, **options)
+
+
+class FareSearchEngineTests(SimpleTestCase):
+    def setUp(self):
+        self.query = FareQuery("JNB", "CPT", date(2026, 12, 1), date(2026, 12, 8))
+
+    def test_slow_provider_times_out_and_result_is_partial(self):
+        engine = FareSearchEngine([stub("fast"), stub("slow", latency_ms=500, timeout=0.05)])
+        result = engine.search(self.query)
+        self.assertEqual(result.providers, {"fast": "ok", "slow": "timeout"})
+        self.assertTrue(result.partial)
+        self.assertLess(result.elapsed, 0.4)
+        self.assertTrue(result.itineraries)
+        self.assertEqual({i.outbound.provider for i in result.itineraries}, {"fast"})
+
+    def test_complete_search_is_not_partial(self):
+        result = FareSearchEngine([stub("one"), stub("two")]).search(self.query)
+        self.assertEqual(result.providers, {"one": "ok", "two": "ok"})
+        self.assertFalse(result.partial)
+
+    def test_failures_open_the_breaker_and_skip_the_provider(self):
+        engine = FareSearchEngine([stub("ok"), stub("down", failure_rate=1.0)], breaker_threshold=2)
+        for _ in range(2):
+            self.assertEqual(engine.search(self.query).providers["down"], "error")
+        self.assertEqual(engine.breakers["down"].state, "open")
+        result = engine.search(self.query)
+        self.assertEqual(result.providers, {"ok": "ok", "down": "circuit_open"})
+        self.assertTrue(result.partial)
+
+    def test_half_open_trial_success_closes_the_breaker(self):
+        down = stub("down", failure_rate=1.0)
+        engine = FareSearchEngine([down], breaker_threshold=1, breaker_reset=0.05)
+        self.assertEqual(engine.search(self.query).providers["down"], "error")
+        self.assertEqual(engine.search(self.query).providers["down"], "circuit_open")
+        time.sleep(0.06)
+        down.failure_rate = 0.0
+        self.assertEqual(engine.search(self.query).providers["down"], "ok")
+        self.assertEqual(engine.breakers["down"].state, "closed")
+
+    def test_one_way_search_has_no_return_legs(self):
+        query = FareQuery("JNB", "CPT", date(2026, 12, 1), date(2026, 12, 8), trip_type="oneway")
+        provider = stub("one")
+        self.assertFalse([fare for fare in provider.search(query) if fare.direction == RETURN])
+        result = FareSearchEngine([provider]).search(query)
+        self.assertTrue(result.itineraries)
+        self.assertTrue(all(i.inbound is None for i in result.itineraries))
+        self.assertTrue(all(i.as_option()["return"] is None for i in result.itineraries))
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_opens_after_threshold_failures_in_a_row(self):
+        breaker = CircuitBreaker(threshold=3, reset_after=60)
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "closed")
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+
+    def test_half_open_lets_one_trial_through(self):
+        breaker = CircuitBreaker(threshold=1, reset_after=0.05)
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, "half_open")
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+        self.assertTrue(breaker.allow())
+        self.assertTrue(breaker.allow())
+
+    def test_failed_trial_reopens(self):
+        breaker = CircuitBreaker(threshold=3, reset_after=0.05)
+        for _ in range(3):
+            breaker.record_failure()
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+
+
+class FakeFetch:
+    """Stands in for the fare engine; ``gate`` can hold calls until released."""
+
+    def __init__(self, partial=False):
+        self.calls = 0
+        self.partial = partial
+        self.gate = threading.Event()
+        self.gate.set()
+        self.started = threading.Event()
+        self._lock = threading.Lock()
+
+    def __call__(self, query):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        self.started.set()
+        self.gate.wait(5)
+        providers = {"a": "ok", "b": "timeout" if self.partial else "ok"}
+        return SearchResult(itineraries=[f"itinerary {call}"], providers=providers)
+
+
+class SearchCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.query = FareQuery("JNB", "CPT", date(2026, 12, 1), date(2026, 12, 8))
+        self.fetch = FakeFetch()
+
+    def make_cache(self, **kwargs):
+        cache = SearchCache(self.fetch, backend=LocMemCache("search-cache-tests", {}), **kwargs)
+        cache.backend.clear()
+        self.addCleanup(cache._executor.shutdown)
+        return cache
+
+    def wait_for_refreshes(self, cache):
+        cache._executor.shutdown(wait=True)
+
+    def test_hit(self):
+        cache = self.make_cache(fresh_seconds=60)
+        first, status = cache.search(self.query)
+        self.assertEqual(status, MISS)
+        again, status = cache.search(self.query)
+        self.assertEqual(status, HIT)
+        self.assertEqual(again.itineraries, first.itineraries)
+        self.assertEqual(self.fetch.calls, 1)
+        self.assertEqual(cache.stats()["hit_ratio"], 0.5)
+
+    def test_stale_is_served_while_one_refresh_runs(self):
+        cache = self.make_cache(fresh_seconds=0, stale_seconds=60)
+        cache.search(self.query)
+        self.fetch.gate.clear()
+        statuses = [cache.search(self.query) for _ in range(3)]
+        self.assertEqual([status for _, status in statuses], [STALE] * 3)
+        self.assertTrue(all(result.itineraries == ["itinerary 1"] for result, _ in statuses))
+        self.fetch.gate.set()
+        self.wait_for_refreshes(cache)
+        self.assertEqual(self.fetch.calls, 2)
+        self.assertEqual(cache.stats()["refreshes"], 1)
+        entry = cache.backend.get(search_cache.search_key(self.query))
+        self.assertEqual(entry["result"].itineraries, ["itinerary 2"])
+
+    def test_concurrent_misses_share_one_fetch(self):
+        cache = self.make_cache()
+        self.fetch.gate.clear()
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(cache.search(self.query))) for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        self.assertTrue(self.fetch.started.wait(5))
+        deadline = time.monotonic() + 5
+        while cache.stats()[COALESCED] < 4 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.fetch.gate.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(self.fetch.calls, 1)
+        self.assertEqual(sorted(status for _, status in results), [COALESCED] * 4 + [MISS])
+        self.assertEqual({tuple(result.itineraries) for result, _ in results}, {("itinerary 1",)})
+
+    def test_partial_results_are_fresh_for_less_time(self):
+        cache = self.make_cache(fresh_seconds=120, stale_seconds=60)
+        self.fetch.partial = True
+        cache.search(self.query)
+        entry = cache.backend.get(search_cache.search_key(self.query))
+        self.assertEqual(entry["fresh_for"], search_cache.PARTIAL_FRESH_SECONDS)
+
+        later = FareQuery("JNB", "CPT", date(2026, 12, 2))
+        with mock.patch.object(search_cache, "PARTIAL_FRESH_SECONDS", 0):
+            cache.search(later)
+            _, status = cache.search(later)
+        self.assertEqual(status, STALE)
+
+    def test_partial_refresh_keeps_complete_entry(self):
+        cache = self.make_cache(fresh_seconds=0, stale_seconds=60)
+        cache.search(self.query)
+        self.fetch.partial = True
+        _, status = cache.search(self.query)
+        self.assertEqual(status, STALE)
+        self.wait_for_refreshes(cache)
+        self.assertEqual(self.fetch.calls, 2)
+        entry = cache.backend.get(search_cache.search_key(self.query))
+        self.assertFalse(entry["result"].partial)
+        self.assertEqual(entry["result"].itineraries, ["itinerary 1"])
+
+
+AIRPORTS = [
+    {"code": "CGH", "city": "São Paulo", "name": "Congonhas Airport", "country": "Brazil",
+     "size": Airport.Size.MEDIUM},
+    {"code": "GRU", "city": "São Paulo", "name": "Guarulhos International Airport", "country": "Brazil",
+     "size": Airport.Size.LARGE},
+    {"code": "ZRH", "city": "Zürich", "name": "Zürich Airport", "country": "Switzerland",
+     "size": Airport.Size.LARGE},
+    {"code": "CPT", "city": "Cape Town", "name": "Cape Town International Airport", "country": "South Africa",
+     "size": Airport.Size.LARGE},
+    {"code": "CAP", "city": "Cap-Haïtien", "name": "Cap-Haïtien International Airport", "country": "Haiti",
+     "size": Airport.Size.MEDIUM},
+    {"code": "JNB", "city": "Johannesburg", "name": "O. R. Tambo International Airport",
+     "country": "South Africa", "size": Airport.Size.LARGE},
+]
+
+
+def codes(results):
+    return [airport["code"] for airport in results]
+
+
+class AirportIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = AirportIndex(AIRPORTS)
+
+    def test_accents_are_folded(self):
+        self.assertEqual(codes(self.index.search("sao"))[0], "GRU")
+        self.assertEqual(codes(self.index.search("zur")), ["ZRH"])
+        self.assertEqual(codes(self.index.search("ZÜRICH")), ["ZRH"])
+
+    def test_exact_code_ranks_above_city_prefix(self):
+        self.assertEqual(codes(self.index.search("cap")), ["CAP", "CPT"])
+        self.assertEqual(codes(self.index.search("cpt")), ["CPT"])
+
+    def test_large_before_medium(self):
+        self.assertEqual(codes(self.index.search("sao paulo")), ["GRU", "CGH"])
+
+    def test_every_word_must_match(self):
+        self.assertEqual(codes(self.index.search("international south")), ["CPT", "JNB"])
+        self.assertEqual(self.index.search("cape brazil"), [])
+        self.assertEqual(self.index.search("  -- "), [])
+
+    def test_limit_and_memo(self):
+        self.assertEqual(codes(self.index.search("international", limit=2)), ["CPT", "JNB"])
+        first = self.index.search("sao")
+        self.assertIs(self.index.search("São"), first)
+        self.assertIsNot(self.index.search("sao", limit=1), first)
+
+
+class AirportLookupTests(TestCase):
+    def setUp(self):
+        for airport in AIRPORTS:
+            Airport.objects.create(
+                iata_code=airport["code"], city=airport["city"], name=airport["name"],
+                country=airport["country"], size=airport["size"],
+            )
+        patcher = mock.patch.multiple(airports, _index=None, _fingerprint_value=None, _checked_at=float("-inf"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_index_rebuilds_when_airports_change(self):
+        self.assertEqual(codes(airports.search_airports("dur")), [])
+        Airport.objects.create(
+            iata_code="DUR", city="Durban", name="King Shaka International Airport",
+            country="South Africa", size=Airport.Size.LARGE,
+        )
+        # Within CHECK_SECONDS the built index is reused as it is
+        self.assertEqual(codes(airports.search_airports("dur")), [])
+        airports.invalidate()
+        self.assertEqual(codes(airports.search_airports("dur")), ["DUR"])
+
+        durban = Airport.objects.get(iata_code="DUR")
+        durban.is_active = False
+        durban.save()
+        airports.invalidate()
+        self.assertEqual(codes(airports.search_airports("dur")), [])
+
+    def test_unchanged_airports_keep_the_index(self):
+        index = airports.get_index()
+        airports.invalidate()
+        self.assertIs(airports.get_index(), index)
+
+    def test_search_endpoint_is_cacheable(self):
+        response = self.client.get(reverse("booking:airport_search"), {"q": "cap"})
+        self.assertEqual(codes(response.json()), ["CAP", "CPT"])
+        self.assertIn("public", response["Cache-Control"])
+        self.assertIn(f"max-age={AIRPORT_SEARCH_MAX_AGE}", response["Cache-Control"])
+        self.assertEqual(self.client.get(reverse("booking:airport_search")).json(), [])
+
+
+class LoadAirportsTests(TestCase):
+    ROWS = [
+        ("JNB", "large_airport", "O. R. Tambo International Airport", "Johannesburg", "ZA"),
+        ("JNB", "small_airport", "Duplicate JNB", "Johannesburg", "ZA"),
+        ("CPT", "small_airport", "Cape Town Heliport", "Cape Town", "ZA"),
+        ("CPT", "large_airport", "Cape Town International Airport", "Cape Town", "ZA"),
+        ("", "small_airport", "No Code Field", "Nowhere", "ZA"),
+        ("DUR", "small_airport", "King Shaka International Airport", "Durban", "ZA"),
+        ("PLZ", "small_airport", "Gqeberha Strip", "Gqeberha", "ZA"),
+        ("PLZ", "large_airport", "Port Elizabeth Airport", "Port Elizabeth", "ZA"),
+        ("ZRH", "medium_airport", "Zürich Airport", "Zürich", "CH"),
+    ]
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix=".csv")
+        self.addCleanup(os.remove, self.path)
+        with os.fdopen(handle, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["iata_code", "type", "name", "municipality", "iso_country"])
+            writer.writerows(self.ROWS)
+        # Loaded before sizes were recorded
+        Airport.objects.create(
+            iata_code="DUR", name="King Shaka International Airport", city="Durban", country="South Africa",
+        )
+        Airport.objects.create(
+            iata_code="PLZ", name="Port Elizabeth Airport", city="Port Elizabeth", country="South Africa",
+            size=Airport.Size.LARGE,
+        )
+
+    def load(self, *args):
+        out = io.StringIO()
+        call_command("load_airports", "--path", self.path, *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_reports_without_writing(self):
+        output = self.load("--dry-run")
+        self.assertIn("Would have: Inserted 3, updated 1, unchanged 1, skipped 4 rows", output)
+        self.assertIn("+ JNB  Johannesburg - O. R. Tambo International Airport (South Africa)", output)
+        self.assertIn("~ DUR  size: 'other' -> 'small_airport'", output)
+        self.assertEqual(Airport.objects.count(), 2)
+
+    def test_load_resolves_duplicates_and_upserts_in_chunks(self):
+        output = self.load("--chunk-size", "2")
+        self.assertIn("Inserted 3, updated 1, unchanged 1, skipped 4 rows", output)
+        airports_by_code = {airport.iata_code: airport for airport in Airport.objects.all()}
+        self.assertEqual(sorted(airports_by_code), ["CPT", "DUR", "JNB", "PLZ", "ZRH"])
+        self.assertEqual(airports_by_code["CPT"].name, "Cape Town International Airport")
+        self.assertEqual(airports_by_code["CPT"].size, Airport.Size.LARGE)
+        self.assertEqual(airports_by_code["JNB"].name, "O. R. Tambo International Airport")
+        self.assertEqual(airports_by_code["DUR"].size, Airport.Size.SMALL)
+        self.assertEqual(airports_by_code["PLZ"].city, "Port Elizabeth")
+        self.assertEqual(airports_by_code["ZRH"].country, "Switzerland")
+
+        self.assertIn("Inserted 0, updated 0, unchanged 4, skipped 5 rows", self.load())
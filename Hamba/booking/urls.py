@@ -6,6 +6,7 @@ app_name = 'booking'
 urlpatterns = [
     path('', views.home, name='home'),
     path('search/', views.search_results, name='search_results'),
+    path('search/cache-stats/', views.search_cache_stats, name='search_cache_stats'),
     path('booking/summary/', views.booking_summary, name='booking_summary'),
     path('booking/travelers/', views.traveler_details, name='traveler_details'),
     path('booking/payer/', views.payer_details, name='payer_details'),
@@ -4,11 +4,15 @@ from datetime import date, datetime
 from decimal import Decimal
 
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
 from django.db import transaction
 from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils.cache import patch_cache_control
 from django.views.decorators.http import require_GET
 
+from .airports import search_airports
+from .fares import FareQuery
 from .forms import (
     ExtrasForm,
     FlightSearchForm,
@@ -24,6 +28,10 @@ from .models import (
     Payment,
     Traveler,
 )
+from .search_cache import get_search_cache
+
+
+AIRPORT_SEARCH_MAX_AGE = 60 * 60
 
 
 def generate_booking_reference():
@@ -45,6 +53,7 @@ def home(request):
             if search_params.get("return_date"):
                 search_params["return_date"] = search_params["return_date"].isoformat()
             request.session["search_params"] = search_params
+            request.session.pop("trip_options", None)
             return redirect("booking:search_results")
     else:
         form = FlightSearchForm()
@@ -52,16 +61,40 @@ def home(request):
     return render(request, "booking/home.html", {"form": form})
 
 
+def _serialize_leg(leg):
+    return {**leg, "price": str(leg["price"]), "taxes": str(leg["taxes"])}
+
+
+def _serialize_option(option):
+    return {
+        "outbound": _serialize_leg(option["outbound"]),
+        "return": _serialize_leg(option["return"]) if option["return"] else None,
+        "total_base": str(option["total_base"]),
+        "total_taxes": str(option["total_taxes"]),
+        "total_price": str(option["total_price"]),
+    }
+
+
+def _deserialize_option(option):
+    def leg(data):
+        return {**data, "price": Decimal(data["price"]), "taxes": Decimal(data["taxes"])} if data else None
+
+    return {
+        "outbound": leg(option["outbound"]),
+        "return": leg(option["return"]),
+        "total_base": Decimal(option["total_base"]),
+        "total_taxes": Decimal(option["total_taxes"]),
+        "total_price": Decimal(option["total_price"]),
+    }
+
+
 def search_results(request):
-    """Display flight options (mock data) sorted by price; POST = select option and continue."""
+    """Display flight options from the fare providers sorted by price; POST = select option and continue."""
     search_params = request.session.get("search_params", {})
     if not search_params:
         messages.error(request, "Please search for flights first.")
         return redirect("booking:home")
 
-    origin = search_params.get("origin", "JNB")
-    destination = search_params.get("destination", "DUR")
-
     # Format dates for display
     display_params = search_params.copy()
     for key in ("departure_date", "return_date"):
@@ -72,44 +105,19 @@ def search_results(request):
             except (ValueError, TypeError):
                 pass
 
-    # Mock trip options (outbound + return, sorted by total price)
-    outbound_options = [
-        {"airline": "LIFT", "flight_number": "GE201", "departure_time": "06:00", "arrival_time": "07:05", "price": Decimal("899.00"), "taxes": Decimal("423.00"), "cabin": "Economy"},
-        {"airline": "South African Airways", "flight_number": "SA102", "departure_time": "08:30", "arrival_time": "09:35", "price": Decimal("1097.00"), "taxes": Decimal("523.00"), "cabin": "Economy"},
-        {"airline": "CemAir", "flight_number": "5Z201", "departure_time": "12:15", "arrival_time": "13:20", "price": Decimal("749.00"), "taxes": Decimal("380.00"), "cabin": "Economy"},
-    ]
-    return_options = [
-        {"airline": "South African Airways", "flight_number": "SA558", "departure_time": "14:40", "arrival_time": "15:50", "price": Decimal("0.00"), "taxes": Decimal("523.00"), "cabin": "Economy"},
-        {"airline": "LIFT", "flight_number": "GE202", "departure_time": "10:00", "arrival_time": "11:05", "price": Decimal("150.00"), "taxes": Decimal("423.00"), "cabin": "Economy"},
-        {"airline": "CemAir", "flight_number": "5Z202", "departure_time": "07:30", "arrival_time": "08:35", "price": Decimal("0.00"), "taxes": Decimal("380.00"), "cabin": "Economy"},
-    ]
-
-    trip_options = []
-    for i, out in enumerate(outbound_options):
-        ret = return_options[i % len(return_options)]
-        outbound = {
-            "airline": out["airline"], "flight_number": out["flight_number"],
-            "origin": origin, "destination": destination,
-            "departure_time": out["departure_time"], "arrival_time": out["arrival_time"],
-            "price": out["price"], "taxes": out["taxes"], "cabin": out["cabin"],
-        }
-        ret_flight = {
-            "airline": ret["airline"], "flight_number": ret["flight_number"],
-            "origin": destination, "destination": origin,
-            "departure_time": ret["departure_time"], "arrival_time": ret["arrival_time"],
-            "price": ret["price"], "taxes": ret["taxes"], "cabin": ret["cabin"],
-        }
-        total_base = outbound["price"] + ret_flight["price"]
-        total_taxes = outbound["taxes"] + ret_flight["taxes"]
-        trip_options.append({
-            "outbound": outbound,
-            "return": ret_flight,
-            "total_base": total_base,
-            "total_taxes": total_taxes,
-            "total_price": total_base + total_taxes,
-        })
-
-    trip_options.sort(key=lambda x: x["total_price"])
+    cache_status = "session"
+    if request.method == "POST" and request.session.get("trip_options"):
+        # Select from the options the customer was shown, not a fresh search
+        trip_options = [_deserialize_option(option) for option in request.session["trip_options"]]
+    else:
+        result, cache_status = get_search_cache().search(FareQuery.from_search_params(search_params))
+        trip_options = [itinerary.as_option() for itinerary in result.itineraries]
+        request.session["trip_options"] = [_serialize_option(option) for option in trip_options]
+        if result.partial:
+            messages.warning(request, "Some airlines didn't respond in time, so not every fare is shown.")
+        if not trip_options:
+            messages.error(request, "No flights found for this search. Please try again.")
+            return redirect("booking:home")
 
     if request.method == "POST":
         try:
@@ -119,15 +127,9 @@ def search_results(request):
         if idx < 0 or idx >= len(trip_options):
             idx = 0
         option = trip_options[idx]
-        flights = [option["outbound"], option["return"]]
-        serialized = []
-        for f in flights:
-            serialized.append({
-                **f,
-                "price": str(f["price"]),
-                "taxes": str(f["taxes"]),
-            })
-        request.session["selected_flights"] = serialized
+        flights = [option["outbound"]] + ([option["return"]] if option["return"] else [])
+        request.session["selected_flights"] = [_serialize_leg(f) for f in flights]
+        request.session.pop("trip_options", None)
         request.session["booking_totals"] = {
             "base_fare": str(option["total_base"]),
             "taxes": str(option["total_taxes"]),
@@ -136,10 +138,12 @@ def search_results(request):
         }
         return redirect("booking:booking_summary")
 
-    return render(request, "booking/search_results.html", {
+    response = render(request, "booking/search_results.html", {
         "trip_options": trip_options,
         "search_params": display_params,
     })
+    response["X-Search-Cache"] = cache_status
+    return response
 
 
 def booking_summary(request):
@@ -472,7 +476,7 @@ def process_payment(request):
             provider_reference=f"TXN{''.join(random.choices(string.digits, k=10))}",
         )
 
-        for key in ["selected_flights", "travelers", "payer", "payment_method", "selected_extras", "booking_totals", "search_params"]:
+        for key in ["selected_flights", "travelers", "payer", "payment_method", "selected_extras", "booking_totals", "search_params", "trip_options"]:
             request.session.pop(key, None)
 
         return redirect("booking:confirmation", booking_ref=booking.reference)
@@ -490,27 +494,17 @@ def confirmation(request, booking_ref):
 
 @require_GET
 def airport_search(request):
-    """JSON endpoint for airport autocomplete."""
-    from django.db.models import Q
-    from .models import Airport
-
+    """JSON endpoint for airport autocomplete, served from the in-memory index."""
     query = (request.GET.get("q") or "").strip()
-    if not query:
-        return JsonResponse([], safe=False)
-
-    q = query.lower()
-    airports = (
-        Airport.objects.filter(is_active=True)
-        .filter(
-            Q(iata_code__icontains=q)
-            | Q(city__icontains=q)
-            | Q(name__icontains=q)
-            | Q(country__icontains=q)
-        )
-        .order_by("city", "name")[:10]
-    )
-    data = [
-        {"code": a.iata_code, "city": a.city, "name": a.name, "country": a.country}
-        for a in airports
-    ]
-    return JsonResponse(data, safe=False)
+    data = search_airports(query) if query else []
+    response = JsonResponse(data, safe=False)
+    # The same prefix comes back as the user types and deletes; let the browser reuse it
+    patch_cache_control(response, public=True, max_age=AIRPORT_SEARCH_MAX_AGE)
+    return response
+
+
+@staff_member_required
+@require_GET
+def search_cache_stats(request):
+    """Hit/miss counters for the flight search cache in this process."""
+    return JsonResponse(get_search_cache().stats())
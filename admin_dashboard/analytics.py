@@ -0,0 +1,121 @@
+"""Report time buckets served from the precomputed rollups.
+
+Daily figures come from SalesReport and hour-of-day figures from
+HourlySales, both bucketed in local time (settings.TIME_ZONE) when
+rollups.py builds them. A report therefore reads at most one row per club
+per day (or per club per hour), never the order table, and works the same
+on SQLite and PostgreSQL.
+"""
+
+import csv
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import HourlySales, ProductSales, SalesReport
+
+REPORT_RANGES = (7, 30, 90, 365)
+DEFAULT_RANGE = 30
+
+
+def parse_range(value):
+    """Days for a ``?range=`` value, falling back to the default range."""
+    try:
+        days = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_RANGE
+    return days if days in REPORT_RANGES else DEFAULT_RANGE
+
+
+def day_bounds(day):
+    """Aware [start, end) datetimes of a local calendar day."""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+    return start, end
+
+
+def report_window(days):
+    """(start, end) local dates covering the last ``days`` days, today included."""
+    end = timezone.localdate()
+    return end - timedelta(days=days - 1), end
+
+
+def _scoped(queryset, start, end, club=None):
+    queryset = queryset.filter(date__range=[start, end])
+    if club is not None:
+        queryset = queryset.filter(club=club)
+    return queryset
+
+
+def daily_sales(start, end, club=None):
+    """One entry per day in the window, zero-filled."""
+    rows = _scoped(SalesReport.objects.all(), start, end, club).values('date').annotate(
+        total_orders=Sum('total_orders'),
+        total_revenue=Sum('total_revenue'),
+    )
+    by_day = {row['date']: row for row in rows}
+    series = []
+    day = start
+    while day <= end:
+        row = by_day.get(day, {})
+        series.append({
+            'day': day,
+            'total_orders': row.get('total_orders') or 0,
+            'total_revenue': row.get('total_revenue') or Decimal('0.00'),
+        })
+        day += timedelta(days=1)
+    return series
+
+
+def hourly_distribution(start, end, club=None):
+    """Delivered orders and revenue by local hour of day, all 24 hours."""
+    rows = _scoped(HourlySales.objects.all(), start, end, club).values('hour').annotate(
+        order_count=Sum('total_orders'),
+        revenue=Sum('total_revenue'),
+    )
+    by_hour = {row['hour']: row for row in rows}
+    series = [
+        {
+            'hour': hour,
+            'order_count': by_hour.get(hour, {}).get('order_count') or 0,
+            'revenue': by_hour.get(hour, {}).get('revenue') or Decimal('0.00'),
+        }
+        for hour in range(24)
+    ]
+    busiest = max(entry['order_count'] for entry in series) or 1
+    for entry in series:
+        # Bar width relative to the busiest hour
+        entry['share'] = round(100 * entry['order_count'] / busiest)
+    return series
+
+
+def top_products(start, end, club=None, limit=20):
+    return list(
+        _scoped(ProductSales.objects.all(), start, end, club)
+        .values('product_id', 'product__name', 'club__name')
+        .annotate(quantity_sold=Sum('quantity_sold'), revenue=Sum('revenue'))
+        .order_by('-revenue')[:limit]
+    )
+
+
+class _Echo:
+    """File-like object whose write() just hands the line back to csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+CSV_HEADER = ['club', 'date', 'hour', 'orders', 'revenue']
+
+
+def hourly_csv_rows(start, end, club=None):
+    """CSV lines for the hourly histogram, streamed in chunks from the database."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_HEADER)
+    rows = _scoped(HourlySales.objects.all(), start, end, club).order_by(
+        'date', 'hour', 'club__name',
+    ).values_list('club__name', 'date', 'hour', 'total_orders', 'total_revenue')
+    for name, day, hour, orders, revenue in rows.iterator(chunk_size=2000):
+        yield writer.writerow([name, day.isoformat(), f'{hour:02d}:00', orders, revenue])
@@ -0,0 +1,135 @@
+"""Headline KPIs for the admin dashboards.
+
+Each scope (every club, or one club) has two parts.
+
+- Sales totals come from one conditional-aggregation query over
+  SalesReport. They are cached for KPI_TTL and dropped whenever the rollups
+  for that club are rewritten.
+- Today's placed orders and order value are one running cache counter
+  (the count and the cents packed into a single integer, so they are
+  bumped, evicted and seeded together). It is bumped after each order
+  commits (see signals.py), so reading it costs no query. A missing counter
+  (cache restart, eviction, first order of the day) is seeded from today's
+  live and archived orders, which is an indexed created_at range and never
+  the whole table. Seeding always goes through cache.add, so a count is
+  never written over a counter that's already there: a reader that loses
+  the add reads the counter instead, and an order that finds no counter
+  seeds it with a count that includes itself or, if someone else seeded it
+  first, bumps that counter.
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from orders.models import ArchivedOrder, Order
+from .analytics import day_bounds
+from .models import SalesReport
+
+KPI_TTL = 60
+TODAY_TTL = 60 * 60 * 48
+ALL_CLUBS = 'all'
+# Today's counter is orders * ORDER_UNIT + cents; a day's cents stay below this
+ORDER_UNIT = 10 ** 12
+
+
+def _scope(club_id):
+    return ALL_CLUBS if club_id is None else club_id
+
+
+def _headline_key(scope):
+    return f'buda:kpi:{scope}'
+
+
+def _today_key(scope, day):
+    return f'buda:kpi:today:{day.isoformat()}:{scope}'
+
+
+def headline_kpis(club=None):
+    """Delivered order count, revenue and AOV overall and for the last 7 days."""
+    scope = _scope(club.pk if club is not None else None)
+    kpis = cache.get(_headline_key(scope))
+    if kpis is not None:
+        return kpis
+
+    reports = SalesReport.objects.all()
+    if club is not None:
+        reports = reports.filter(club=club)
+    last_week = Q(date__gte=timezone.localdate() - timedelta(days=6))
+    totals = reports.aggregate(
+        orders=Sum('total_orders'),
+        revenue=Sum('total_revenue'),
+        orders_7d=Sum('total_orders', filter=last_week),
+        revenue_7d=Sum('total_revenue', filter=last_week),
+    )
+    kpis = {
+        'total_orders': totals['orders'] or 0,
+        'total_revenue': totals['revenue'] or Decimal('0.00'),
+        'week_orders': totals['orders_7d'] or 0,
+        'week_revenue': totals['revenue_7d'] or Decimal('0.00'),
+    }
+    kpis['average_order_value'] = (
+        (kpis['total_revenue'] / kpis['total_orders']).quantize(Decimal('0.01'))
+        if kpis['total_orders'] else Decimal('0.00')
+    )
+    cache.set(_headline_key(scope), kpis, KPI_TTL)
+    return kpis
+
+
+def invalidate_headline_kpis(club_ids):
+    cache.delete_many([_headline_key(ALL_CLUBS)] + [_headline_key(club_id) for club_id in club_ids])
+
+
+def _count_today(scope, day):
+    """Packed counter value for the orders placed on ``day``, from the tables."""
+    start, end = day_bounds(day)
+    count, revenue = 0, Decimal('0.00')
+    # Orders finished early in the day may already be archived
+    for model in (Order, ArchivedOrder):
+        orders = model.objects.filter(created_at__gte=start, created_at__lt=end)
+        if scope != ALL_CLUBS:
+            orders = orders.filter(club_id=scope)
+        totals = orders.aggregate(orders=Count('id'), revenue=Sum('total_amount'))
+        count += totals['orders']
+        revenue += totals['revenue'] or 0
+    return count * ORDER_UNIT + int(revenue * 100)
+
+
+def record_order_placed(order):
+    """Bump today's counters for a newly committed order."""
+    day = timezone.localdate(order.created_at)
+    delta = ORDER_UNIT + int(order.total_amount * 100)
+    for scope in (ALL_CLUBS, order.club_id):
+        key = _today_key(scope, day)
+        try:
+            cache.incr(key, delta)
+            continue
+        except ValueError:
+            pass
+        # No counter yet. This order has committed, so a fresh count includes it
+        if cache.add(key, _count_today(scope, day), TODAY_TTL):
+            continue
+        try:
+            # Seeded meanwhile by a reader or another order
+            cache.incr(key, delta)
+        except ValueError:
+            # Evicted again straight away; the next reader reseeds it
+            pass
+
+
+def today_kpis(club=None):
+    """Orders placed today (local time) and their value."""
+    scope = _scope(club.pk if club is not None else None)
+    day = timezone.localdate()
+    key = _today_key(scope, day)
+    value = cache.get(key)
+    if value is None:
+        value = _count_today(scope, day)
+        if not cache.add(key, value, TODAY_TTL):
+            # Seeded or bumped by an order meanwhile; that value is newer
+            value = cache.get(key, value)
+    count, cents = divmod(value, ORDER_UNIT)
+    return {'orders': count, 'revenue': Decimal(cents) / 100}
@@ -0,0 +1,71 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from admin_dashboard.perf import Scale, compare_reports, run_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a realistic estate into a throwaway test database, walk the scan -> cart -> checkout -> '
+        'status update flow and check query/latency budgets per view.'
+    )
+
+    def add_arguments(self, parser):
+        defaults = Scale()
+        parser.add_argument('--clubs', type=int, default=defaults.clubs)
+        parser.add_argument('--tables', type=int, default=defaults.tables_per_club, help='Tables per club.')
+        parser.add_argument('--products', type=int, default=defaults.products_per_club, help='Products per club.')
+        parser.add_argument('--orders', type=int, default=defaults.orders, help='Historical orders in total.')
+        parser.add_argument('--iterations', type=int, default=20, help='Flows to walk (default 20).')
+        parser.add_argument('-o', '--output', help='Write the JSON report here.')
+        parser.add_argument('--compare', help='Earlier JSON report to print deltas against.')
+        parser.add_argument(
+            '--no-fail', action='store_true', help="Report budget overruns but don't exit with an error.",
+        )
+
+    def handle(self, *args, **options):
+        scale = Scale(
+            clubs=options['clubs'], tables_per_club=options['tables'],
+            products_per_club=options['products'], orders=options['orders'],
+        )
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            report = run_benchmark(scale, options['iterations']).as_dict()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write(f"Seeded in {report['seed_seconds']:.1f}s")
+        self.stdout.write(f"{'view':<20}{'queries':>9}{'budget':>8}{'p50 ms':>9}{'p95 ms':>9}{'budget':>8}")
+        for name, view in report['views'].items():
+            self.stdout.write(
+                f"{name:<20}{view['queries_max']:>9}{view['budget_queries']:>8}"
+                f"{view['ms_p50']:>9.1f}{view['ms_p95']:>9.1f}{view['budget_ms']:>8}"
+            )
+
+        if options['compare']:
+            with open(options['compare']) as previous:
+                rows = compare_reports(json.load(previous), report)
+            self.stdout.write('\nChanges since the previous report:')
+            for name, queries_before, queries_after, ms_before, ms_after in rows:
+                self.stdout.write(
+                    f'{name:<20} queries {queries_before} -> {queries_after}, p95 {ms_before:.1f} -> {ms_after:.1f} ms'
+                )
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+
+        if report['failures']:
+            for failure in report['failures']:
+                self.stderr.write(
+                    f"{failure['view']}: {failure['metric']} {failure['measured']} over budget {failure['budget']}"
+                )
+            if not options['no_fail']:
+                raise CommandError(f"{len(report['failures'])} budget(s) exceeded")
+        else:
+            self.stdout.write(self.style.SUCCESS('All views within budget'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from admin_dashboard.rollups import run_rollup
+
+
+class Command(BaseCommand):
+    help = 'Fold orders changed since the last run into the daily sales rollups.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Ignore the high-water mark and rebuild every day that has orders.',
+        )
+
+    def handle(self, *args, **options):
+        days = run_rollup(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {days} club day(s)'))
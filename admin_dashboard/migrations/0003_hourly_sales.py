@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-18 03:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_dashboard', '0002_sales_rollups'),
+        ('menu', '0002_cartentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HourlySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('hour', models.PositiveSmallIntegerField()),
+                ('total_orders', models.PositiveIntegerField(default=0)),
+                ('total_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('club', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_sales', to='menu.club')),
+            ],
+            options={
+                'ordering': ['date', 'hour'],
+                'indexes': [models.Index(fields=['date', 'hour'], name='hourly_sales_date_hour')],
+                'unique_together': {('club', 'date', 'hour')},
+            },
+        ),
+    ]
@@ -32,6 +32,7 @@ class SalesReport(models.Model):
     club = models.ForeignKey(Club, on_delete=models.CASCADE, related_name='sales_reports')
     date = models.DateField()
     total_orders = models.PositiveIntegerField(default=0)
+    cancelled_orders = models.PositiveIntegerField(default=0)
     total_revenue = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     total_items_sold = models.PositiveIntegerField(default=0)
     average_order_value = models.DecimalField(max_digits=10, decimal_places=2, default=0)
@@ -60,4 +61,34 @@ class ProductSales(models.Model):
         ordering = ['-date', '-revenue']
 
     def __str__(self):
-        return f"{self.product.name} - {self.date}"
\ No newline at end of file
+        return f"{self.product.name} - {self.date}"
+
+
+class HourlySales(models.Model):
+    """Delivered orders per club per local hour, maintained by rollups.py"""
+    club = models.ForeignKey(Club, on_delete=models.CASCADE, related_name='hourly_sales')
+    date = models.DateField()
+    hour = models.PositiveSmallIntegerField()  # 0-23, local time
+    total_orders = models.PositiveIntegerField(default=0)
+    total_revenue = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ['club', 'date', 'hour']
+        ordering = ['date', 'hour']
+        indexes = [
+            # Report ranges across every club
+            models.Index(fields=['date', 'hour'], name='hourly_sales_date_hour'),
+        ]
+
+    def __str__(self):
+        return f"{self.club.name} - {self.date} {self.hour:02d}:00"
+
+
+class RollupCursor(models.Model):
+    """High-water mark for an incremental rollup (see rollups.py)"""
+    name = models.CharField(max_length=50, unique=True)
+    high_water = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.high_water}"
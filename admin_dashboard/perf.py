@@ -0,0 +1,358 @@
+"""Query-count and latency benchmark for the customer and staff flows.
+
+seed_venues() and seed_orders() bulk-load a realistic estate: several clubs
+with 100+ tables and a 300-product menu each, plus tens of thousands of
+historical orders spread over the last few months and rolled up like
+production. run_flows() then uses the test client to walk the real URLs the
+way people do:
+
+    scan (menu, menu_api) -> add to cart (sync_cart) -> checkout (GET, POST)
+    -> order_confirmation -> staff board, status updates, pick list
+    -> admin dashboard, club list, reports
+
+Every request is timed and its queries counted. The result is a plain dict
+(see FlowReport.as_dict) that can be written as JSON and compared with the
+report from an earlier release. BUDGETS gives upper bounds on queries and
+milliseconds per view. A query count that grows with the size of the data
+is an N+1, so the budgets must hold at any scale. The bench_flows command
+runs all of this inside a throwaway test database.
+"""
+
+import random
+import statistics
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from datetime import timedelta
+from decimal import Decimal
+
+import django
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Case, Value, When
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from menu.models import Category, Club, Product, Table
+from orders.models import Order, OrderItem, OrderNumberSequence
+from .kpis import today_kpis
+from .models import StaffMember
+from .rollups import run_rollup
+
+REPORT_VERSION = 1
+BATCH_SIZE = 500
+
+# view -> (max queries, max milliseconds) for any single request
+BUDGETS = {
+    'menu': (10, 250),  # first scan also creates the session
+    'menu_api': (1, 100),
+    'sync_cart': (4, 100),
+    'checkout': (4, 150),
+    'place_order': (17, 250),
+    'order_confirmation': (5, 150),
+    'staff_dashboard': (6, 400),
+    'update_status': (10, 150),
+    'pick_list': (5, 150),  # a load also reads every category's station
+    'admin_dashboard': (8, 400),
+    'club_management': (3, 250),
+    'reports': (6, 600),
+}
+
+CATEGORIES = [
+    ('Beers', 'bar'), ('Ciders', 'bar'), ('Spirits', 'bar'), ('Cocktails', 'bar'),
+    ('Soft Drinks', 'bar'), ('Shots', 'bar'), ('Wine', 'bar'), ('Food', 'kitchen'),
+]
+OPEN_STATUSES = ['received', 'in_progress', 'ready']
+
+
+@dataclass
+class Scale:
+    clubs: int = 5
+    tables_per_club: int = 120
+    products_per_club: int = 300
+    orders: int = 50_000
+    # Orders still on the staff board, per club
+    open_orders_per_club: int = 40
+    history_days: int = 90
+    seed: int = 1
+
+
+@dataclass
+class Estate:
+    clubs: list
+    tables: dict  # club id -> [Table]
+    products: dict  # club id -> [Product]
+    staff: dict  # club id -> User
+    admin: User
+
+
+def seed_venues(scale):
+    """Clubs, tables, menus and one bartender per club, all bulk-inserted."""
+    rng = random.Random(scale.seed)
+    categories = []
+    for position, (name, station) in enumerate(CATEGORIES):
+        category, _ = Category.objects.get_or_create(
+            slug=f'bench-{name.lower().replace(" ", "-")}',
+            defaults={'name': name, 'display_order': position, 'station': station},
+        )
+        categories.append(category)
+
+    first = Club.objects.filter(slug__startswith='bench-club-').count()
+    clubs = Club.objects.bulk_create([
+        Club(name=f'Bench Club {n}', slug=f'bench-club-{n}', address=f'{n} Long Street')
+        for n in range(first, first + scale.clubs)
+    ])
+
+    Table.objects.bulk_create([
+        Table(club=club, number=str(n), qr_code=f'{club.slug}_table_{n}')
+        for club in clubs for n in range(1, scale.tables_per_club + 1)
+    ], batch_size=BATCH_SIZE)
+    Product.objects.bulk_create([
+        Product(
+            club=club, category=categories[n % len(categories)], name=f'{categories[n % len(categories)].name} {n}',
+            description='House pour, served cold', price=Decimal(rng.randrange(1500, 12000)) / 100,
+            # A few items have tracked stock; the rest are unlimited
+            stock_quantity=10_000 if n % 10 == 0 else None, display_order=n,
+        )
+        for club in clubs for n in range(scale.products_per_club)
+    ], batch_size=BATCH_SIZE)
+
+    staff = {}
+    for club in clubs:
+        user = User.objects.create_user(f'{club.slug}-bartender', password=None)
+        StaffMember.objects.create(user=user, club=club, role='bartender', employee_id=f'{club.slug}-1')
+        staff[club.id] = user
+    admin = User.objects.filter(username='bench-admin').first() or User.objects.create_user(
+        'bench-admin', password=None, is_staff=True, is_superuser=True,
+    )
+
+    club_ids = [club.id for club in clubs]
+    return Estate(
+        clubs=clubs,
+        tables=_group(Table.objects.filter(club_id__in=club_ids)),
+        products=_group(Product.objects.filter(club_id__in=club_ids)),
+        staff=staff,
+        admin=admin,
+    )
+
+
+def _group(queryset):
+    grouped = {}
+    for instance in queryset:
+        grouped.setdefault(instance.club_id, []).append(instance)
+    return grouped
+
+
+def seed_orders(estate, scale, count=None):
+    """
+    Bulk-insert ``count`` orders (default ``scale.orders``) across the estate.
+
+    Most are delivered or cancelled and back-dated over ``history_days``;
+    the newest ``open_orders_per_club`` of each club stay open for the staff
+    board. The order number sequences and sales rollups are brought up to
+    date, as if the orders had come in one by one.
+    """
+    count = scale.orders if count is None else count
+    rng = random.Random(scale.seed + count)
+    now = timezone.now()
+    numbers = dict(OrderNumberSequence.objects.filter(club__in=estate.clubs).values_list('club_id', 'last_number'))
+
+    orders, lines = [], []
+    open_left = {club.id: scale.open_orders_per_club for club in estate.clubs}
+    for n in reversed(range(count)):
+        club = estate.clubs[n % len(estate.clubs)]
+        number = numbers[club.id] = numbers.get(club.id, 0) + 1
+        if open_left[club.id]:
+            open_left[club.id] -= 1
+            status = rng.choice(OPEN_STATUSES)
+        else:
+            status = 'cancelled' if rng.random() < 0.04 else 'delivered'
+        items = [(product, rng.randint(1, 4)) for product in rng.sample(estate.products[club.id], rng.randint(1, 3))]
+        subtotal = sum((product.price * quantity for product, quantity in items), Decimal('0.00'))
+        orders.append(Order(
+            club=club, table=rng.choice(estate.tables[club.id]), order_number=Order.format_order_number(club, number),
+            status=status, payment_method='pay_at_table', subtotal=subtotal, total_amount=subtotal,
+        ))
+        lines.append(items)
+
+    for chunk in range(0, len(orders), BATCH_SIZE):
+        Order.objects.bulk_create(orders[chunk:chunk + BATCH_SIZE])
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, product=product, quantity=quantity, unit_price=product.price,
+                  total_price=product.price * quantity)
+        for order, items in zip(orders, lines) for product, quantity in items
+    ], batch_size=BATCH_SIZE)
+
+    # bulk_create stamps auto_now(_add) fields with now: back-date the history
+    # in buckets, a few hundred rows per UPDATE
+    history = [order.pk for order in orders if order.status not in OPEN_STATUSES]
+    buckets = scale.history_days * 4
+    for bucket in range(buckets):
+        moment = now - timedelta(days=bucket // 4 + 1, hours=(bucket % 4) * 2 + 18)
+        ids = history[bucket::buckets]
+        for chunk in range(0, len(ids), BATCH_SIZE):
+            Order.objects.filter(pk__in=ids[chunk:chunk + BATCH_SIZE]).update(
+                created_at=moment, updated_at=moment,
+                delivered_at=Case(When(status='delivered', then=Value(moment + timedelta(minutes=12)))),
+            )
+
+    for club_id, number in numbers.items():
+        OrderNumberSequence.objects.update_or_create(club_id=club_id, defaults={'last_number': number})
+    run_rollup(full=True)
+    return len(orders)
+
+
+@dataclass
+class ViewSamples:
+    queries: list = field(default_factory=list)
+    milliseconds: list = field(default_factory=list)
+
+
+@dataclass
+class FlowReport:
+    scale: Scale
+    iterations: int
+    seed_seconds: float = 0.0
+    views: dict = field(default_factory=dict)  # name -> ViewSamples
+
+    def record(self, name, queries, milliseconds):
+        samples = self.views.setdefault(name, ViewSamples())
+        samples.queries.append(queries)
+        samples.milliseconds.append(milliseconds)
+
+    def failures(self, check_time=True):
+        """``[(view, 'queries'|'ms', measured, budget)]`` for every budget exceeded."""
+        failures = []
+        for name, summary in self.summary().items():
+            max_queries, max_ms = BUDGETS[name]
+            if summary['queries_max'] > max_queries:
+                failures.append((name, 'queries', summary['queries_max'], max_queries))
+            if check_time and summary['ms_p95'] > max_ms:
+                failures.append((name, 'ms', summary['ms_p95'], max_ms))
+        return failures
+
+    def summary(self):
+        summary = {}
+        for name, samples in self.views.items():
+            timings = sorted(samples.milliseconds)
+            summary[name] = {
+                'samples': len(timings),
+                'queries_max': max(samples.queries),
+                'queries_median': statistics.median(samples.queries),
+                'ms_p50': round(statistics.median(timings), 2),
+                'ms_p95': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+                'ms_max': round(timings[-1], 2),
+                'budget_queries': BUDGETS[name][0],
+                'budget_ms': BUDGETS[name][1],
+            }
+        return summary
+
+    def as_dict(self):
+        failures = self.failures()
+        return {
+            'report_version': REPORT_VERSION,
+            'generated_at': timezone.now().isoformat(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'scale': asdict(self.scale),
+            'iterations': self.iterations,
+            'seed_seconds': round(self.seed_seconds, 2),
+            'views': self.summary(),
+            'failures': [
+                {'view': name, 'metric': metric, 'measured': measured, 'budget': budget}
+                for name, metric, measured, budget in failures
+            ],
+            'passed': not failures,
+        }
+
+
+def compare_reports(previous, current):
+    """``[(view, queries before, after, p95 ms before, after)]`` for views in both reports."""
+    rows = []
+    for name, now in current['views'].items():
+        before = previous.get('views', {}).get(name)
+        if before is not None:
+            rows.append((name, before['queries_max'], now['queries_max'], before['ms_p95'], now['ms_p95']))
+    return rows
+
+
+def run_flows(estate, scale, iterations=20, report=None):
+    """Walk scan -> cart -> checkout -> staff -> admin ``iterations`` times, measuring each request."""
+    report = report or FlowReport(scale=scale, iterations=iterations)
+    rng = random.Random(scale.seed)
+    # Today's counters are seeded once a day in production; don't bill that to the first checkout
+    today_kpis()
+    for club in estate.clubs:
+        today_kpis(club)
+    staff_clients = {}
+    admin = Client()
+    admin.force_login(estate.admin)
+
+    def measure(name, send, expected=(200,)):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = send()
+            elapsed = (time.perf_counter() - start) * 1000
+        if response.status_code not in expected:
+            raise AssertionError(f'{name} returned {response.status_code}')
+        report.record(name, len(queries), elapsed)
+        return response
+
+    for _ in range(iterations):
+        club = rng.choice(estate.clubs)
+        table = rng.choice(estate.tables[club.id])
+        products = rng.sample([p for p in estate.products[club.id] if p.stock_quantity is None], 3)
+        customer = Client()
+
+        # Scan: the page, then the JSON menu the page script fetches
+        measure('menu', lambda: customer.get(reverse('menu:menu', args=[club.slug, table.number])))
+        measure('menu_api', lambda: customer.get(reverse('menu:menu_api', args=[club.slug])))
+
+        # Taps on "Add", batched into one sync by the page
+        operations = [{'op': 'add', 'product_id': product.id, 'quantity': 1} for product in products]
+        measure('sync_cart', lambda: customer.post(
+            reverse('menu:sync_cart'), {'operations': operations, 'club_slug': club.slug},
+            content_type='application/json',
+        ))
+
+        checkout_url = reverse('menu:checkout', args=[club.slug, table.number])
+        measure('checkout', lambda: customer.get(checkout_url))
+        response = measure('place_order', lambda: customer.post(checkout_url, {
+            'payment_method': 'pay_at_table', 'idempotency_key': uuid.uuid4().hex,
+        }), expected=(302,))
+        measure('order_confirmation', lambda: customer.get(response['Location']))
+        order_id = int(response['Location'].rstrip('/').split('/')[-2])
+
+        # The bar sees it, works it and marks it ready
+        staff = staff_clients.get(club.id)
+        if staff is None:
+            staff = staff_clients[club.id] = Client()
+            staff.force_login(estate.staff[club.id])
+        measure('staff_dashboard', lambda: staff.get(reverse('staff:dashboard')))
+        status_url = reverse('staff:update_order_status', args=[order_id])
+        for previous, status in [('received', 'in_progress'), ('in_progress', 'ready')]:
+            measure('update_status', lambda: staff.post(
+                status_url, {'status': status, 'from': previous}, content_type='application/json',
+            ))
+        measure('pick_list', lambda: staff.get(reverse('staff:pick_list_data')))
+
+        # Owners checking in
+        measure('admin_dashboard', lambda: admin.get(reverse('admin_dashboard:dashboard')))
+        measure('club_management', lambda: admin.get(reverse('admin_dashboard:club_management')))
+        measure('reports', lambda: admin.get(reverse('admin_dashboard:reports')))
+
+    return report
+
+
+def run_benchmark(scale, iterations=20):
+    """Seed ``scale`` into the current database and run the flows; returns a FlowReport."""
+    cache.clear()
+    start = time.perf_counter()
+    estate = seed_venues(scale)
+    seed_orders(estate, scale)
+    report = FlowReport(scale=scale, iterations=iterations, seed_seconds=time.perf_counter() - start)
+    cache.clear()
+    return run_flows(estate, scale, iterations, report)
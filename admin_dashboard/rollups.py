@@ -0,0 +1,247 @@
+"""Incremental sales rollups into SalesReport, ProductSales and HourlySales.
+
+A run reads orders changed since the stored high-water mark. It works out
+which (club, day) pairs those orders belong to, then recomputes only those
+days from the live and archived order tables. Recomputing whole days keeps runs idempotent. An
+order that is delivered, cancelled or reopened after it was rolled up is
+simply counted again with its current status. Days are the local date
+(settings.TIME_ZONE) of the order's created_at. Only delivered orders count
+as sales, and cancelled orders are counted separately.
+
+Run it with ``manage.py rollup_sales``, e.g. from cron every few minutes.
+An order that is delivered, cancelled or reopened also has its own day
+queued for a background recompute after commit (schedule_rollup, see
+signals.py), so the staff request never runs the aggregates itself. Set
+BUDA_ROLLUP_ASYNC = False to recompute inline instead (tests).
+"""
+
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import TruncDate, TruncHour
+from django.utils import timezone
+
+from orders.models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+from .analytics import day_bounds
+from .kpis import invalidate_headline_kpis
+from .models import HourlySales, ProductSales, RollupCursor, SalesReport
+
+CURSOR_NAME = 'sales'
+ROLLUP_STATUSES = ('delivered', 'cancelled')
+# Rescan a little before the mark so writes that committed late aren't missed
+OVERLAP = timedelta(minutes=5)
+DAYS_PER_CHUNK = 50
+ORDER_SOURCES = ((Order, OrderItem), (ArchivedOrder, ArchivedOrderItem))
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sales-rollup')
+_pending = set()  # (club_id, day) waiting for the background worker
+_pending_lock = threading.Lock()
+
+
+def _days_filter(days, prefix=''):
+    window = Q()
+    for club_id, day in days:
+        start, end = day_bounds(day)
+        window |= Q(**{
+            f'{prefix}club_id': club_id,
+            f'{prefix}created_at__gte': start,
+            f'{prefix}created_at__lt': end,
+        })
+    return window
+
+
+def rollup_days(days):
+    """
+    Recompute SalesReport, ProductSales and HourlySales for (club_id, date) pairs.
+
+    Runs three aggregate queries per order table (live and archive) per
+    chunk of days, whatever the number of orders, and replaces each day's
+    rows in one transaction.
+    """
+    days = sorted(set(days))
+    for i in range(0, len(days), DAYS_PER_CHUNK):
+        _rollup_chunk(days[i:i + DAYS_PER_CHUNK])
+    return len(days)
+
+
+def _rollup_chunk(days):
+    delivered = Q(status='delivered')
+    totals = defaultdict(lambda: [0, 0, Decimal('0.00')])  # delivered, cancelled, revenue
+    hours = defaultdict(lambda: [0, Decimal('0.00')])  # (club, date, hour) -> orders, revenue
+    products = defaultdict(lambda: [0, Decimal('0.00')])  # (club, date, product) -> quantity, revenue
+
+    # Live and archived orders are summed, so archiving never changes a day
+    for order_model, item_model in ORDER_SOURCES:
+        orders = (
+            order_model.objects.filter(_days_filter(days))
+            .annotate(day=TruncDate('created_at'))
+            .values('club_id', 'day')
+            .annotate(
+                delivered_count=Count('id', filter=delivered),
+                cancelled_count=Count('id', filter=Q(status='cancelled')),
+                revenue=Sum('total_amount', filter=delivered),
+            )
+        )
+        for row in orders:
+            total = totals[(row['club_id'], row['day'])]
+            total[0] += row['delivered_count']
+            total[1] += row['cancelled_count']
+            total[2] += row['revenue'] or 0
+
+        order_hours = (
+            order_model.objects.filter(_days_filter(days), delivered)
+            .annotate(bucket=TruncHour('created_at'))
+            .values('club_id', 'bucket')
+            .annotate(count=Count('id'), revenue=Sum('total_amount'))
+        )
+        for row in order_hours:
+            bucket = timezone.localtime(row['bucket'])
+            hour = hours[(row['club_id'], bucket.date(), bucket.hour)]
+            hour[0] += row['count']
+            hour[1] += row['revenue']
+
+        items = (
+            item_model.objects.filter(_days_filter(days, 'order__'), order__status='delivered')
+            .annotate(day=TruncDate('order__created_at'))
+            .values('order__club_id', 'day', 'product_id')
+            .annotate(quantity=Sum('quantity'), revenue=Sum('total_price'))
+        )
+        for row in items:
+            product = products[(row['order__club_id'], row['day'], row['product_id'])]
+            product[0] += row['quantity']
+            product[1] += row['revenue']
+
+    peak = {}
+    hour_rows = []
+    for (club_id, day, hour), (count, revenue) in hours.items():
+        hour_rows.append(HourlySales(
+            club_id=club_id, date=day, hour=hour, total_orders=count, total_revenue=revenue,
+        ))
+        best = peak.get((club_id, day))
+        if best is None or (count, -hour) > (best[1], -best[0]):
+            peak[(club_id, day)] = (hour, count)
+
+    items_sold = defaultdict(int)
+    product_rows = []
+    for (club_id, day, product_id), (quantity, revenue) in products.items():
+        items_sold[(club_id, day)] += quantity
+        product_rows.append(ProductSales(
+            club_id=club_id, product_id=product_id, date=day, quantity_sold=quantity, revenue=revenue,
+        ))
+
+    reports = []
+    for key in days:
+        count, cancelled, revenue = totals[key]
+        hour = peak.get(key)
+        reports.append(SalesReport(
+            club_id=key[0],
+            date=key[1],
+            total_orders=count,
+            cancelled_orders=cancelled,
+            total_revenue=revenue,
+            total_items_sold=items_sold[key],
+            average_order_value=(revenue / count).quantize(Decimal('0.01')) if count else Decimal('0.00'),
+            peak_hour=time(hour[0]) if hour else None,
+        ))
+
+    day_rows = Q()
+    for club_id, day in days:
+        day_rows |= Q(club_id=club_id, date=day)
+
+    with transaction.atomic():
+        SalesReport.objects.bulk_create(
+            reports,
+            update_conflicts=True,
+            unique_fields=['club', 'date'],
+            update_fields=[
+                'total_orders', 'cancelled_orders', 'total_revenue',
+                'total_items_sold', 'average_order_value', 'peak_hour',
+            ],
+        )
+        # Products and hours can drop out of a day (e.g. their only order was cancelled)
+        ProductSales.objects.filter(day_rows).delete()
+        ProductSales.objects.bulk_create(product_rows)
+        HourlySales.objects.filter(day_rows).delete()
+        HourlySales.objects.bulk_create(hour_rows)
+        club_ids = {club_id for club_id, _ in days}
+        transaction.on_commit(lambda: invalidate_headline_kpis(club_ids))
+
+
+def run_rollup(full=False):
+    """
+    Fold orders changed since the high-water mark into the rollups.
+
+    ``full`` ignores the mark and rebuilds every day that has orders.
+    Returns the number of (club, day) pairs recomputed.
+    """
+    cursor, _ = RollupCursor.objects.get_or_create(name=CURSOR_NAME)
+    changed = Order.objects.all()
+    if cursor.high_water is not None and not full:
+        changed = changed.filter(updated_at__gte=cursor.high_water - OVERLAP)
+
+    touched = (
+        changed.annotate(day=TruncDate('created_at'))
+        .values('club_id', 'day')
+        .annotate(last_update=Max('updated_at'))
+    )
+    days = []
+    high_water = cursor.high_water
+    for row in touched:
+        days.append((row['club_id'], row['day']))
+        if high_water is None or row['last_update'] > high_water:
+            high_water = row['last_update']
+
+    count = rollup_days(days)
+    if high_water != cursor.high_water:
+        # Never move the mark backwards if another run got further
+        RollupCursor.objects.filter(
+            Q(high_water__isnull=True) | Q(high_water__lt=high_water), pk=cursor.pk,
+        ).update(high_water=high_water, updated_at=timezone.now())
+    return count
+
+
+def rollup_order_day(order):
+    """Recompute the day an order belongs to."""
+    return rollup_days([(order.club_id, timezone.localdate(order.created_at))])
+
+
+def _rollup_pending():
+    close_old_connections()
+    try:
+        with _pending_lock:
+            days = list(_pending)
+            _pending.clear()
+        if days:
+            rollup_days(days)
+    finally:
+        close_old_connections()
+
+
+def schedule_rollup(order):
+    """
+    Recompute the order's day after the current transaction commits.
+
+    The work goes to a single background worker, and a day that is already
+    waiting isn't queued again, so a burst of status changes costs one
+    recompute. If the process dies first, the next rollup_sales run still
+    picks the order up from its updated_at.
+    """
+    day = (order.club_id, timezone.localdate(order.created_at))
+
+    def enqueue():
+        if not getattr(settings, 'BUDA_ROLLUP_ASYNC', True):
+            rollup_days([day])
+            return
+        with _pending_lock:
+            if day in _pending:
+                return
+            _pending.add(day)
+        _executor.submit(_rollup_pending)
+
+    transaction.on_commit(enqueue)
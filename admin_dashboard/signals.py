@@ -0,0 +1,30 @@
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from orders.models import Order
+from orders.transitions import status_changed
+from .kpis import record_order_placed
+from .rollups import ROLLUP_STATUSES, schedule_rollup
+
+
+@receiver(post_save, sender=Order)
+def count_placed_order(sender, instance, created, **kwargs):
+    if created:
+        # The order is already committed; a failed counter reseed mustn't fail checkout
+        transaction.on_commit(lambda: record_order_placed(instance), robust=True)
+
+
+@receiver(post_save, sender=Order)
+def rollup_closed_order(sender, instance, **kwargs):
+    # Keep the order's day current; rollup_sales catches everything else
+    if instance.status in ROLLUP_STATUSES:
+        schedule_rollup(instance)
+
+
+@receiver(status_changed, sender=Order)
+def rollup_status_change(sender, order, previous_status, **kwargs):
+    # Staff status updates are queryset updates, so post_save doesn't fire.
+    # Reopening a delivered or cancelled order changes its day's figures too.
+    if order.status in ROLLUP_STATUSES or previous_status in ROLLUP_STATUSES:
+        schedule_rollup(order)
@@ -10,5 +10,9 @@ urlpatterns = [
     path('clubs/<int:club_id>/menu/', views.menu_management, name='menu_management'),
     path('clubs/<int:club_id>/tables/', views.table_management, name='table_management'),
     path('clubs/<int:club_id>/qr-codes/', views.generate_qr_codes, name='qr_codes'),
+    path('clubs/<int:club_id>/qr-codes/sheet/', views.qr_code_sheet, name='qr_code_sheet'),
+    path('menu/import/', views.menu_import, name='menu_import'),
+    path('menu/export/', views.menu_export, name='menu_export'),
     path('reports/', views.reports, name='reports'),
+    path('reports/export.csv', views.reports_csv, name='reports_csv'),
 ]
@@ -1,15 +1,21 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.db.models import Sum, Count, Avg
-from django.utils import timezone
-from django.http import HttpResponse
-from datetime import datetime, timedelta
+from django.db.models import Count, Avg, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.core.files.storage import default_storage
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 import json
+import re
+import uuid
+import zipfile
 
+from menu import catalogue
 from menu.models import Club, Table, Category, Product
-from menu.utils import generate_table_qr_code
+from menu.qr import ensure_table_qr_codes, render_qr_sheet, sheet_page, sheet_page_count
 from orders.models import Order, OrderItem
+from . import analytics
+from .kpis import headline_kpis, today_kpis
 from .models import SalesReport, ProductSales
 
 
@@ -22,28 +28,27 @@ def is_admin(user):
 @user_passes_test(is_admin)
 def admin_dashboard(request):
     """Main admin dashboard"""
-    # Get basic stats
+    # Get basic stats (cached, from the daily rollups)
     total_clubs = Club.objects.filter(is_active=True).count()
-    total_orders = Order.objects.count()
-    total_revenue = Order.objects.aggregate(total=Sum('total_amount'))['total'] or 0
+    totals = headline_kpis()
     
-    # Today's stats
-    today = timezone.now().date()
-    today_orders = Order.objects.filter(created_at__date=today).count()
-    today_revenue = Order.objects.filter(created_at__date=today).aggregate(total=Sum('total_amount'))['total'] or 0
+    # Today's stats (running counters)
+    today = today_kpis()
     
     # Recent orders
     recent_orders = Order.objects.select_related('table', 'club').order_by('-created_at')[:10]
     
     # Top selling products
-    top_products = ProductSales.objects.select_related('product').order_by('-revenue')[:5]
+    top_products = _top_products(ProductSales.objects.all())
     
     context = {
         'total_clubs': total_clubs,
-        'total_orders': total_orders,
-        'total_revenue': total_revenue,
-        'today_orders': today_orders,
-        'today_revenue': today_revenue,
+        'total_orders': totals['total_orders'],
+        'total_revenue': totals['total_revenue'],
+        'week_orders': totals['week_orders'],
+        'week_revenue': totals['week_revenue'],
+        'today_orders': today['orders'],
+        'today_revenue': today['revenue'],
         'recent_orders': recent_orders,
         'top_products': top_products,
     }
@@ -51,11 +56,29 @@ def admin_dashboard(request):
     return render(request, 'admin_dashboard/dashboard.html', context)
 
 
+def _top_products(sales, limit=5):
+    # ProductSales has a row per product per day; rank products on their totals
+    return (
+        sales.values('product_id', 'product__name', 'club__name')
+        .annotate(quantity_sold=Sum('quantity_sold'), revenue=Sum('revenue'))
+        .order_by('-revenue')[:limit]
+    )
+
+
+def _count_for_club(model):
+    rows = model.objects.filter(club=OuterRef('pk')).order_by().values('club').annotate(count=Count('pk'))
+    return Coalesce(Subquery(rows.values('count')), 0)
+
+
 @login_required
 @user_passes_test(is_admin)
 def club_management(request):
     """Manage clubs"""
-    clubs = Club.objects.all().order_by('name')
+    # Per-club counts as correlated subqueries, not two queries per card
+    clubs = Club.objects.annotate(
+        table_count=_count_for_club(Table),
+        product_count=_count_for_club(Product),
+    ).order_by('name')
     
     context = {
         'clubs': clubs,
@@ -71,8 +94,8 @@ def club_detail(request, club_id):
     club = get_object_or_404(Club, id=club_id)
     
     # Get club stats
-    total_orders = Order.objects.filter(club=club).count()
-    total_revenue = Order.objects.filter(club=club).aggregate(total=Sum('total_amount'))['total'] or 0
+    totals = headline_kpis(club)
+    today = today_kpis(club)
     total_tables = Table.objects.filter(club=club).count()
     total_products = Product.objects.filter(club=club).count()
     
@@ -80,12 +103,15 @@ def club_detail(request, club_id):
     recent_orders = Order.objects.filter(club=club).select_related('table').order_by('-created_at')[:10]
     
     # Top selling products for this club
-    top_products = ProductSales.objects.filter(club=club).select_related('product').order_by('-revenue')[:5]
+    top_products = _top_products(ProductSales.objects.filter(club=club))
     
     context = {
         'club': club,
-        'total_orders': total_orders,
-        'total_revenue': total_revenue,
+        'total_orders': totals['total_orders'],
+        'total_revenue': totals['total_revenue'],
+        'average_order_value': totals['average_order_value'],
+        'today_orders': today['orders'],
+        'today_revenue': today['revenue'],
         'total_tables': total_tables,
         'total_products': total_products,
         'recent_orders': recent_orders,
@@ -112,49 +138,163 @@ def menu_management(request, club_id):
     return render(request, 'admin_dashboard/menu_management.html', context)
 
 
+IMPORT_DIRECTORY = 'imports'
+IMPORT_DIFF_LINES = 200
+
+
+def _import_paths(token, format):
+    return f'{IMPORT_DIRECTORY}/{token}/menu.{format}', f'{IMPORT_DIRECTORY}/{token}/images.zip'
+
+
+def _plan_stashed_import(token, format):
+    """Re-read an uploaded menu kept in storage between preview and apply"""
+    menu_path, images_path = _import_paths(token, format)
+    archive = zipfile.ZipFile(default_storage.open(images_path)) if default_storage.exists(images_path) else None
+    images = catalogue.ImageArchive(archive)
+    with default_storage.open(menu_path) as menu_file:
+        plan = catalogue.plan_import(catalogue.read_rows(menu_file, format), images=images)
+    return plan, images
+
+
+def _discard_stashed_import(token, format):
+    for path in _import_paths(token, format):
+        if default_storage.exists(path):
+            default_storage.delete(path)
+
+
+@login_required
+@user_passes_test(is_admin)
+def menu_import(request):
+    """
+    Bulk menu upload: a CSV/JSON file plus an optional zip of images.
+    
+    The first POST stores the upload and shows the diff; nothing changes until
+    the admin confirms, which re-plans from the stored file and applies it.
+    """
+    context = {'columns': catalogue.COLUMNS}
+    
+    if request.method == 'POST' and request.POST.get('action') == 'apply':
+        token = request.POST.get('token', '')
+        format = request.POST.get('format', '')
+        if not re.fullmatch(r'[0-9a-f]{32}', token) or format not in ('csv', 'json', 'jsonl'):
+            messages.error(request, 'That upload has expired; please upload the file again.')
+            return redirect('admin_dashboard:menu_import')
+        try:
+            plan, images = _plan_stashed_import(token, format)
+            if plan.errors:
+                raise catalogue.CatalogueError(f'{len(plan.errors)} row(s) have errors')
+            summary = catalogue.apply_plan(plan, images=images)
+        except (OSError, zipfile.BadZipFile, catalogue.CatalogueError) as e:
+            messages.error(request, f'Import failed: {e}')
+            return redirect('admin_dashboard:menu_import')
+        finally:
+            _discard_stashed_import(token, format)
+        messages.success(
+            request,
+            f"Menu imported: {summary['created']} new and {summary['updated']} changed products, "
+            f"{summary['categories']} new categories.",
+        )
+        return redirect('admin_dashboard:menu_import')
+    
+    if request.method == 'POST':
+        upload = request.FILES.get('menu_file')
+        if upload is None:
+            messages.error(request, 'Choose a CSV or JSON menu file.')
+            return redirect('admin_dashboard:menu_import')
+        token = uuid.uuid4().hex
+        format = catalogue.format_for(upload.name)
+        menu_path, images_path = _import_paths(token, format)
+        default_storage.save(menu_path, upload)
+        if request.FILES.get('images'):
+            default_storage.save(images_path, request.FILES['images'])
+        try:
+            plan, _ = _plan_stashed_import(token, format)
+        except (zipfile.BadZipFile, catalogue.CatalogueError) as e:
+            _discard_stashed_import(token, format)
+            messages.error(request, f'Could not read the upload: {e}')
+            return redirect('admin_dashboard:menu_import')
+        if plan.errors or not plan.has_changes:
+            _discard_stashed_import(token, format)
+        context.update({
+            'plan': plan,
+            'summary': plan.summary(),
+            'diff': plan.diff(limit=IMPORT_DIFF_LINES),
+            'token': token,
+            'format': format,
+        })
+    
+    return render(request, 'admin_dashboard/menu_import.html', context)
+
+
+@login_required
+@user_passes_test(is_admin)
+def menu_export(request):
+    """Download the menu (?club=<id>, ?format=csv|json|jsonl) in the import format"""
+    format = request.GET.get('format', 'csv')
+    if format not in ('csv', 'json', 'jsonl'):
+        format = 'csv'
+    club = _report_club(request)
+    clubs = [club] if club is not None else None
+
+    content_type = 'text/csv' if format == 'csv' else 'application/json'
+    response = StreamingHttpResponse(
+        catalogue.iter_export(catalogue.export_rows(clubs), format), content_type=content_type
+    )
+    response['Content-Disposition'] = f'attachment; filename="menu.{format}"'
+    return response
+
+
 @login_required
 @user_passes_test(is_admin)
 def reports(request):
     """Sales reports and analytics"""
     # Date range for reports (last 30 days by default)
-    end_date = timezone.now().date()
-    start_date = end_date - timedelta(days=30)
-    
-    # Get sales data
-    sales_data = Order.objects.filter(
-        created_at__date__range=[start_date, end_date]
-    ).extra(
-        select={'day': 'date(created_at)'}
-    ).values('day').annotate(
-        total_orders=Count('id'),
-        total_revenue=Sum('total_amount')
-    ).order_by('day')
-    
-    # Get product sales data
-    product_sales = ProductSales.objects.filter(
-        date__range=[start_date, end_date]
-    ).select_related('product', 'club').order_by('-revenue')[:20]
-    
-    # Get hourly distribution
-    hourly_data = Order.objects.filter(
-        created_at__date__range=[start_date, end_date]
-    ).extra(
-        select={'hour': 'extract(hour from created_at)'}
-    ).values('hour').annotate(
-        order_count=Count('id')
-    ).order_by('hour')
+    days = analytics.parse_range(request.GET.get('range'))
+    start_date, end_date = analytics.report_window(days)
+    club = _report_club(request)
     
     context = {
-        'sales_data': list(sales_data),
-        'product_sales': product_sales,
-        'hourly_data': list(hourly_data),
+        'sales_data': analytics.daily_sales(start_date, end_date, club),
+        'product_sales': analytics.top_products(start_date, end_date, club),
+        'hourly_data': analytics.hourly_distribution(start_date, end_date, club),
         'start_date': start_date,
         'end_date': end_date,
+        'range_days': days,
+        'report_ranges': analytics.REPORT_RANGES,
+        'club': club,
+        'clubs': Club.objects.order_by('name'),
     }
     
     return render(request, 'admin_dashboard/reports.html', context)
 
 
+@login_required
+@user_passes_test(is_admin)
+def reports_csv(request):
+    """Stream the hourly sales histogram for the selected range as CSV"""
+    days = analytics.parse_range(request.GET.get('range'))
+    start_date, end_date = analytics.report_window(days)
+    club = _report_club(request)
+    
+    response = StreamingHttpResponse(
+        analytics.hourly_csv_rows(start_date, end_date, club),
+        content_type='text/csv',
+    )
+    name = club.slug if club else 'all-clubs'
+    response['Content-Disposition'] = f'attachment; filename="sales-{name}-{start_date}-{end_date}.csv"'
+    return response
+
+
+def _report_club(request):
+    """Club selected with ?club=<id>, or None for every club"""
+    club_id = request.GET.get('club')
+    if not club_id:
+        return None
+    if not club_id.isdigit():
+        raise Http404('Invalid club id')
+    return get_object_or_404(Club, id=club_id)
+
+
 @login_required
 @user_passes_test(is_admin)
 def table_management(request, club_id):
@@ -173,24 +313,47 @@ def table_management(request, club_id):
 @login_required
 @user_passes_test(is_admin)
 def generate_qr_codes(request, club_id):
-    """Generate QR codes for all tables in a club"""
+    """QR codes for all tables in a club, rendered once and served from media"""
     club = get_object_or_404(Club, id=club_id)
-    tables = Table.objects.filter(club=club, is_active=True)
-    
-    # Generate QR codes for all tables
-    qr_codes = []
-    for table in tables:
-        qr_image = generate_table_qr_code(table)
-        qr_codes.append({
-            'table': table,
-            'qr_image': qr_image,
-            'url': f"http://localhost:8000/{club.slug}/table/{table.number}/"
-        })
+    tables = Table.objects.filter(club=club, is_active=True).select_related('club')
+    
+    codes = ensure_table_qr_codes(tables)
+    qr_codes = [
+        {'table': table, 'qr_image': default_storage.url(path), 'url': url}
+        for table, url, path in codes or []
+    ]
     
     context = {
         'club': club,
         'qr_codes': qr_codes,
-        'qr_available': qr_image is not None,
+        'qr_available': codes is not None,
     }
     
-    return render(request, 'admin_dashboard/qr_codes.html', context)
\ No newline at end of file
+    return render(request, 'admin_dashboard/qr_codes.html', context)
+
+
+@login_required
+@user_passes_test(is_admin)
+def qr_code_sheet(request, club_id):
+    """Printable sheet of a club's QR codes (?format=pdf, or png with ?page=N)"""
+    club = get_object_or_404(Club, id=club_id)
+    tables = Table.objects.filter(club=club, is_active=True).select_related('club')
+    
+    codes = ensure_table_qr_codes(tables)
+    if codes is None:
+        messages.error(request, 'QR code generation is not available (install qrcode).')
+        return redirect('admin_dashboard:qr_codes', club_id=club.id)
+    
+    if request.GET.get('format') == 'png':
+        try:
+            page = min(max(int(request.GET.get('page', 1)), 1), sheet_page_count(codes))
+        except ValueError:
+            page = 1
+        png, = render_qr_sheet(club, sheet_page(codes, page), image_format='PNG')
+        response = HttpResponse(png, content_type='image/png')
+        response['Content-Disposition'] = f'inline; filename="qr-{club.slug}-{page}.png"'
+        return response
+    
+    response = HttpResponse(render_qr_sheet(club, codes), content_type='application/pdf')
+    response['Content-Disposition'] = f'attachment; filename="qr-{club.slug}.pdf"'
+    return response
@@ -0,0 +1,230 @@
+"""Customer cart: stored quantities resolved to products in one go."""
+
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.db import transaction
+
+from .cart_store import get_cart_store
+from .models import Product
+from .snapshot import get_menu_snapshot, snapshot_products
+
+
+CART_OPERATIONS = ('add', 'set', 'remove')
+
+
+class UnavailableProducts(Exception):
+    """Products in a cart batch that don't exist, aren't available or belong to another club."""
+
+    def __init__(self, product_ids):
+        self.product_ids = product_ids
+        super().__init__(f'Products not available: {product_ids}')
+
+
+@dataclass
+class CartLine:
+    product_id: int
+    name: str
+    unit_price: Decimal
+    quantity: int
+    image_url: str = ''
+    # Model instance when resolved from the database, None when resolved from a snapshot
+    product: Product | None = None
+
+    @property
+    def total(self):
+        return self.unit_price * self.quantity
+
+    def as_dict(self):
+        return {
+            'product_id': self.product_id,
+            'name': self.name,
+            'unit_price': str(self.unit_price),
+            'quantity': self.quantity,
+            'total': str(self.total),
+            'image_url': self.image_url,
+        }
+
+
+@dataclass
+class CartState:
+    lines: list = field(default_factory=list)
+
+    @property
+    def total(self):
+        return sum((line.total for line in self.lines), Decimal('0.00'))
+
+    @property
+    def count(self):
+        return sum(line.quantity for line in self.lines)
+
+    def as_dict(self):
+        return {
+            'items': [line.as_dict() for line in self.lines],
+            'total': str(self.total),
+            'count': self.count,
+        }
+
+
+class Cart:
+    """
+    Product id -> quantity mapping for one visitor.
+
+    Mutations only touch the stored quantities; resolve() turns them into
+    CartLines with a single in_bulk query (or none at all when the club's
+    menu snapshot is used) and prunes lines that no longer resolve.
+    """
+
+    def __init__(self, request, store=None):
+        self.request = request
+        self.store = store or get_cart_store()
+        self.key = self._cart_key()
+        self.quantities = self._load()
+
+    def _cart_key(self):
+        # The session row is written once to get a key; taps then only touch the cart store
+        if self.request.session.session_key is None:
+            self.request.session.save()
+        return self.request.session.session_key
+
+    def _load(self):
+        quantities = {}
+        for product_id, quantity in self.store.get(self.key).items():
+            try:
+                quantities[str(int(product_id))] = int(quantity)
+            except (TypeError, ValueError):
+                continue
+        return quantities
+
+    def add(self, product_id, quantity=1):
+        key = str(int(product_id))
+        quantity = self.store.increment(self.key, key, int(quantity))
+        if quantity > 0:
+            self.quantities[key] = quantity
+        else:
+            self.quantities.pop(key, None)
+
+    def set(self, product_id, quantity):
+        key = str(int(product_id))
+        quantity = int(quantity)
+        self.store.set(self.key, key, quantity)
+        if quantity > 0:
+            self.quantities[key] = quantity
+        else:
+            self.quantities.pop(key, None)
+
+    def remove(self, product_id):
+        key = str(int(product_id))
+        self.store.remove(self.key, key)
+        self.quantities.pop(key, None)
+
+    def clear(self):
+        self.store.clear(self.key)
+        self.quantities = {}
+
+    def apply(self, operations=(), items=None, club=None):
+        """
+        Apply a batch of changes all-or-nothing and return the products they touch.
+
+        ``items`` (product id -> quantity) replaces the whole cart; then
+        ``operations``, a list of (op, product_id, quantity) with op in
+        CART_OPERATIONS, run in order. Every product the batch leaves in the
+        cart is checked with one in_bulk query (available, and on ``club``'s
+        menu when given). If any fails, UnavailableProducts is raised and
+        nothing is stored. Lines that only saw 'add' stay atomic increments,
+        so they still combine with taps from another phone at the table.
+        Everything else is written as the final quantity.
+        """
+        quantities = dict(self.quantities)
+        deltas = {}
+        if items is not None:
+            quantities = {str(int(product_id)): int(quantity) for product_id, quantity in items.items()}
+            deltas = {key: None for key in set(quantities) | set(self.quantities)}
+        for op, product_id, quantity in operations:
+            if op not in CART_OPERATIONS:
+                raise ValueError(f'Unknown cart operation: {op}')
+            key = str(int(product_id))
+            quantity = int(quantity)
+            if op == 'add':
+                quantities[key] = quantities.get(key, 0) + quantity
+                if deltas.get(key, 0) is not None:
+                    deltas[key] = deltas.get(key, 0) + quantity
+            else:
+                quantities[key] = quantity if op == 'set' else 0
+                deltas[key] = None
+
+        wanted = [int(key) for key in deltas if quantities.get(key, 0) > 0]
+        products = {}
+        if wanted:
+            queryset = Product.objects.select_related('club').filter(is_available=True)
+            if club is not None:
+                queryset = queryset.filter(club=club)
+            products = queryset.in_bulk(wanted)
+            missing = sorted(set(wanted) - set(products))
+            if missing:
+                raise UnavailableProducts(missing)
+
+        # Keeps the database store's writes together; the cache store has nothing to roll back
+        with transaction.atomic():
+            for key, delta in deltas.items():
+                if delta is not None:
+                    if delta:
+                        self.add(key, delta)
+                elif quantities.get(key, 0) > 0:
+                    self.set(key, quantities[key])
+                elif key in self.quantities:
+                    self.remove(key)
+        return products
+
+    @property
+    def count(self):
+        return sum(self.quantities.values())
+
+    def __bool__(self):
+        return bool(self.quantities)
+
+    def resolve(self, club=None, use_snapshot=True):
+        """
+        Resolve stored quantities to CartLines for ``club``.
+
+        With ``use_snapshot`` the club's cached menu snapshot is used, so no
+        query runs on a warm cache. Otherwise products are fetched with one
+        in_bulk query and returned as model instances (checkout needs those).
+        Lines that don't resolve to an available product are pruned.
+        """
+        lines = []
+        if club is not None and use_snapshot:
+            products = snapshot_products(get_menu_snapshot(club))
+            for key, quantity in self.quantities.items():
+                product = products.get(int(key))
+                if product is None or quantity <= 0:
+                    continue
+                lines.append(CartLine(
+                    product_id=product['id'],
+                    name=product['name'],
+                    unit_price=Decimal(product['price']),
+                    quantity=quantity,
+                    image_url=product['image_thumb_url'],
+                ))
+        else:
+            queryset = Product.objects.filter(is_available=True)
+            if club is not None:
+                queryset = queryset.filter(club=club)
+            products = queryset.in_bulk([int(key) for key in self.quantities])
+            for key, quantity in self.quantities.items():
+                product = products.get(int(key))
+                if product is None or quantity <= 0:
+                    continue
+                lines.append(CartLine(
+                    product_id=product.id,
+                    name=product.name,
+                    unit_price=product.price,
+                    quantity=quantity,
+                    image_url=product.image_variants.thumb,
+                    product=product,
+                ))
+
+        resolved = {str(line.product_id) for line in lines}
+        for key in set(self.quantities) - resolved:
+            self.remove(key)
+        return CartState(lines=lines)
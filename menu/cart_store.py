@@ -0,0 +1,223 @@
+"""Cart quantity storage that stays out of the session table.
+
+Every mutation is a per-line atomic increment, so concurrent taps from the
+same table never rewrite a shared blob. ``BUDA_CART_STORE`` selects the
+backend (dotted path); the cache store is the default and the database store
+is a fallback for deployments without a shared cache.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import CartEntry
+
+CART_TTL = 60 * 60 * 12  # a club night
+
+DEFAULT_CART_STORE = 'menu.cart_store.CacheCartStore'
+
+
+class CartStore:
+    """Interface: product id (str) -> quantity (int) per cart key."""
+
+    ttl = CART_TTL
+
+    def get(self, cart_key):
+        raise NotImplementedError
+
+    def increment(self, cart_key, product_id, delta):
+        """Atomically add ``delta`` to a line; lines at or below zero are removed. Returns the new quantity."""
+        raise NotImplementedError
+
+    def set(self, cart_key, product_id, quantity):
+        raise NotImplementedError
+
+    def remove(self, cart_key, product_id):
+        raise NotImplementedError
+
+    def clear(self, cart_key):
+        raise NotImplementedError
+
+
+class CacheCartStore(CartStore):
+    """
+    Cart lines as individual cache counters.
+
+    Each line is its own key so quantity changes use ``cache.incr``. Lines are
+    found again through numbered slot keys: the first writer of a line wins
+    ``cache.add`` and claims a slot from an ``incr`` counter, so no step is a
+    read-modify-write. A product keeps its slot when its line is removed and
+    added again, so the slot count is bounded by the distinct products in the
+    cart. Works with LocMemCache (single process) and any shared backend
+    (Redis/Memcached) for multi-worker deployments. A line expires ``ttl``
+    seconds after it was first added.
+    """
+
+    def __init__(self, cache_alias='default'):
+        self.cache = caches[cache_alias]
+
+    def _line_key(self, cart_key, product_id):
+        return f'buda:cart:{cart_key}:line:{product_id}'
+
+    def _slot_key(self, cart_key, slot):
+        return f'buda:cart:{cart_key}:slot:{slot}'
+
+    def _counter_key(self, cart_key):
+        return f'buda:cart:{cart_key}:slots'
+
+    def _product_slot_key(self, cart_key, product_id):
+        return f'buda:cart:{cart_key}:slot-of:{product_id}'
+
+    def _claim_slot(self, cart_key, product_id):
+        product_slot_key = self._product_slot_key(cart_key, product_id)
+        slot = self.cache.get(product_slot_key)
+        if slot is not None:
+            # Added again after a remove: refresh the slot it already has
+            self.cache.set_many({
+                product_slot_key: slot, self._slot_key(cart_key, slot): str(product_id),
+            }, timeout=self.ttl)
+            self.cache.touch(self._counter_key(cart_key), self.ttl)
+            return
+        counter_key = self._counter_key(cart_key)
+        self.cache.add(counter_key, 0, timeout=self.ttl)
+        try:
+            slot = self.cache.incr(counter_key)
+        except ValueError:
+            # Counter expired between add and incr
+            self.cache.add(counter_key, 0, timeout=self.ttl)
+            slot = self.cache.incr(counter_key)
+        # Keep the counter alive at least as long as the newest slot
+        self.cache.touch(counter_key, self.ttl)
+        self.cache.set_many({
+            product_slot_key: slot, self._slot_key(cart_key, slot): str(product_id),
+        }, timeout=self.ttl)
+
+    def _ensure_line(self, cart_key, product_id, initial=0):
+        if self.cache.add(self._line_key(cart_key, product_id), initial, timeout=self.ttl):
+            self._claim_slot(cart_key, product_id)
+            return True
+        return False
+
+    def get(self, cart_key):
+        slots = self.cache.get(self._counter_key(cart_key)) or 0
+        if not slots:
+            return {}
+        slot_keys = [self._slot_key(cart_key, n) for n in range(1, slots + 1)]
+        product_ids = list(dict.fromkeys(self.cache.get_many(slot_keys).values()))
+        line_keys = {self._line_key(cart_key, pid): pid for pid in product_ids}
+        quantities = {}
+        for key, quantity in self.cache.get_many(list(line_keys)).items():
+            if quantity > 0:
+                quantities[line_keys[key]] = quantity
+        return quantities
+
+    def increment(self, cart_key, product_id, delta):
+        product_id = str(product_id)
+        key = self._line_key(cart_key, product_id)
+        if delta > 0 and self._ensure_line(cart_key, product_id, initial=delta):
+            return delta
+        try:
+            quantity = self.cache.incr(key, delta)
+        except ValueError:
+            if delta <= 0:
+                return 0
+            return self.increment(cart_key, product_id, delta)
+        if quantity <= 0:
+            self.cache.delete(key)
+            return 0
+        return quantity
+
+    def set(self, cart_key, product_id, quantity):
+        product_id = str(product_id)
+        if quantity <= 0:
+            self.remove(cart_key, product_id)
+            return
+        if not self._ensure_line(cart_key, product_id, initial=quantity):
+            self.cache.set(self._line_key(cart_key, product_id), quantity, timeout=self.ttl)
+
+    def remove(self, cart_key, product_id):
+        self.cache.delete(self._line_key(cart_key, str(product_id)))
+
+    def clear(self, cart_key):
+        slots = self.cache.get(self._counter_key(cart_key)) or 0
+        slot_keys = [self._slot_key(cart_key, n) for n in range(1, slots + 1)]
+        product_ids = set(self.cache.get_many(slot_keys).values())
+        self.cache.delete_many(
+            slot_keys
+            + [self._line_key(cart_key, pid) for pid in product_ids]
+            + [self._product_slot_key(cart_key, pid) for pid in product_ids]
+            + [self._counter_key(cart_key)]
+        )
+
+
+class DatabaseCartStore(CartStore):
+    """
+    Cart lines as CartEntry rows, one per (cart, product).
+
+    Increments are ``UPDATE ... SET quantity = quantity + n`` on a single small
+    row instead of rewriting the whole session blob. Rows older than ``ttl``
+    are ignored and can be removed with purge_expired().
+    """
+
+    def _entries(self, cart_key):
+        cutoff = timezone.now() - timedelta(seconds=self.ttl)
+        return CartEntry.objects.filter(cart_key=cart_key, updated_at__gte=cutoff)
+
+    def get(self, cart_key):
+        return {
+            str(product_id): quantity
+            for product_id, quantity in self._entries(cart_key)
+            .filter(quantity__gt=0)
+            .values_list('product_id', 'quantity')
+        }
+
+    @transaction.atomic
+    def increment(self, cart_key, product_id, delta):
+        entries = CartEntry.objects.filter(cart_key=cart_key, product_id=product_id)
+        now = timezone.now()
+        # An expired row counts as an empty line, as in get()
+        quantity = Case(
+            When(updated_at__lt=now - timedelta(seconds=self.ttl), then=Value(delta)),
+            default=F('quantity') + delta,
+        )
+        if not entries.update(quantity=quantity, updated_at=now):
+            if delta <= 0:
+                return 0
+            try:
+                with transaction.atomic():
+                    CartEntry.objects.create(cart_key=cart_key, product_id=product_id, quantity=delta)
+                return delta
+            except IntegrityError:
+                entries.update(quantity=quantity, updated_at=now)
+        quantity = entries.values_list('quantity', flat=True).first() or 0
+        if quantity <= 0:
+            entries.delete()
+            return 0
+        return quantity
+
+    def set(self, cart_key, product_id, quantity):
+        if quantity <= 0:
+            self.remove(cart_key, product_id)
+            return
+        CartEntry.objects.update_or_create(
+            cart_key=cart_key, product_id=product_id, defaults={'quantity': quantity},
+        )
+
+    def remove(self, cart_key, product_id):
+        CartEntry.objects.filter(cart_key=cart_key, product_id=product_id).delete()
+
+    def clear(self, cart_key):
+        CartEntry.objects.filter(cart_key=cart_key).delete()
+
+    def purge_expired(self):
+        cutoff = timezone.now() - timedelta(seconds=self.ttl)
+        return CartEntry.objects.filter(updated_at__lt=cutoff).delete()[0]
+
+
+def get_cart_store():
+    return import_string(getattr(settings, 'BUDA_CART_STORE', DEFAULT_CART_STORE))()
@@ -0,0 +1,402 @@
+"""Bulk menu import and export (CSV, JSON or JSON lines).
+
+One row per product, keyed by (club slug, product name):
+
+    club, category, category_name, name, description, price, stock_quantity,
+    is_available, display_order, image
+
+``club``, ``category``, ``name`` and ``price`` are required. Columns that
+are left out keep the product's current value, or the model default for a
+new product, except that a new product without ``stock_quantity`` isn't
+stock-tracked. A blank ``stock_quantity`` also means stock isn't tracked.
+Unknown category slugs create a category, named from ``category_name``.
+``image`` is a member of the images zip or an existing media path, as in an
+export; any other value is a row error.
+
+Importing takes two steps. plan_import() reads the rows in chunks of
+``chunk_size``. For each chunk it loads the referenced clubs, categories
+and products with one query each, then builds an ImportPlan: a diff of what
+would be created and changed, plus any row errors. Nothing is written at
+that point. apply_plan() writes the plan in one transaction with chunked
+bulk_create(update_conflicts=True) upserts. Query counts therefore grow
+with rows / chunk_size, not with rows. bulk_create skips signals, so the
+affected menus are invalidated on commit.
+"""
+
+import codecs
+import csv
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils.text import slugify
+
+from .models import Category, Club, Product
+from .snapshot import invalidate_all_menus, invalidate_menu
+
+COLUMNS = [
+    'club', 'category', 'category_name', 'name', 'description', 'price',
+    'stock_quantity', 'is_available', 'display_order', 'image',
+]
+PRODUCT_FIELDS = ['category', 'description', 'price', 'stock_quantity', 'is_available', 'display_order', 'image']
+CHUNK_SIZE = 1000
+IMAGE_DIRECTORY = 'products'
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'on'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'off', ''}
+
+
+class CatalogueError(Exception):
+    """A file that can't be read at all (as opposed to a bad row)."""
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_rows(fileobj, format='csv'):
+    """
+    Yield ``(line, row)`` pairs from a binary file without loading it whole.
+
+    ``format`` is 'csv', 'jsonl' (one object per line) or 'json'. A JSON
+    array has to be parsed in one piece; use JSON lines for very large files.
+    """
+    if format == 'csv':
+        reader = csv.DictReader(codecs.iterdecode(fileobj, 'utf-8-sig'))
+        for row in reader:
+            yield reader.line_num, row
+    elif format == 'jsonl':
+        for line, text in enumerate(codecs.iterdecode(fileobj, 'utf-8-sig'), start=1):
+            if text.strip():
+                try:
+                    yield line, json.loads(text)
+                except json.JSONDecodeError as e:
+                    raise CatalogueError(f'Line {line}: {e}')
+    elif format == 'json':
+        try:
+            rows = json.load(codecs.getreader('utf-8-sig')(fileobj))
+        except json.JSONDecodeError as e:
+            raise CatalogueError(str(e))
+        if not isinstance(rows, list):
+            raise CatalogueError('Expected a JSON array of products')
+        yield from enumerate(rows, start=1)
+    else:
+        raise CatalogueError(f'Unknown format: {format}')
+
+
+def format_for(filename):
+    extension = os.path.splitext(filename)[1].lower().lstrip('.')
+    return {'csv': 'csv', 'json': 'json', 'jsonl': 'jsonl', 'ndjson': 'jsonl'}.get(extension, 'csv')
+
+
+def _text(value):
+    return '' if value is None else str(value).strip()
+
+
+def _clean_row(row):
+    """Typed values for the columns present in ``row``; raises RowError."""
+    if not isinstance(row, dict):
+        raise RowError('Expected an object')
+    cleaned = {}
+    for column in ('club', 'category', 'name'):
+        cleaned[column] = _text(row.get(column))
+        if not cleaned[column]:
+            raise RowError(f'Missing {column}')
+    try:
+        cleaned['price'] = Decimal(_text(row.get('price'))).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise RowError(f"Invalid price: {row.get('price')!r}")
+    if cleaned['price'] <= 0:
+        raise RowError('Price must be positive')
+
+    if 'category_name' in row:
+        cleaned['category_name'] = _text(row['category_name'])
+    if 'description' in row:
+        cleaned['description'] = _text(row['description'])
+    if 'image' in row:
+        cleaned['image'] = _text(row['image'])
+    for column in ('stock_quantity', 'display_order'):
+        if column not in row:
+            continue
+        value = _text(row[column])
+        try:
+            number = int(value) if value else None
+        except ValueError:
+            raise RowError(f'Invalid {column}: {value!r}')
+        if number is not None and number < 0:
+            raise RowError(f'{column} must not be negative')
+        # A blank stock_quantity means untracked; a blank display_order is 0
+        cleaned[column] = number if column == 'stock_quantity' else number or 0
+    if 'is_available' in row:
+        value = row['is_available']
+        if isinstance(value, bool):
+            cleaned['is_available'] = value
+        elif _text(value).lower() in TRUE_VALUES:
+            cleaned['is_available'] = True
+        elif _text(value).lower() in FALSE_VALUES:
+            cleaned['is_available'] = False
+        else:
+            raise RowError(f'Invalid is_available: {value!r}')
+    return cleaned
+
+
+class ImageArchive:
+    """Product images from a zip, stored under a content hash so re-imports reuse them."""
+
+    def __init__(self, zip_file=None):
+        self.zip_file = zip_file
+        self.members = {}
+        if zip_file is not None:
+            for info in zip_file.infolist():
+                if not info.is_dir():
+                    self.members.setdefault(info.filename, info)
+                    self.members.setdefault(os.path.basename(info.filename), info)
+        self._paths = {}
+
+    def path_for(self, name):
+        """Storage path the image will have, or None if the zip doesn't have it."""
+        info = self.members.get(name)
+        if info is None:
+            return None
+        if info.filename not in self._paths:
+            digest = hashlib.sha256(self.zip_file.read(info)).hexdigest()[:16]
+            extension = os.path.splitext(info.filename)[1].lower()
+            self._paths[info.filename] = f'{IMAGE_DIRECTORY}/{digest}{extension}'
+        return self._paths[info.filename]
+
+    def save(self, name):
+        path = self.path_for(name)
+        if not default_storage.exists(path):
+            default_storage.save(path, ContentFile(self.zip_file.read(self.members[name])))
+        return path
+
+
+@dataclass
+class ImportPlan:
+    new_categories: dict = field(default_factory=dict)  # slug -> name
+    created: list = field(default_factory=list)
+    updated: list = field(default_factory=list)  # (product, {field: (old, new)})
+    unchanged: int = 0
+    errors: list = field(default_factory=list)  # (line, message)
+    images: dict = field(default_factory=dict)  # product key -> zip member
+    clubs: dict = field(default_factory=dict)  # club id -> Club
+
+    @property
+    def has_changes(self):
+        return bool(self.new_categories or self.created or self.updated)
+
+    def summary(self):
+        return {
+            'categories': len(self.new_categories),
+            'created': len(self.created),
+            'updated': len(self.updated),
+            'unchanged': self.unchanged,
+            'errors': len(self.errors),
+        }
+
+    def diff(self, limit=None):
+        """Human-readable lines: '+' new, '~' changed, '!' row errors."""
+        lines = [f'+ category {slug} ({name})' for slug, name in self.new_categories.items()]
+        lines += [f'+ {self.clubs[p.club_id].slug}/{p.name} R{p.price}' for p in self.created]
+        for product, changes in self.updated:
+            described = ', '.join(f'{name}: {old} -> {new}' for name, (old, new) in changes.items())
+            lines.append(f'~ {self.clubs[product.club_id].slug}/{product.name}: {described}')
+        lines += [f'! line {line}: {message}' for line, message in self.errors]
+        return lines[:limit] if limit is not None else lines
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _display(field_name, value):
+    if field_name == 'category':
+        return value.slug if value is not None else ''
+    if field_name == 'image':
+        return value or ''
+    return value
+
+
+def plan_import(rows, images=None, chunk_size=CHUNK_SIZE):
+    """Build an ImportPlan from ``(line, row)`` pairs; writes nothing."""
+    images = images or ImageArchive()
+    plan = ImportPlan()
+    clubs_by_slug = {}
+    categories = {}
+    planned = {}  # (club_id, name) -> Product, so a repeated row updates the same object
+
+    for chunk in _chunks(rows, chunk_size):
+        cleaned = []
+        for line, row in chunk:
+            try:
+                cleaned.append((line, _clean_row(row)))
+            except RowError as e:
+                plan.errors.append((line, str(e)))
+
+        club_slugs = {row['club'] for _, row in cleaned} - set(clubs_by_slug)
+        if club_slugs:
+            for club in Club.objects.filter(slug__in=club_slugs):
+                clubs_by_slug[club.slug] = club
+                plan.clubs[club.id] = club
+        category_slugs = {row['category'] for _, row in cleaned} - set(categories)
+        if category_slugs:
+            categories.update(Category.objects.in_bulk(category_slugs, field_name='slug'))
+
+        keys = {
+            (clubs_by_slug[row['club']].id, row['name'])
+            for _, row in cleaned if row['club'] in clubs_by_slug
+        } - set(planned)
+        existing = {}
+        if keys:
+            products = Product.objects.filter(
+                club_id__in={club_id for club_id, _ in keys}, name__in={name for _, name in keys},
+            ).select_related('category')
+            existing = {(p.club_id, p.name): p for p in products}
+
+        for line, row in cleaned:
+            club = clubs_by_slug.get(row['club'])
+            if club is None:
+                plan.errors.append((line, f"Unknown club: {row['club']}"))
+                continue
+            category = categories.get(row['category'])
+            if category is None:
+                category = Category(
+                    slug=row['category'],
+                    name=row.get('category_name') or row['category'].replace('-', ' ').title(),
+                )
+                categories[row['category']] = category
+                plan.new_categories[category.slug] = category.name
+            if slugify(category.slug) != category.slug:
+                plan.errors.append((line, f'Invalid category slug: {category.slug}'))
+                continue
+
+            key = (club.id, row['name'])
+            values = {'category': category, 'price': row['price']}
+            for name in ('description', 'stock_quantity', 'is_available', 'display_order'):
+                if name in row:
+                    values[name] = row[name]
+            product = planned.get(key) or existing.get(key)
+            if row.get('image'):
+                stored = images.path_for(row['image'])
+                if stored:
+                    plan.images[key] = row['image']
+                elif not (product is not None and product.image.name == row['image']
+                          or default_storage.exists(row['image'])):
+                    plan.errors.append((line, f"Image not found: {row['image']}"))
+                    continue
+                values['image'] = stored or row['image']
+
+            product = planned.get(key)
+            if product is not None:
+                # Repeated row: the last one wins
+                for name, value in values.items():
+                    setattr(product, name, value)
+                continue
+            product = existing.get(key)
+            if product is None:
+                # Stock is only tracked when the file says so
+                values.setdefault('stock_quantity', None)
+                product = Product(club=club, name=row['name'], **values)
+                planned[key] = product
+                plan.created.append(product)
+                continue
+
+            changes = {}
+            for name, value in values.items():
+                old = product.image.name if name == 'image' else getattr(product, name)
+                if old != value:
+                    changes[name] = (_display(name, old), _display(name, value))
+                    setattr(product, name, value)
+            planned[key] = product
+            if changes:
+                plan.updated.append((product, changes))
+            else:
+                plan.unchanged += 1
+    plan.errors.sort()
+    return plan
+
+
+@transaction.atomic
+def apply_plan(plan, images=None, chunk_size=CHUNK_SIZE):
+    """Write an ImportPlan; returns its summary."""
+    images = images or ImageArchive()
+    if plan.new_categories:
+        Category.objects.bulk_create(
+            [Category(slug=slug, name=name) for slug, name in plan.new_categories.items()],
+            update_conflicts=True, unique_fields=['slug'], update_fields=['name'],
+        )
+        saved = Category.objects.in_bulk(list(plan.new_categories), field_name='slug')
+        for product in plan.created + [product for product, _ in plan.updated]:
+            if product.category.pk is None:
+                product.category = saved[product.category.slug]
+        transaction.on_commit(invalidate_all_menus)
+
+    for (club_id, name), member in plan.images.items():
+        images.save(member)
+
+    products = plan.created + [product for product, _ in plan.updated]
+    if products:
+        Product.objects.bulk_create(
+            products,
+            batch_size=chunk_size,
+            update_conflicts=True,
+            unique_fields=['club', 'name'],
+            update_fields=PRODUCT_FIELDS + ['updated_at'],
+        )
+        club_ids = {product.club_id for product in products}
+        transaction.on_commit(lambda: [invalidate_menu(club_id) for club_id in club_ids])
+    return plan.summary()
+
+
+def export_rows(clubs=None):
+    """Every product as an import row, streamed from one query."""
+    products = Product.objects.select_related('club', 'category').order_by(
+        'club__slug', 'category__display_order', 'display_order', 'name',
+    )
+    if clubs is not None:
+        products = products.filter(club__in=clubs)
+    for product in products.iterator(chunk_size=2000):
+        yield {
+            'club': product.club.slug,
+            'category': product.category.slug,
+            'category_name': product.category.name,
+            'name': product.name,
+            'description': product.description,
+            'price': str(product.price),
+            'stock_quantity': product.stock_quantity,
+            'is_available': product.is_available,
+            'display_order': product.display_order,
+            'image': product.image.name if product.image else '',
+        }
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def iter_export(rows, format='csv'):
+    """Serialize export rows chunk by chunk (for files and streaming responses)."""
+    if format == 'csv':
+        writer = csv.DictWriter(_Echo(), fieldnames=COLUMNS)
+        yield writer.writeheader()
+        for row in rows:
+            row = {**row, 'stock_quantity': '' if row['stock_quantity'] is None else row['stock_quantity']}
+            yield writer.writerow(row)
+    elif format == 'jsonl':
+        for row in rows:
+            yield json.dumps(row) + '\n'
+    elif format == 'json':
+        yield '['
+        for index, row in enumerate(rows):
+            yield (',\n' if index else '\n') + json.dumps(row)
+        yield '\n]\n'
+    else:
+        raise CatalogueError(f'Unknown format: {format}')
@@ -0,0 +1,180 @@
+"""Resized variants of product images and club logos.
+
+Each uploaded image gets VARIANTS (thumb, card, full) in WebP and JPEG,
+scaled down to the variant's width and never up. Variant paths come from
+the original's name: ``variants/products/castle.card.webp``. A template can
+therefore build URLs without touching storage. A new upload gets a new name
+from storage, so old variants are never served for it.
+
+Variants are built after the upload commits, in a background thread (see
+BUDA_IMAGE_VARIANTS_ASYNC), or all at once with the build_image_variants
+command, e.g. after a bulk import. Once built, the model's ``*_variants_built``
+field is set to the original's name and its ``*_width`` field to the
+original's width, so srcsets give each variant's real width. Until then
+ImageVariants falls back to the original URL, so pages never link to a
+variant that doesn't exist yet.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+
+VARIANT_DIRECTORY = 'variants'
+VARIANTS = {'thumb': 160, 'card': 480, 'full': 1200}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 6}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='image-variants')
+
+
+def variant_path(name, variant, format):
+    stem = os.path.splitext(name)[0]
+    extension = 'jpg' if format == 'jpeg' else format
+    return f'{VARIANT_DIRECTORY}/{stem}.{variant}.{extension}'
+
+
+class ImageVariants:
+    """Template-friendly URLs for one image field: ``.card``, ``.srcset``, ``.webp_srcset``..."""
+
+    def __init__(self, field_file, built_from, width=None):
+        self.field_file = field_file
+        self.ready = bool(field_file) and built_from == field_file.name
+        self.width = width
+
+    def __bool__(self):
+        return bool(self.field_file)
+
+    def url(self, variant='card', format='jpeg'):
+        if not self.field_file:
+            return ''
+        if not self.ready:
+            return self.field_file.url
+        return default_storage.url(variant_path(self.field_file.name, variant, format))
+
+    def widths(self):
+        """``{variant: width}`` as built; a small original makes several variants the same size."""
+        if not self.width:
+            # Built before widths were recorded; rebuild with build_image_variants
+            return dict(VARIANTS)
+        return {variant: min(width, self.width) for variant, width in VARIANTS.items()}
+
+    def srcset(self, format='jpeg'):
+        if not self.ready:
+            return ''
+        candidates = {}
+        for variant, width in self.widths().items():
+            # Same-size variants are identical images; a srcset may list each width once
+            candidates.setdefault(width, variant)
+        return ', '.join(f'{self.url(variant, format)} {width}w' for width, variant in candidates.items())
+
+    @property
+    def thumb(self):
+        return self.url('thumb')
+
+    @property
+    def card(self):
+        return self.url('card')
+
+    @property
+    def full(self):
+        return self.url('full')
+
+    @property
+    def jpeg_srcset(self):
+        return self.srcset('jpeg')
+
+    @property
+    def webp_srcset(self):
+        return self.srcset('webp')
+
+
+def render_variants(source):
+    """
+    Encode every variant of an image file.
+
+    Returns ``({(variant, format): bytes}, width)``, ``width`` being the
+    original's width once EXIF rotation is applied.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'L'):
+            # JPEG has no alpha: flatten transparent PNGs onto white
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.convert('RGBA').split()[-1])
+            image = background
+        image = image.convert('RGB')
+
+    rendered = {}
+    for variant, width in VARIANTS.items():
+        resized = image
+        if image.width > width:
+            resized = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+        for format, (pil_format, options) in FORMATS.items():
+            buffer = BytesIO()
+            resized.save(buffer, format=pil_format, **options)
+            rendered[variant, format] = buffer.getvalue()
+    return rendered, image.width
+
+
+def build_variants(instance, field_name, built_field_name):
+    """
+    Build and store the variants for ``instance.<field_name>`` and record it.
+
+    The original's width goes in ``<field_name>_width``. The flag is set with a queryset update guarded on the image name, so a
+    newer upload that landed meanwhile is left for its own build, and no
+    save signal fires again. Returns True if anything was built.
+    """
+    field_file = getattr(instance, field_name)
+    if not field_file:
+        return False
+    name = field_file.name
+    with field_file.storage.open(name) as source:
+        rendered, width = render_variants(source)
+    for (variant, format), content in rendered.items():
+        path = variant_path(name, variant, format)
+        if default_storage.exists(path):
+            default_storage.delete(path)
+        default_storage.save(path, ContentFile(content))
+    width_field_name = f'{field_name}_width'
+    type(instance).objects.filter(pk=instance.pk, **{field_name: name}).update(
+        **{built_field_name: name, width_field_name: width},
+    )
+    setattr(instance, built_field_name, name)
+    setattr(instance, width_field_name, width)
+    return True
+
+
+def _build_in_background(model, pk, field_name, built_field_name, on_built):
+    close_old_connections()
+    try:
+        instance = model.objects.filter(pk=pk).first()
+        if instance is not None and build_variants(instance, field_name, built_field_name) and on_built:
+            on_built(instance)
+    finally:
+        close_old_connections()
+
+
+def schedule_variants(instance, field_name, built_field_name, on_built=None):
+    """Build variants after the current transaction commits if they're missing or stale."""
+    field_file = getattr(instance, field_name)
+    if not field_file or getattr(instance, built_field_name) == field_file.name:
+        return
+
+    def build():
+        if getattr(settings, 'BUDA_IMAGE_VARIANTS_ASYNC', True):
+            _executor.submit(
+                _build_in_background, type(instance), instance.pk, field_name, built_field_name, on_built,
+            )
+        elif build_variants(instance, field_name, built_field_name) and on_built:
+            on_built(instance)
+
+    transaction.on_commit(build)
@@ -0,0 +1,84 @@
+"""Compare add-to-cart tap throughput: session rewrite vs the cart stores."""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+
+from menu.cart_store import CacheCartStore, DatabaseCartStore
+from menu.models import CartEntry, Product
+
+
+class Command(BaseCommand):
+    help = 'Benchmark concurrent add-to-cart taps per second for each cart backend.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent tappers (default 8).')
+        parser.add_argument('--taps', type=int, default=200, help='Taps per thread (default 200).')
+
+    def handle(self, *args, **options):
+        product = Product.objects.first()
+        if product is None:
+            raise CommandError('No products found - run populate_sample_data first.')
+
+        threads = options['threads']
+        taps = options['taps']
+        session_engine = import_module(settings.SESSION_ENGINE)
+
+        def session_tap(n):
+            # What add_to_cart used to do: load the session, change the cart, save the row
+            session = session_engine.SessionStore(session_keys[n % len(session_keys)])
+            cart = session.get('cart', {})
+            cart[str(product.id)] = cart.get(str(product.id), 0) + 1
+            session['cart'] = cart
+            session.save()
+
+        cache_store = CacheCartStore()
+        db_store = DatabaseCartStore()
+
+        session_keys = []
+        for _ in range(threads):
+            session = session_engine.SessionStore()
+            session.create()
+            session_keys.append(session.session_key)
+
+        backends = [
+            ('session (before)', session_tap),
+            ('cache store', lambda n: cache_store.increment(f'bench-{n % threads}', product.id, 1)),
+            ('database store', lambda n: db_store.increment(f'bench-{n % threads}', product.id, 1)),
+        ]
+
+        try:
+            for label, tap in backends:
+                rate, errors = self._run(tap, threads, taps)
+                self.stdout.write(
+                    f'{label:<18} {rate:>10.0f} taps/s  ({errors} failed with database locked)'
+                )
+        finally:
+            for session_key in session_keys:
+                session_engine.SessionStore(session_key).delete()
+            for n in range(threads):
+                cache_store.clear(f'bench-{n}')
+            CartEntry.objects.filter(cart_key__startswith='bench-').delete()
+
+    def _run(self, tap, threads, taps):
+        def worker(thread_index):
+            errors = 0
+            try:
+                for i in range(taps):
+                    try:
+                        tap(thread_index + i * threads)
+                    except OperationalError:
+                        errors += 1
+            finally:
+                connection.close()
+            return errors
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            errors = sum(pool.map(worker, range(threads)))
+        elapsed = time.perf_counter() - start
+        return (threads * taps - errors) / elapsed, errors
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+
+from menu.images import build_variants
+from menu.models import Club, Product
+from menu.snapshot import invalidate_menu
+
+
+class Command(BaseCommand):
+    help = 'Build thumb/card/full WebP and JPEG variants for product images and club logos that lack them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Rebuild variants that are already up to date.')
+
+    def handle(self, *args, **options):
+        targets = [
+            (Club.objects.exclude(logo=''), 'logo', 'logo_variants_built'),
+            (Product.objects.exclude(image=''), 'image', 'image_variants_built'),
+        ]
+        built = failed = 0
+        changed_clubs = set()
+        for queryset, field_name, built_field_name in targets:
+            queryset = queryset.exclude(**{f'{field_name}__isnull': True})
+            if not options['force']:
+                # Built before widths were recorded counts as missing too
+                queryset = queryset.exclude(
+                    Q(**{built_field_name: F(field_name)}) & Q(**{f'{field_name}_width__isnull': False})
+                )
+            for instance in queryset.iterator():
+                try:
+                    build_variants(instance, field_name, built_field_name)
+                except (OSError, ValueError) as error:
+                    failed += 1
+                    self.stderr.write(f'{instance}: {error}')
+                    continue
+                built += 1
+                changed_clubs.add(instance.club_id if isinstance(instance, Product) else instance.pk)
+
+        for club_id in changed_clubs:
+            invalidate_menu(club_id)
+        self.stdout.write(self.style.SUCCESS(f'Built variants for {built} image(s), {failed} failed.'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from menu.catalogue import export_rows, format_for, iter_export
+from menu.models import Club
+
+
+class Command(BaseCommand):
+    help = 'Write every product as a CSV/JSON menu that import_menu can read back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--club', action='append', help='Club slug (repeatable; default: every club).')
+        parser.add_argument('--format', choices=['csv', 'json', 'jsonl'], help='Default: from --output, else csv.')
+        parser.add_argument('-o', '--output', help='File to write (default: stdout).')
+
+    def handle(self, *args, **options):
+        clubs = Club.objects.filter(slug__in=options['club']) if options['club'] else None
+        format = options['format'] or (format_for(options['output']) if options['output'] else 'csv')
+        chunks = iter_export(export_rows(clubs), format)
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                output.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
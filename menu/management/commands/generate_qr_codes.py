@@ -0,0 +1,46 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from menu.models import Table
+from menu.qr import ensure_table_qr_codes, remove_stale_qr_codes
+
+
+class Command(BaseCommand):
+    help = 'Pre-render table QR codes into media (only missing or changed ones).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--club', help='Only this club slug (default: every active club).')
+        parser.add_argument('--base-url', help='Override settings.BASE_URL.')
+        parser.add_argument(
+            '--processes', type=int, default=os.cpu_count() or 1,
+            help='Worker processes used to render (default: CPU count).',
+        )
+        parser.add_argument(
+            '--prune', action='store_true',
+            help="Delete each club's stored QR images that these codes don't use (old slug, base URL or table).",
+        )
+
+    def handle(self, *args, **options):
+        tables = Table.objects.filter(is_active=True, club__is_active=True).select_related('club')
+        if options['club']:
+            tables = tables.filter(club__slug=options['club'])
+
+        start = time.perf_counter()
+        codes = ensure_table_qr_codes(
+            tables, base_url=options['base_url'], processes=options['processes'],
+        )
+        if codes is None:
+            raise CommandError('qrcode is not installed.')
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(codes)} table QR code(s) ready in {elapsed:.2f}s'
+        ))
+
+        if options['prune']:
+            by_club = {}
+            for code in codes:
+                by_club.setdefault(code[0].club, []).append(code)
+            removed = sum(remove_stale_qr_codes(club, club_codes) for club, club_codes in by_club.items())
+            self.stdout.write(f'Removed {removed} stale QR image(s)')
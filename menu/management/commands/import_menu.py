@@ -0,0 +1,50 @@
+import time
+import zipfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from menu.catalogue import CHUNK_SIZE, CatalogueError, ImageArchive, apply_plan, format_for, plan_import, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Upsert categories and products from a CSV/JSON menu (see menu.catalogue for the columns).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV, JSON array or JSON lines file.')
+        parser.add_argument('--format', choices=['csv', 'json', 'jsonl'], help='Default: from the file extension.')
+        parser.add_argument('--images', help='Zip with the image files named in the image column.')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Only show the diff.')
+        parser.add_argument('--show', type=int, default=50, help='Diff lines to print (default 50, 0 for all).')
+
+    def handle(self, *args, **options):
+        archive = zipfile.ZipFile(options['images']) if options['images'] else None
+        images = ImageArchive(archive)
+        start = time.perf_counter()
+        try:
+            with open(options['path'], 'rb') as menu_file:
+                rows = read_rows(menu_file, options['format'] or format_for(options['path']))
+                plan = plan_import(rows, images=images, chunk_size=options['chunk_size'])
+        except (OSError, CatalogueError) as e:
+            raise CommandError(str(e))
+
+        for line in plan.diff(limit=options['show'] or None):
+            self.stdout.write(line)
+        summary = plan.summary()
+        self.stdout.write(
+            f"{summary['created']} new, {summary['updated']} changed, {summary['unchanged']} unchanged, "
+            f"{summary['categories']} new categories, {summary['errors']} errors"
+        )
+        if plan.errors:
+            raise CommandError('Fix the rows above and run again; nothing was imported.')
+        if options['dry_run'] or not plan.has_changes:
+            return
+
+        apply_plan(plan, images=images, chunk_size=options['chunk_size'])
+        if archive is not None:
+            archive.close()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f'Imported in {elapsed:.2f}s'))
+        if plan.images:
+            # bulk upserts send no post_save, so variants aren't scheduled
+            self.stdout.write('Run build_image_variants to resize the new images.')
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 03:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cart_key', models.CharField(max_length=64)),
+                ('quantity', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_entries', to='menu.product')),
+            ],
+            options={
+                'verbose_name_plural': 'Cart entries',
+                'unique_together': {('cart_key', 'product')},
+            },
+        ),
+    ]
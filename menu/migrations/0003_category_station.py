@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 03:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0002_cartentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='station',
+            field=models.CharField(choices=[('bar', 'Bar'), ('kitchen', 'Kitchen')], default='bar', max_length=20),
+        ),
+    ]
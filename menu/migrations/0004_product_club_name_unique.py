@@ -0,0 +1,43 @@
+# Generated by Django 5.2 on 2026-10-18 03:30
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def rename_duplicate_products(apps, schema_editor):
+    """Keep the oldest product under each (club, name); suffix the others " (2)", " (3)", ..."""
+    Product = apps.get_model('menu', 'Product')
+    duplicates = (
+        Product.objects.values('club_id', 'name')
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        taken = set(Product.objects.filter(club_id=duplicate['club_id']).values_list('name', flat=True))
+        products = Product.objects.filter(club_id=duplicate['club_id'], name=duplicate['name']).order_by('id')
+        suffix = 1
+        for product in products[1:]:
+            while True:
+                suffix += 1
+                tag = f' ({suffix})'
+                name = duplicate['name'][:200 - len(tag)] + tag
+                if name not in taken:
+                    break
+            taken.add(name)
+            product.name = name
+            product.save(update_fields=['name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0003_category_station'),
+    ]
+
+    operations = [
+        migrations.RunPython(rename_duplicate_products, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.UniqueConstraint(fields=('club', 'name'), name='product_club_name_unique'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 03:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0004_product_club_name_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='club',
+            name='logo_variants_built',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_variants_built',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+    ]
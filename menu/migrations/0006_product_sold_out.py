@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 03:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0005_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='sold_out',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 04:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0006_product_sold_out'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='club',
+            name='logo_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -2,6 +2,8 @@ from django.db import models
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 
+from .images import ImageVariants
+
 
 class Club(models.Model):
     """Represents a club/bar venue"""
@@ -12,6 +14,9 @@ class Club(models.Model):
     phone = models.CharField(max_length=20, blank=True)
     email = models.EmailField(blank=True)
     logo = models.ImageField(upload_to='clubs/logos/', blank=True, null=True)
+    # Name of the logo the resized variants were built from (menu.images)
+    logo_variants_built = models.CharField(max_length=100, blank=True, editable=False)
+    logo_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -22,6 +27,10 @@ class Club(models.Model):
     def __str__(self):
         return self.name
 
+    @property
+    def logo_variants(self):
+        return ImageVariants(self.logo, self.logo_variants_built, self.logo_width)
+
 
 class Table(models.Model):
     """Represents a table/booth in a club"""
@@ -46,11 +55,18 @@ class Table(models.Model):
 
 class Category(models.Model):
     """Product categories like Beers, Ciders, etc."""
+    STATION_CHOICES = [
+        ('bar', 'Bar'),
+        ('kitchen', 'Kitchen'),
+    ]
+
     name = models.CharField(max_length=100)
     slug = models.SlugField(unique=True)
     description = models.TextField(blank=True)
     icon = models.CharField(max_length=50, blank=True)  # For emoji or icon class
     display_order = models.PositiveIntegerField(default=0)
+    # Where this category's items are prepared (staff pick lists)
+    station = models.CharField(max_length=20, choices=STATION_CHOICES, default='bar')
     is_active = models.BooleanField(default=True)
 
     class Meta:
@@ -69,7 +85,12 @@ class Product(models.Model):
     description = models.TextField(blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(Decimal('0.01'))])
     image = models.ImageField(upload_to='products/', blank=True, null=True)
+    # Name of the image the resized variants were built from (menu.images)
+    image_variants_built = models.CharField(max_length=100, blank=True, editable=False)
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
     is_available = models.BooleanField(default=True)
+    # Set when checkout sold it out (menu.stock), so only those come back on restock
+    sold_out = models.BooleanField(default=False, editable=False)
     stock_quantity = models.PositiveIntegerField(default=0, null=True, blank=True)
     display_order = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -77,12 +98,40 @@ class Product(models.Model):
 
     class Meta:
         ordering = ['category__display_order', 'display_order', 'name']
+        constraints = [
+            # Natural key for bulk menu import (menu.catalogue)
+            models.UniqueConstraint(fields=['club', 'name'], name='product_club_name_unique'),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.club.name}"
 
+    def save(self, *args, **kwargs):
+        # Switched back on by hand, so a later manual switch-off sticks
+        if self.is_available:
+            self.sold_out = False
+        super().save(*args, **kwargs)
+
     @property
     def is_in_stock(self):
         if self.stock_quantity is None:
             return self.is_available
-        return self.is_available and self.stock_quantity > 0
\ No newline at end of file
+        return self.is_available and self.stock_quantity > 0
+
+    @property
+    def image_variants(self):
+        return ImageVariants(self.image, self.image_variants_built, self.image_width)
+
+class CartEntry(models.Model):
+    """Cart line for the database cart store (menu.cart_store.DatabaseCartStore)"""
+    cart_key = models.CharField(max_length=64)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='cart_entries')
+    quantity = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['cart_key', 'product']
+        verbose_name_plural = 'Cart entries'
+
+    def __str__(self):
+        return f"{self.cart_key} - {self.product_id} x{self.quantity}"
@@ -0,0 +1,168 @@
+"""Pre-rendered table QR codes stored in media.
+
+Each image is stored under the club's directory at a path derived from the
+URL it encodes, and that URL includes BASE_URL, the club slug and the table
+number. A code is rendered once, and changing any of those three gives a new
+path, so the old image is never reused; remove_stale_qr_codes() (run by
+generate_qr_codes --prune) deletes the images a club no longer links to. Pages only check that the files exist and
+link to them. ensure_table_qr_codes() can render missing codes across a
+process pool, and render_qr_sheet() lays a club's codes out on printable A4
+pages.
+"""
+
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from .utils import QR_AVAILABLE, generate_qr_code
+
+QR_DIRECTORY = 'qr'
+QR_SIZE = 300
+
+# A4 at 150 dpi
+SHEET_SIZE = (1240, 1754)
+SHEET_COLUMNS = 3
+SHEET_ROWS = 4
+SHEET_MARGIN = 60
+SHEET_PER_PAGE = SHEET_COLUMNS * SHEET_ROWS
+
+
+def table_menu_url(table, base_url=None):
+    if not base_url:
+        base_url = getattr(settings, 'BASE_URL', 'http://localhost:8000')
+    return f"{base_url.rstrip('/')}/{table.club.slug}/table/{table.number}/"
+
+
+def club_qr_directory(club_id):
+    return f'{QR_DIRECTORY}/{club_id}'
+
+
+def qr_code_path(club_id, url):
+    digest = hashlib.sha256(url.encode()).hexdigest()[:24]
+    return f'{club_qr_directory(club_id)}/{digest}.png'
+
+
+def _render_png(url):
+    # Top level so it can run in a worker process
+    return generate_qr_code(url, size=QR_SIZE).read()
+
+
+def ensure_table_qr_codes(tables, base_url=None, processes=None):
+    """
+    Make sure every table has a stored QR image for its current URL.
+
+    Returns ``[(table, url, path), ...]`` in table order. Only missing images
+    are rendered. With ``processes`` > 1 they're rendered in a process pool,
+    which is worth it for a full venue but not for a handful of tables.
+    Returns None when qrcode isn't installed.
+    """
+    if not QR_AVAILABLE:
+        return None
+
+    codes = []
+    missing = {}
+    for table in tables:
+        url = table_menu_url(table, base_url)
+        path = qr_code_path(table.club_id, url)
+        codes.append((table, url, path))
+        if path not in missing and not default_storage.exists(path):
+            missing[path] = url
+
+    if missing:
+        urls = list(missing.values())
+        if processes and processes > 1 and len(urls) > 1:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                images = list(pool.map(_render_png, urls, chunksize=8))
+        else:
+            images = [_render_png(url) for url in urls]
+        for path, image in zip(missing, images):
+            default_storage.save(path, ContentFile(image))
+    return codes
+
+
+def remove_stale_qr_codes(club, codes):
+    """
+    Delete the club's stored QR images that aren't in ``codes``.
+
+    ``codes`` should cover every table the club still prints, as returned by
+    ensure_table_qr_codes(); images left behind by an old slug, base URL or
+    table number are removed. Returns the number of files deleted.
+    """
+    directory = club_qr_directory(club.id)
+    current = {path for _, _, path in codes}
+    try:
+        _, files = default_storage.listdir(directory)
+    except FileNotFoundError:
+        return 0
+    stale = [f'{directory}/{name}' for name in files if f'{directory}/{name}' not in current]
+    for path in stale:
+        default_storage.delete(path)
+    return len(stale)
+
+
+def sheet_page_count(codes):
+    return max(-(-len(codes) // SHEET_PER_PAGE), 1)
+
+
+def sheet_page(codes, page):
+    """The codes printed on ``page`` (1-based) of the sheet."""
+    start = (page - 1) * SHEET_PER_PAGE
+    return codes[start:start + SHEET_PER_PAGE]
+
+
+def render_qr_sheet(club, codes, image_format='PDF'):
+    """
+    Lay QR codes out on A4 pages, SHEET_COLUMNS x SHEET_ROWS per page.
+
+    ``codes`` comes from ensure_table_qr_codes(); pass sheet_page(codes, n)
+    to render a single page. Returns the PDF as bytes (one file, every page)
+    or, for PNG, a list of per-page PNG bytes.
+    """
+    from PIL import Image, ImageDraw, ImageFont
+
+    try:
+        font = ImageFont.load_default(size=28)
+    except TypeError:
+        # Pillow < 10.1 only has the small bitmap font
+        font = ImageFont.load_default()
+
+    width, height = SHEET_SIZE
+    cell_width = (width - 2 * SHEET_MARGIN) // SHEET_COLUMNS
+    cell_height = (height - 2 * SHEET_MARGIN) // SHEET_ROWS
+    code_size = min(cell_width, cell_height - 80)
+
+    pages = []
+    for start in range(0, max(len(codes), 1), SHEET_PER_PAGE):
+        page = Image.new('RGB', SHEET_SIZE, 'white')
+        draw = ImageDraw.Draw(page)
+        draw.text((SHEET_MARGIN, SHEET_MARGIN // 3), club.name, fill='black', font=font)
+        for index, (table, url, path) in enumerate(codes[start:start + SHEET_PER_PAGE]):
+            column, row = index % SHEET_COLUMNS, index // SHEET_COLUMNS
+            left = SHEET_MARGIN + column * cell_width
+            top = SHEET_MARGIN + row * cell_height
+            with default_storage.open(path) as stored:
+                image = Image.open(stored).convert('RGB').resize((code_size, code_size))
+            page.paste(image, (left + (cell_width - code_size) // 2, top))
+            label = f'Table {table.number}'
+            label_width = draw.textlength(label, font=font)
+            draw.text(
+                (left + (cell_width - label_width) / 2, top + code_size + 10),
+                label, fill='black', font=font,
+            )
+        pages.append(page)
+
+    if image_format.upper() == 'PNG':
+        images = []
+        for page in pages:
+            buffer = BytesIO()
+            page.save(buffer, format='PNG')
+            images.append(buffer.getvalue())
+        return images
+
+    buffer = BytesIO()
+    pages[0].save(buffer, format='PDF', save_all=True, append_images=pages[1:], resolution=150)
+    return buffer.getvalue()
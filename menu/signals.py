@@ -0,0 +1,39 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .images import schedule_variants
+from .models import Category, Club, Product
+from .snapshot import invalidate_all_menus, invalidate_menu
+
+
+def _invalidate_built_menu(instance):
+    # Variants are recorded with a queryset update, which sends no post_save
+    invalidate_menu(instance.club_id if isinstance(instance, Product) else instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_menu(sender, instance, **kwargs):
+    invalidate_menu(instance.club_id)
+
+
+@receiver([post_save, post_delete], sender=Club)
+def invalidate_club_menu(sender, instance, **kwargs):
+    invalidate_menu(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_menus(sender, instance, **kwargs):
+    # Categories are shared by every club
+    invalidate_all_menus()
+
+
+@receiver(post_save, sender=Product)
+def build_product_image_variants(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_variants(instance, 'image', 'image_variants_built', on_built=_invalidate_built_menu)
+
+
+@receiver(post_save, sender=Club)
+def build_club_logo_variants(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_variants(instance, 'logo', 'logo_variants_built', on_built=_invalidate_built_menu)
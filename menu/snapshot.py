@@ -0,0 +1,128 @@
+"""Versioned per-club menu snapshots kept in the cache.
+
+A snapshot is a plain dict (categories, products, prices, stock flags) that
+both the HTML menu and the JSON menu API render from. Each club has a version
+number in the cache; saving a Club/Product bumps that club's version, saving a
+Category bumps a global version (categories are shared between clubs). The
+snapshot key embeds both versions, so stale snapshots are simply never read
+again and expire on their own.
+"""
+
+import time
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Product
+
+SNAPSHOT_TTL = 60 * 60 * 6  # a night's worth; versions make it safe to keep long
+
+_GLOBAL_VERSION_KEY = 'buda:menu_version:global'
+
+
+def _club_version_key(club_id):
+    return f'buda:menu_version:club:{club_id}'
+
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so a version lost to eviction never reuses an old number
+        version = int(time.time() * 1000)
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def _bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        _get_version(key)
+
+
+def menu_version(club_id):
+    """Opaque version string for a club's menu; changes whenever the menu does."""
+    return f'{_get_version(_GLOBAL_VERSION_KEY)}.{_get_version(_club_version_key(club_id))}'
+
+
+def invalidate_menu(club_id):
+    _bump_version(_club_version_key(club_id))
+
+
+def invalidate_all_menus():
+    _bump_version(_GLOBAL_VERSION_KEY)
+
+
+def _serialize_product(product):
+    variants = product.image_variants
+    return {
+        'id': product.id,
+        'name': product.name,
+        'description': product.description,
+        'price': str(product.price),
+        'image_url': variants.card,
+        'image_thumb_url': variants.thumb,
+        'image_srcset': variants.jpeg_srcset,
+        'image_webp_srcset': variants.webp_srcset,
+        'is_available': product.is_available,
+        'stock_quantity': product.stock_quantity,
+        'in_stock': product.is_in_stock,
+    }
+
+
+def build_menu_snapshot(club, version=None):
+    """Build a club's menu with a single query (no caching)."""
+    products = (
+        Product.objects.filter(club=club, is_available=True, category__is_active=True)
+        .select_related('category')
+        .order_by('category__display_order', 'category__name', 'display_order', 'name')
+    )
+
+    categories = []
+    by_category = {}
+    for product in products:
+        category = product.category
+        entry = by_category.get(category.id)
+        if entry is None:
+            entry = {
+                'id': category.id,
+                'name': category.name,
+                'slug': category.slug,
+                'icon': category.icon,
+                'products': [],
+            }
+            by_category[category.id] = entry
+            categories.append(entry)
+        entry['products'].append(_serialize_product(product))
+
+    return {
+        'version': version or menu_version(club.id),
+        'built_at': timezone.now().isoformat(),
+        'club': {
+            'id': club.id,
+            'name': club.name,
+            'slug': club.slug,
+        },
+        'categories': categories,
+    }
+
+
+def get_menu_snapshot(club):
+    """Return the cached snapshot for the club's current menu version, building it on a miss."""
+    version = menu_version(club.id)
+    key = f'buda:menu:{club.id}:{version}'
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = build_menu_snapshot(club, version=version)
+        cache.set(key, snapshot, SNAPSHOT_TTL)
+    return snapshot
+
+
+def snapshot_products(snapshot):
+    """Map product id -> product dict for every product in the snapshot."""
+    return {
+        product['id']: product
+        for category in snapshot['categories']
+        for product in category['products']
+    }
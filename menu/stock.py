@@ -0,0 +1,100 @@
+"""Atomic stock reservation for Product.stock_quantity.
+
+Each operation is one conditional UPDATE over all lines of an order
+(``stock_quantity = stock_quantity - n WHERE stock_quantity >= n``), so
+concurrent checkouts only contend on the product rows they touch and never
+read-then-write. Products with ``stock_quantity=None`` aren't tracked and
+always pass.
+
+Menu snapshots are only invalidated when a product sells out or comes back,
+so the stock count shown on the menu can lag between those points; checkout
+is what enforces it.
+"""
+
+from django.db import transaction
+from django.db.models import Case, F, Q, When
+
+from .models import Product
+from .snapshot import invalidate_menu
+
+
+class OutOfStock(Exception):
+    def __init__(self, products):
+        self.products = products
+        names = ', '.join(product.name for product in products)
+        super().__init__(f'Not enough stock for {names}')
+
+
+def _merge(lines):
+    quantities = {}
+    for product_id, quantity in lines:
+        quantities[product_id] = quantities.get(product_id, 0) + int(quantity)
+    return {product_id: quantity for product_id, quantity in quantities.items() if quantity > 0}
+
+
+def reserve_stock(club_id, lines):
+    """
+    Take stock for a club's (product_id, quantity) lines, all or nothing.
+
+    Must run inside the order's transaction so a later failure gives the stock
+    back. Products that reach zero are marked unavailable and sold_out. Raises OutOfStock
+    naming the short lines if any line can't be covered.
+    """
+    quantities = _merge(lines)
+    if not quantities:
+        return
+
+    covered = Q()
+    for product_id, quantity in quantities.items():
+        covered |= Q(pk=product_id) & (Q(stock_quantity__isnull=True) | Q(stock_quantity__gte=quantity))
+
+    try:
+        with transaction.atomic():
+            updated = Product.objects.filter(covered).update(
+                stock_quantity=Case(
+                    *[When(pk=product_id, then=F('stock_quantity') - quantity)
+                      for product_id, quantity in quantities.items()],
+                    default=F('stock_quantity'),
+                    output_field=Product._meta.get_field('stock_quantity'),
+                )
+            )
+            if updated != len(quantities):
+                raise OutOfStock([])
+    except OutOfStock:
+        # The savepoint is rolled back; report which lines were short
+        products = Product.objects.filter(pk__in=quantities).only('name', 'stock_quantity')
+        raise OutOfStock([
+            product for product in products
+            if product.stock_quantity is not None and product.stock_quantity < quantities[product.pk]
+        ]) from None
+
+    # Queryset updates skip the post_save signal, so drop the menu snapshot here
+    if Product.objects.filter(pk__in=quantities, stock_quantity=0, is_available=True).update(
+        is_available=False, sold_out=True,
+    ):
+        transaction.on_commit(lambda: invalidate_menu(club_id))
+
+
+def release_stock(club_id, lines):
+    """
+    Give stock back for (product_id, quantity) lines, e.g. when an order is cancelled.
+
+    Only products that reserve_stock sold out are made available again;
+    ones staff switched off by hand stay off.
+    """
+    quantities = _merge(lines)
+    if not quantities:
+        return
+
+    Product.objects.filter(pk__in=quantities, stock_quantity__isnull=False).update(
+        stock_quantity=Case(
+            *[When(pk=product_id, then=F('stock_quantity') + quantity)
+              for product_id, quantity in quantities.items()],
+            default=F('stock_quantity'),
+            output_field=Product._meta.get_field('stock_quantity'),
+        )
+    )
+    if Product.objects.filter(pk__in=quantities, sold_out=True, stock_quantity__gt=0).update(
+        is_available=True, sold_out=False,
+    ):
+        transaction.on_commit(lambda: invalidate_menu(club_id))
@@ -1,3 +1,650 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import catalogue, images
+from .models import CartEntry, Category, Club, Product, Table
+from .cart_store import CacheCartStore, DatabaseCartStore, get_cart_store
+from .qr import (
+    SHEET_PER_PAGE, ensure_table_qr_codes, remove_stale_qr_codes, render_qr_sheet, sheet_page,
+    sheet_page_count,
+)
+from .snapshot import get_menu_snapshot, menu_version
+
+
+class MenuTestMixin:
+    def setUp(self):
+        cache.clear()
+        self.club = Club.objects.create(name='Test Club', slug='test-club', address='1 Test St')
+        self.table = Table.objects.create(club=self.club, number='7')
+        self.beers = Category.objects.create(name='Beers', slug='beers', display_order=1)
+        self.ciders = Category.objects.create(name='Ciders', slug='ciders', display_order=2)
+        self.castle = Product.objects.create(
+            club=self.club, category=self.beers, name='Castle Lager',
+            price=Decimal('25.00'), stock_quantity=10,
+        )
+        self.savanna = Product.objects.create(
+            club=self.club, category=self.ciders, name='Savanna Dry',
+            price=Decimal('28.00'), stock_quantity=10,
+        )
+        self.menu_url = reverse('menu:menu', args=[self.club.slug, self.table.number])
+
+
+class MenuSnapshotTests(MenuTestMixin, TestCase):
+    def test_snapshot_groups_products_by_category(self):
+        snapshot = get_menu_snapshot(self.club)
+        self.assertEqual([c['slug'] for c in snapshot['categories']], ['beers', 'ciders'])
+        castle = snapshot['categories'][0]['products'][0]
+        self.assertEqual(castle['name'], 'Castle Lager')
+        self.assertEqual(castle['price'], '25.00')
+        self.assertTrue(castle['in_stock'])
+
+    def test_snapshot_excludes_other_clubs_and_unavailable_products(self):
+        other = Club.objects.create(name='Other', slug='other', address='2 Test St')
+        Product.objects.create(club=other, category=self.beers, name='Heineken', price=Decimal('32.00'))
+        Product.objects.create(
+            club=self.club, category=self.beers, name='Black Label',
+            price=Decimal('28.00'), is_available=False,
+        )
+        names = [
+            p['name']
+            for c in get_menu_snapshot(self.club)['categories']
+            for p in c['products']
+        ]
+        self.assertEqual(names, ['Castle Lager', 'Savanna Dry'])
+
+    def test_snapshot_is_served_from_cache(self):
+        get_menu_snapshot(self.club)
+        with CaptureQueriesContext(connection) as ctx:
+            get_menu_snapshot(self.club)
+        self.assertEqual(len(ctx), 0)
+
+    def test_product_save_invalidates_club_menu(self):
+        version = menu_version(self.club.id)
+        self.castle.price = Decimal('27.00')
+        self.castle.save()
+        self.assertNotEqual(menu_version(self.club.id), version)
+        castle = get_menu_snapshot(self.club)['categories'][0]['products'][0]
+        self.assertEqual(castle['price'], '27.00')
+
+    def test_category_save_invalidates_every_club(self):
+        version = menu_version(self.club.id)
+        self.beers.name = 'Lagers'
+        self.beers.save()
+        self.assertNotEqual(menu_version(self.club.id), version)
+        self.assertEqual(get_menu_snapshot(self.club)['categories'][0]['name'], 'Lagers')
+
+    def test_other_club_save_keeps_snapshot(self):
+        other = Club.objects.create(name='Other', slug='other', address='2 Test St')
+        version = menu_version(self.club.id)
+        other.save()
+        self.assertEqual(menu_version(self.club.id), version)
+
+
+class MenuViewTests(MenuTestMixin, TestCase):
+    def test_menu_view_renders_snapshot(self):
+        response = self.client.get(self.menu_url)
+        self.assertContains(response, 'Castle Lager')
+        self.assertContains(response, 'Savanna Dry')
+
+    def test_repeat_scans_skip_menu_query(self):
+        self.client.get(self.menu_url)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(self.menu_url)
+        self.assertFalse(any('menu_product' in q['sql'] for q in ctx.captured_queries))
+
+    def test_menu_api_returns_snapshot(self):
+        response = self.client.get(reverse('menu:menu_api', args=[self.club.slug]))
+        data = response.json()
+        self.assertEqual(data['club']['slug'], 'test-club')
+        self.assertEqual(data['version'], menu_version(self.club.id))
+        self.assertEqual(len(data['categories']), 2)
+        self.assertEqual(response['ETag'], f'"{data["version"]}"')
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_menu_api_answers_304_until_the_menu_changes(self):
+        url = reverse('menu:menu_api', args=[self.club.slug])
+        first = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(first['Content-Encoding'], 'gzip')
+        etag = first['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertFalse(any('menu_product' in q['sql'] for q in ctx.captured_queries))
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        self.castle.price = Decimal('27.00')
+        self.castle.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_page_skips_product_grid_when_browser_has_current_menu(self):
+        full = self.client.get(self.menu_url)
+        self.client.cookies[f'buda_menu_{self.club.id}'] = menu_version(self.club.id)
+        shell = self.client.get(self.menu_url)
+        self.assertTrue(shell.context['menu_cached'])
+        self.assertNotContains(shell, 'data-product-id="%d"' % self.castle.id)
+        self.assertLess(len(shell.content), len(full.content))
+
+        self.castle.save()
+        response = self.client.get(self.menu_url)
+        self.assertContains(response, 'Castle Lager')
+
+
+class CartTests(MenuTestMixin, TestCase):
+    def _post(self, name, payload):
+        return self.client.post(reverse(name), data=payload, content_type='application/json')
+
+    def _fill_cart(self, club, count):
+        slug = f'extras-{Category.objects.count()}'
+        category = Category.objects.create(name=slug, slug=slug)
+        for i in range(count):
+            product = Product.objects.create(
+                club=club, category=category, name=f'{slug} {i}', price=Decimal('10.00'),
+                stock_quantity=10,
+            )
+            self._post('menu:add_to_cart', {'product_id': product.id, 'quantity': 2})
+
+    def test_add_returns_full_cart_state(self):
+        self._post('menu:add_to_cart', {'product_id': self.castle.id, 'quantity': 2})
+        data = self._post('menu:add_to_cart', {'product_id': self.savanna.id}).json()
+        self.assertTrue(data['success'])
+        self.assertEqual(data['cart_count'], 3)
+        self.assertEqual(data['cart']['total'], '78.00')
+        self.assertEqual(
+            [(i['name'], i['quantity'], i['total']) for i in data['cart']['items']],
+            [('Castle Lager', 2, '50.00'), ('Savanna Dry', 1, '28.00')],
+        )
+
+    def test_update_and_remove_return_cart_state(self):
+        self._post('menu:add_to_cart', {'product_id': self.castle.id})
+        self._post('menu:add_to_cart', {'product_id': self.savanna.id})
+        data = self._post('menu:update_cart', {
+            'product_id': self.castle.id, 'quantity': 4, 'club_slug': self.club.slug,
+        }).json()
+        self.assertEqual(data['cart']['total'], '128.00')
+        data = self._post('menu:remove_from_cart', {
+            'product_id': self.savanna.id, 'club_slug': self.club.slug,
+        }).json()
+        self.assertEqual(data['cart_count'], 4)
+        self.assertEqual(data['cart']['total'], '100.00')
+
+    def test_sync_applies_a_batch_and_returns_the_cart(self):
+        self._post('menu:add_to_cart', {'product_id': self.castle.id})
+        data = self._post('menu:sync_cart', {
+            'club_slug': self.club.slug,
+            'operations': [
+                {'op': 'add', 'product_id': self.castle.id, 'quantity': 2},
+                {'op': 'add', 'product_id': self.savanna.id},
+                {'op': 'set', 'product_id': self.savanna.id, 'quantity': 4},
+                {'op': 'add', 'product_id': self.savanna.id, 'quantity': -1},
+            ],
+        }).json()
+        self.assertTrue(data['success'])
+        self.assertEqual(
+            [(i['name'], i['quantity']) for i in data['cart']['items']],
+            [('Castle Lager', 3), ('Savanna Dry', 3)],
+        )
+
+    def test_sync_validates_products_in_one_query(self):
+        extras = [
+            Product.objects.create(
+                club=self.club, category=self.beers, name=f'Extra {i}', price=Decimal('10.00'), stock_quantity=None,
+            )
+            for i in range(10)
+        ]
+        self.client.get(self.menu_url)
+        with CaptureQueriesContext(connection) as ctx:
+            self._post('menu:sync_cart', {
+                'club_slug': self.club.slug,
+                'operations': [{'op': 'add', 'product_id': p.id} for p in extras],
+            })
+        product_queries = [q for q in ctx.captured_queries if 'FROM "menu_product"' in q['sql']]
+        self.assertEqual(len(product_queries), 1)
+
+    def test_sync_is_all_or_nothing(self):
+        other = Club.objects.create(name='Other', slug='other', address='2 Test St')
+        foreign = Product.objects.create(
+            club=other, category=self.beers, name='Elsewhere', price=Decimal('10.00'), stock_quantity=None,
+        )
+        self._post('menu:add_to_cart', {'product_id': self.castle.id})
+        data = self._post('menu:sync_cart', {
+            'club_slug': self.club.slug,
+            'operations': [
+                {'op': 'remove', 'product_id': self.castle.id},
+                {'op': 'add', 'product_id': self.savanna.id},
+                {'op': 'add', 'product_id': foreign.id},
+            ],
+        }).json()
+        self.assertFalse(data['success'])
+        self.assertEqual(data['product_ids'], [foreign.id])
+        cart_key = self.client.session.session_key
+        self.assertEqual(get_cart_store().get(cart_key), {str(self.castle.id): 1})
+
+    def test_sync_replaces_the_cart_with_items(self):
+        self._post('menu:add_to_cart', {'product_id': self.castle.id, 'quantity': 2})
+        data = self._post('menu:sync_cart', {
+            'club_slug': self.club.slug,
+            'items': {str(self.savanna.id): 2},
+        }).json()
+        self.assertEqual([(i['name'], i['quantity']) for i in data['cart']['items']], [('Savanna Dry', 2)])
+
+    def test_unavailable_products_are_pruned(self):
+        self._post('menu:add_to_cart', {'product_id': self.castle.id})
+        self._post('menu:add_to_cart', {'product_id': self.savanna.id})
+        self.savanna.is_available = False
+        self.savanna.save()
+        response = self.client.get(self.menu_url)
+        self.assertEqual(response.context['cart_count'], 1)
+        cart_key = self.client.session.session_key
+        self.assertEqual(get_cart_store().get(cart_key), {str(self.castle.id): 1})
+
+    def test_taps_do_not_write_the_session_table(self):
+        self._post('menu:add_to_cart', {'product_id': self.castle.id})
+        with CaptureQueriesContext(connection) as ctx:
+            self._post('menu:add_to_cart', {'product_id': self.castle.id})
+            self._post('menu:update_cart', {'product_id': self.castle.id, 'quantity': 5})
+        writes = [
+            q['sql'] for q in ctx.captured_queries
+            if 'django_session' in q['sql'] and not q['sql'].startswith('SELECT')
+        ]
+        self.assertEqual(writes, [])
+
+    def test_menu_view_query_count_independent_of_cart_size(self):
+        self._fill_cart(self.club, 1)
+        self.client.get(self.menu_url)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(self.menu_url)
+        self._fill_cart(self.club, 10)
+        self.client.get(self.menu_url)
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(self.menu_url)
+        self.assertEqual(len(small), len(large))
+
+    def test_checkout_query_count_independent_of_cart_size(self):
+        counts = []
+        for slug, size in (('small-club', 1), ('large-club', 10)):
+            club = Club.objects.create(name=slug, slug=slug, address='1 Test St')
+            table = Table.objects.create(club=club, number='1')
+            self._fill_cart(club, size)
+            url = reverse('menu:checkout', args=[club.slug, table.number])
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.post(url, {'payment_method': 'pay_at_table'})
+            self.assertEqual(response.status_code, 302)
+            self.assertEqual(club.orders.get().items.count(), size)
+            counts.append(len(ctx))
+        self.assertEqual(counts[0], counts[1])
+
+
+class CartStoreTestMixin:
+    def test_increment_and_set(self):
+        self.assertEqual(self.store.increment('k', self.castle.id, 2), 2)
+        self.assertEqual(self.store.increment('k', self.castle.id, 3), 5)
+        self.store.set('k', self.savanna.id, 4)
+        self.assertEqual(
+            self.store.get('k'), {str(self.castle.id): 5, str(self.savanna.id): 4},
+        )
+
+    def test_decrement_to_zero_removes_line(self):
+        self.store.increment('k', self.castle.id, 1)
+        self.assertEqual(self.store.increment('k', self.castle.id, -1), 0)
+        self.assertEqual(self.store.get('k'), {})
+        self.assertEqual(self.store.increment('k', self.castle.id, 2), 2)
+        self.assertEqual(self.store.get('k'), {str(self.castle.id): 2})
+
+    def test_carts_are_isolated_and_clearable(self):
+        self.store.increment('a', self.castle.id, 1)
+        self.store.increment('b', self.savanna.id, 1)
+        self.store.clear('a')
+        self.assertEqual(self.store.get('a'), {})
+        self.assertEqual(self.store.get('b'), {str(self.savanna.id): 1})
+
+
+class CacheCartStoreTests(CartStoreTestMixin, MenuTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.store = CacheCartStore()
+
+    def test_readding_a_removed_line_reuses_its_slot(self):
+        for _ in range(5):
+            self.store.increment('k', self.castle.id, 1)
+            self.store.remove('k', self.castle.id)
+        self.store.increment('k', self.castle.id, 2)
+        self.store.set('k', self.savanna.id, 1)
+        self.assertEqual(cache.get(self.store._counter_key('k')), 2)
+        self.assertEqual(self.store.get('k'), {str(self.castle.id): 2, str(self.savanna.id): 1})
+        self.store.clear('k')
+        self.store.increment('k', self.savanna.id, 1)
+        self.assertEqual(self.store.get('k'), {str(self.savanna.id): 1})
+
+    def test_concurrent_increments_are_not_lost(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda _: self.store.increment('k', self.castle.id, 1), range(200)))
+        self.assertEqual(self.store.get('k'), {str(self.castle.id): 200})
+
+
+class DatabaseCartStoreTests(CartStoreTestMixin, MenuTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.store = DatabaseCartStore()
+
+    def test_expired_line_counts_as_empty(self):
+        self.store.increment('k', self.castle.id, 3)
+        expired = timezone.now() - timedelta(seconds=self.store.ttl + 60)
+        CartEntry.objects.filter(cart_key='k').update(updated_at=expired)
+        self.assertEqual(self.store.get('k'), {})
+        self.assertEqual(self.store.increment('k', self.castle.id, 1), 1)
+        self.assertEqual(self.store.get('k'), {str(self.castle.id): 1})
+        CartEntry.objects.filter(cart_key='k').update(updated_at=expired)
+        self.assertEqual(self.store.increment('k', self.castle.id, -1), 0)
+        self.assertFalse(CartEntry.objects.filter(cart_key='k').exists())
+
+
+class TableQRCodeTests(MenuTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media, BASE_URL='https://order.buda.test')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_rendered_once_per_url(self):
+        (table, url, path), = ensure_table_qr_codes([self.table])
+        self.assertEqual(url, 'https://order.buda.test/test-club/table/7/')
+        self.assertTrue(default_storage.exists(path))
+
+        with mock.patch('menu.qr._render_png') as render:
+            ensure_table_qr_codes([self.table])
+        render.assert_not_called()
+
+    def test_changes_to_url_give_a_new_image(self):
+        (_, _, before), = ensure_table_qr_codes([self.table])
+        self.table.number = '8'
+        (_, _, renumbered), = ensure_table_qr_codes([self.table])
+        (_, _, moved), = ensure_table_qr_codes([self.table], base_url='https://new.buda.test')
+        self.assertEqual(len({before, renumbered, moved}), 3)
+        self.assertTrue(all(default_storage.exists(path) for path in (before, renumbered, moved)))
+
+    def test_stale_codes_are_removed(self):
+        (_, _, old), = ensure_table_qr_codes([self.table])
+        self.club.slug = 'renamed-club'
+        codes = ensure_table_qr_codes([self.table])
+        other_club = Club.objects.create(name='Other Club', slug='other-club', address='2 Test St')
+        (_, _, other), = ensure_table_qr_codes([Table.objects.create(club=other_club, number='1')])
+
+        self.assertEqual(remove_stale_qr_codes(self.club, codes), 1)
+        self.assertFalse(default_storage.exists(old))
+        self.assertTrue(default_storage.exists(codes[0][2]))
+        self.assertTrue(default_storage.exists(other))
+        self.assertEqual(remove_stale_qr_codes(self.club, codes), 0)
+
+    def test_command_prunes_only_when_asked(self):
+        (_, _, old), = ensure_table_qr_codes([self.table], base_url='https://old.buda.test')
+        out = io.StringIO()
+        call_command('generate_qr_codes', processes=1, stdout=out)
+        self.assertTrue(default_storage.exists(old))
+        call_command('generate_qr_codes', processes=1, prune=True, stdout=out)
+        self.assertIn('Removed 1 stale QR image(s)', out.getvalue())
+        self.assertFalse(default_storage.exists(old))
+        (_, _, current), = ensure_table_qr_codes([self.table])
+        self.assertTrue(default_storage.exists(current))
+
+    def test_batch_in_process_pool(self):
+        tables = [Table.objects.create(club=self.club, number=str(n)) for n in range(20, 24)]
+        codes = ensure_table_qr_codes(tables, processes=2)
+        self.assertEqual(len(codes), 4)
+        self.assertTrue(all(default_storage.exists(path) for _, _, path in codes))
+
+    def test_sheet_export(self):
+        tables = [Table.objects.create(club=self.club, number=str(n)) for n in range(20, 33)]
+        codes = ensure_table_qr_codes(tables)
+        pdf = render_qr_sheet(self.club, codes)
+        self.assertTrue(pdf.startswith(b'%PDF'))
+        self.assertIn(b'/Count 2', pdf)
+        pages = render_qr_sheet(self.club, codes, image_format='PNG')
+        self.assertEqual(len(pages), 2)
+        self.assertTrue(pages[0].startswith(b'\x89PNG'))
+        self.assertEqual(sheet_page_count(codes), 2)
+        self.assertEqual(sheet_page(codes, 2), codes[SHEET_PER_PAGE:])
+
+
+class MenuCatalogueTests(MenuTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def _csv(self, rows, columns=catalogue.COLUMNS):
+        lines = [','.join(columns)] + [','.join(str(row.get(c, '')) for c in columns) for row in rows]
+        return io.BytesIO('\n'.join(lines).encode())
+
+    def _plan(self, rows, **kwargs):
+        return catalogue.plan_import(catalogue.read_rows(self._csv(rows, **kwargs)))
+
+    def test_export_then_import_is_a_no_op(self):
+        exported = ''.join(catalogue.iter_export(catalogue.export_rows()))
+        plan = catalogue.plan_import(catalogue.read_rows(io.BytesIO(exported.encode())))
+        self.assertEqual(plan.summary(), {'categories': 0, 'created': 0, 'updated': 0, 'unchanged': 2, 'errors': 0})
+
+    def test_plan_reports_diff_and_apply_upserts(self):
+        snapshot_version = menu_version(self.club.id)
+        plan = self._plan([
+            {'club': 'test-club', 'category': 'beers', 'name': 'Castle Lager', 'price': '27.00', 'stock_quantity': 10},
+            {'club': 'test-club', 'category': 'wine', 'category_name': 'Wine', 'name': 'House Red', 'price': '45'},
+        ], columns=['club', 'category', 'category_name', 'name', 'price', 'stock_quantity'])
+        self.assertEqual(plan.diff(), [
+            '+ category wine (Wine)',
+            '+ test-club/House Red R45.00',
+            '~ test-club/Castle Lager: price: 25.00 -> 27.00',
+        ])
+        self.assertEqual(Product.objects.count(), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            catalogue.apply_plan(plan)
+        self.castle.refresh_from_db()
+        self.assertEqual(self.castle.price, Decimal('27.00'))
+        self.assertEqual(self.castle.description, '')
+        red = Product.objects.get(name='House Red')
+        self.assertEqual(red.category.slug, 'wine')
+        self.assertIsNone(red.stock_quantity)
+        self.assertNotEqual(menu_version(self.club.id), snapshot_version)
+
+    def test_row_errors_are_reported(self):
+        plan = self._plan([
+            {'club': 'nowhere', 'category': 'beers', 'name': 'Lost', 'price': '10'},
+            {'club': 'test-club', 'category': 'beers', 'name': 'Free', 'price': '0'},
+        ])
+        self.assertEqual(plan.errors, [(2, 'Unknown club: nowhere'), (3, 'Price must be positive')])
+
+    def test_image_missing_from_zip_and_storage_is_a_row_error(self):
+        plan = self._plan(
+            [{'club': 'test-club', 'category': 'beers', 'name': 'Castle Lager', 'price': '25.00', 'image': 'gone.png'}],
+            columns=['club', 'category', 'name', 'price', 'image'],
+        )
+        self.assertEqual(plan.errors, [(2, 'Image not found: gone.png')])
+        self.assertFalse(plan.has_changes)
+
+    def test_new_products_without_stock_column_are_untracked(self):
+        plan = self._plan(
+            [{'club': 'test-club', 'category': 'beers', 'name': 'Black Label', 'price': '26.00'}],
+            columns=['club', 'category', 'name', 'price'],
+        )
+        catalogue.apply_plan(plan)
+        black_label = Product.objects.get(name='Black Label')
+        self.assertIsNone(black_label.stock_quantity)
+        self.assertTrue(black_label.is_in_stock)
+
+    def test_query_count_grows_with_chunks_not_rows(self):
+        other = Club.objects.create(name='Other', slug='other', address='2 Test St')
+        rows = [
+            {'club': club.slug, 'category': 'beers', 'name': f'Beer {i}', 'price': '20.00'}
+            for club in (self.club, other) for i in range(1500)
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            plan = catalogue.plan_import(catalogue.read_rows(self._csv(rows)), chunk_size=1000)
+            catalogue.apply_plan(plan, chunk_size=1000)
+        self.assertEqual(Product.objects.count(), 3002)
+        reads = [q for q in ctx.captured_queries if q['sql'].startswith('SELECT')]
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT')]
+        # Lookups: at most clubs, categories and products per chunk of 1000 rows
+        self.assertLessEqual(len(reads), 9)
+        # Inserts are batched (SQLite caps a statement at 999 parameters)
+        self.assertLess(len(inserts), len(rows) / 50)
+
+    def test_images_are_attached_from_zip(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as images:
+            images.writestr('photos/castle.png', b'png-bytes')
+        archive.seek(0)
+        images = catalogue.ImageArchive(zipfile.ZipFile(archive))
+        rows = [{'club': 'test-club', 'category': 'beers', 'name': 'Castle Lager', 'price': '25.00', 'image': 'castle.png'}]
+        plan = catalogue.plan_import(
+            catalogue.read_rows(self._csv(rows, columns=['club', 'category', 'name', 'price', 'image'])), images=images,
+        )
+        catalogue.apply_plan(plan, images=images)
+        self.castle.refresh_from_db()
+        self.assertTrue(self.castle.image.name.startswith('products/'))
+        with default_storage.open(self.castle.image.name) as stored:
+            self.assertEqual(stored.read(), b'png-bytes')
+        # Same file again: nothing to change
+        plan = catalogue.plan_import(
+            catalogue.read_rows(self._csv(rows, columns=['club', 'category', 'name', 'price', 'image'])), images=images,
+        )
+        self.assertFalse(plan.has_changes)
+
+    def test_commands_round_trip_json_lines(self):
+        path = os.path.join(tempfile.mkdtemp(), 'menu.jsonl')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path), ignore_errors=True)
+        call_command('export_menu', output=path)
+        with open(path) as exported:
+            lines = [json.loads(line) for line in exported]
+        self.assertEqual([row['name'] for row in lines], ['Castle Lager', 'Savanna Dry'])
+        lines[0]['price'] = '30.00'
+        with open(path, 'w') as changed:
+            changed.writelines(json.dumps(row) + '\n' for row in lines)
+        out = io.StringIO()
+        call_command('import_menu', path, stdout=out)
+        self.assertIn('1 changed', out.getvalue())
+        self.castle.refresh_from_db()
+        self.assertEqual(self.castle.price, Decimal('30.00'))
+
+
+@override_settings(BUDA_IMAGE_VARIANTS_ASYNC=False)
+class ImageVariantTests(MenuTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media, MEDIA_URL='/media/')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def _upload(self, product, size=(2000, 1000), mode='RGB'):
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new(mode, size, 'red').save(buffer, format='PNG')
+        with self.captureOnCommitCallbacks(execute=True):
+            product.image.save('castle.png', ContentFile(buffer.getvalue()))
+        product.refresh_from_db()
+        return product
+
+    def test_upload_builds_downscaled_variants(self):
+        from PIL import Image
+
+        castle = self._upload(self.castle)
+        self.assertEqual(castle.image_variants_built, castle.image.name)
+        widths = {}
+        for variant in images.VARIANTS:
+            for format in images.FORMATS:
+                with default_storage.open(images.variant_path(castle.image.name, variant, format)) as stored:
+                    widths[variant, format] = Image.open(stored).size
+        self.assertEqual(widths['thumb', 'webp'], (160, 80))
+        self.assertEqual(widths['full', 'jpeg'], (1200, 600))
+
+    def test_small_images_are_not_upscaled_and_alpha_is_flattened(self):
+        from PIL import Image
+
+        castle = self._upload(self.castle, size=(300, 300), mode='RGBA')
+        with default_storage.open(images.variant_path(castle.image.name, 'full', 'jpeg')) as stored:
+            self.assertEqual(Image.open(stored).size, (300, 300))
+        self.assertEqual(castle.image_width, 300)
+        srcset = castle.image_variants.srcset()
+        self.assertIn('.thumb.jpg 160w', srcset)
+        self.assertIn('.card.jpg 300w', srcset)
+        self.assertNotIn('.full.jpg', srcset)
+        self.assertNotIn('480w', srcset)
+
+    def test_snapshot_exposes_srcsets_once_built(self):
+        castle = self._upload(self.castle)
+        product = get_menu_snapshot(self.club)['categories'][0]['products'][0]
+        self.assertEqual(product['image_url'], castle.image_variants.card)
+        self.assertTrue(product['image_url'].endswith('.card.jpg'))
+        self.assertIn('.thumb.webp 160w', product['image_webp_srcset'])
+        self.assertIn('.full.jpg 1200w', product['image_srcset'])
+
+        response = self.client.get(self.menu_url)
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, 'loading="lazy"')
+
+    def test_unbuilt_image_falls_back_to_original(self):
+        Product.objects.filter(pk=self.castle.pk).update(image='products/legacy.png')
+        self.castle.refresh_from_db()
+        variants = self.castle.image_variants
+        self.assertFalse(variants.ready)
+        self.assertEqual(variants.card, self.castle.image.url)
+        self.assertEqual(variants.webp_srcset, '')
+
+    def test_backfill_command_builds_missing_variants(self):
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (800, 600), 'blue').save(buffer, format='JPEG')
+        name = default_storage.save('products/savanna.jpg', ContentFile(buffer.getvalue()))
+        Product.objects.filter(pk=self.savanna.pk).update(image=name)
+        Product.objects.filter(pk=self.castle.pk).update(image='products/missing.png')
+
+        out, err = io.StringIO(), io.StringIO()
+        call_command('build_image_variants', stdout=out, stderr=err)
+        self.assertIn('1 image(s), 1 failed', out.getvalue())
+        self.savanna.refresh_from_db()
+        self.assertTrue(self.savanna.image_variants.ready)
+        self.assertTrue(default_storage.exists(images.variant_path(name, 'card', 'webp')))
+
+        out = io.StringIO()
+        Product.objects.filter(pk=self.castle.pk).update(image='')
+        call_command('build_image_variants', stdout=out)
+        self.assertIn('0 image(s)', out.getvalue())
+
+        Product.objects.filter(pk=self.savanna.pk).update(image_width=None)
+        out = io.StringIO()
+        call_command('build_image_variants', stdout=out)
+        self.assertIn('1 image(s)', out.getvalue())
+        self.savanna.refresh_from_db()
+        self.assertEqual(self.savanna.image_width, 800)
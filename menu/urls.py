@@ -6,6 +6,8 @@ app_name = 'menu'
 urlpatterns = [
     path('', views.home_view, name='home'),
     path('<str:club_slug>/table/<str:table_number>/', views.menu_view, name='menu'),
+    path('api/<str:club_slug>/menu/', views.menu_api, name='menu_api'),
+    path('api/cart/sync/', views.sync_cart, name='sync_cart'),
     path('api/add-to-cart/', views.add_to_cart, name='add_to_cart'),
     path('api/update-cart/', views.update_cart, name='update_cart'),
     path('api/remove-from-cart/', views.remove_from_cart, name='remove_from_cart'),
@@ -1,13 +1,23 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.gzip import gzip_page
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.contrib import messages
-from django.db.models import Q
 import json
+import uuid
+from datetime import datetime
 
-from .models import Club, Table, Category, Product
-from orders.models import Order, OrderItem
+from .models import Club, Table
+from .cart import Cart, UnavailableProducts
+from .snapshot import get_menu_snapshot
+from .stock import OutOfStock
+from orders.archive import get_order
+from orders.models import ArchivedOrder, Order
+from orders.placement import find_existing_order, place_order
+from orders.telemetry import WAITING_STATUSES, estimate_ready, orders_ahead
 
 
 def home_view(request):
@@ -21,49 +31,126 @@ def home_view(request):
     return render(request, 'menu/home.html', context)
 
 
+# Rendered width of a product image in the menu grid (col-6 / col-md-4 / col-lg-3)
+PRODUCT_IMAGE_SIZES = '(min-width: 992px) 25vw, (min-width: 768px) 33vw, 50vw'
+
+
+def menu_cookie_name(club):
+    return f'buda_menu_{club.id}'
+
+
 def menu_view(request, club_slug, table_number):
     """Main menu page for customers"""
     club = get_object_or_404(Club, slug=club_slug, is_active=True)
     table = get_object_or_404(Table, club=club, number=table_number, is_active=True)
     
-    # Get all active categories with their products
-    categories = Category.objects.filter(is_active=True).prefetch_related(
-        'products__club'
-    ).filter(products__club=club, products__is_available=True).distinct()
-    
-    # Get cart from session
-    cart = request.session.get('cart', {})
-    cart_items = []
-    cart_total = 0
+    # Categories and products come from the cached per-club snapshot
+    snapshot = get_menu_snapshot(club)
     
-    for product_id, quantity in cart.items():
-        try:
-            product = Product.objects.get(id=product_id, club=club, is_available=True)
-            item_total = product.price * quantity
-            cart_items.append({
-                'product': product,
-                'quantity': quantity,
-                'total': item_total
-            })
-            cart_total += item_total
-        except Product.DoesNotExist:
-            # Remove invalid items from cart
-            del cart[product_id]
-    
-    request.session['cart'] = cart
+    # Cart lines resolve against the same snapshot, so no per-item queries
+    cart = Cart(request)
+    cart_state = cart.resolve(club)
     
     context = {
         'club': club,
         'table': table,
-        'categories': categories,
-        'cart_items': cart_items,
-        'cart_total': cart_total,
-        'cart_count': sum(cart.values()) if cart else 0,
+        'categories': snapshot['categories'],
+        'menu_version': snapshot['version'],
+        # The browser already holds this exact menu (see menu_api): send the
+        # page without the product grid and let it draw from its copy
+        'menu_cached': request.COOKIES.get(menu_cookie_name(club)) == snapshot['version'],
+        'menu_cookie': menu_cookie_name(club),
+        'image_sizes': PRODUCT_IMAGE_SIZES,
+        'cart_items': cart_state.lines,
+        'cart_total': cart_state.total,
+        'cart_count': cart_state.count,
     }
     
     return render(request, 'menu/menu.html', context)
 
 
+@gzip_page
+@require_http_methods(["GET", "HEAD"])
+def menu_api(request, club_slug):
+    """
+    JSON menu for a club, served from the cached snapshot.
+    
+    The ETag is the menu version and Last-Modified the time the snapshot was
+    built, so a client revalidating an unchanged menu gets an empty 304.
+    Responses are gzipped, which makes the ETag weak on the wire; If-None-Match
+    uses the weak comparison, so the version still matches.
+    """
+    club = get_object_or_404(Club, slug=club_slug, is_active=True)
+    snapshot = get_menu_snapshot(club)
+    etag = quote_etag(snapshot['version'])
+    last_modified = int(datetime.fromisoformat(snapshot['built_at']).timestamp())
+    
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = JsonResponse(snapshot)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Cacheable, but always revalidated (a 304 is a few hundred bytes)
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+def _cart_club(data):
+    """Club the cart page belongs to, if the client sent one"""
+    club_slug = data.get('club_slug')
+    if not club_slug:
+        return None
+    return Club.objects.filter(slug=club_slug, is_active=True).first()
+
+
+def _cart_response(cart, club, **extra):
+    """Full recalculated cart state so the page can update without reloading"""
+    state = cart.resolve(club)
+    return JsonResponse({
+        'success': True,
+        'cart_count': state.count,
+        'cart': state.as_dict(),
+        **extra,
+    })
+
+
+def _parse_operations(data):
+    return [
+        (operation['op'], operation['product_id'], operation.get('quantity', 1 if operation['op'] == 'add' else 0))
+        for operation in data.get('operations') or []
+    ]
+
+
+@require_http_methods(["POST"])
+def sync_cart(request):
+    """
+    Apply a batch of cart changes in one request.
+    
+    The body has ``operations`` (``[{"op": "add"|"set"|"remove", "product_id",
+    "quantity"}, ...]``, applied in order) and/or ``items`` (``{product_id:
+    quantity}``, the whole desired cart). The batch is all-or-nothing and the
+    response is the canonical cart.
+    """
+    try:
+        data = json.loads(request.body)
+        items = data.get('items')
+        club = _cart_club(data)
+        
+        cart = Cart(request)
+        cart.apply(_parse_operations(data), items=items, club=club)
+        
+        return _cart_response(cart, club)
+        
+    except UnavailableProducts as e:
+        return JsonResponse({
+            'success': False,
+            'message': 'Some items are no longer available',
+            'product_ids': e.product_ids,
+        })
+    except (AttributeError, KeyError, TypeError, ValueError, json.JSONDecodeError):
+        return JsonResponse({'success': False, 'message': 'Invalid data'})
+
+
 def add_to_cart(request):
     """Add item to cart via AJAX"""
     if request.method == 'POST':
@@ -72,25 +159,19 @@ def add_to_cart(request):
             product_id = data.get('product_id')
             quantity = int(data.get('quantity', 1))
             
-            product = get_object_or_404(Product, id=product_id, is_available=True)
-            
-            # Get or create cart in session
-            cart = request.session.get('cart', {})
-            current_quantity = cart.get(str(product_id), 0)
-            cart[str(product_id)] = current_quantity + quantity
+            cart = Cart(request)
+            products = cart.apply([('add', product_id, quantity)])
+            product = products.get(int(product_id))
+            if product is None:
+                # Removing (a negative quantity) never needs a product lookup
+                return _cart_response(cart, _cart_club(data))
             
-            request.session['cart'] = cart
+            return _cart_response(cart, product.club, message=f'{product.name} added to cart')
             
-            return JsonResponse({
-                'success': True,
-                'cart_count': sum(cart.values()),
-                'message': f'{product.name} added to cart'
-            })
-            
-        except (ValueError, json.JSONDecodeError):
+        except UnavailableProducts:
+            raise Http404('Product not found')
+        except (TypeError, ValueError, json.JSONDecodeError):
             return JsonResponse({'success': False, 'message': 'Invalid data'})
-        except Product.DoesNotExist:
-            return JsonResponse({'success': False, 'message': 'Product not found'})
     
     return JsonResponse({'success': False, 'message': 'Invalid request method'})
 
@@ -100,24 +181,15 @@ def update_cart(request):
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
-            product_id = data.get('product_id')
-            quantity = int(data.get('quantity', 0))
-            
-            cart = request.session.get('cart', {})
             
-            if quantity <= 0:
-                cart.pop(str(product_id), None)
-            else:
-                cart[str(product_id)] = quantity
+            cart = Cart(request)
+            cart.apply([('set', data.get('product_id'), data.get('quantity', 0))])
             
-            request.session['cart'] = cart
+            return _cart_response(cart, _cart_club(data))
             
-            return JsonResponse({
-                'success': True,
-                'cart_count': sum(cart.values()),
-            })
-            
-        except (ValueError, json.JSONDecodeError):
+        except UnavailableProducts:
+            return JsonResponse({'success': False, 'message': 'Product not found'})
+        except (TypeError, ValueError, json.JSONDecodeError):
             return JsonResponse({'success': False, 'message': 'Invalid data'})
     
     return JsonResponse({'success': False, 'message': 'Invalid request method'})
@@ -128,18 +200,13 @@ def remove_from_cart(request):
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
-            product_id = data.get('product_id')
             
-            cart = request.session.get('cart', {})
-            cart.pop(str(product_id), None)
-            request.session['cart'] = cart
+            cart = Cart(request)
+            cart.apply([('remove', data.get('product_id'), 0)])
             
-            return JsonResponse({
-                'success': True,
-                'cart_count': sum(cart.values()),
-            })
+            return _cart_response(cart, _cart_club(data))
             
-        except (ValueError, json.JSONDecodeError):
+        except (TypeError, ValueError, json.JSONDecodeError):
             return JsonResponse({'success': False, 'message': 'Invalid data'})
     
     return JsonResponse({'success': False, 'message': 'Invalid request method'})
@@ -150,59 +217,49 @@ def checkout_view(request, club_slug, table_number):
     club = get_object_or_404(Club, slug=club_slug, is_active=True)
     table = get_object_or_404(Table, club=club, number=table_number, is_active=True)
     
-    cart = request.session.get('cart', {})
+    idempotency_key = request.POST.get('idempotency_key', '')[:64]
+    if request.method == 'POST':
+        # A double-tapped "Place order" lands on the order the first tap created
+        existing = find_existing_order(club, idempotency_key)
+        if existing is not None:
+            return redirect('menu:order_confirmation', order_id=existing.id)
+    
+    cart = Cart(request)
     if not cart:
         messages.warning(request, 'Your cart is empty!')
-        return redirect('menu', club_slug=club_slug, table_number=table_number)
+        return redirect('menu:menu', club_slug=club_slug, table_number=table_number)
     
-    # Build cart items with product details
-    cart_items = []
-    cart_total = 0
+    # Resolve every line with one query; orders need current model prices
+    cart_state = cart.resolve(club, use_snapshot=False)
     
-    for product_id, quantity in cart.items():
+    if request.method == 'POST' and cart_state.lines:
         try:
-            product = Product.objects.get(id=product_id, club=club, is_available=True)
-            item_total = product.price * quantity
-            cart_items.append({
-                'product': product,
-                'quantity': quantity,
-                'total': item_total
-            })
-            cart_total += item_total
-        except Product.DoesNotExist:
-            # Remove invalid items from cart
-            del cart[product_id]
-    
-    request.session['cart'] = cart
-    
-    if request.method == 'POST':
-        # Create order
-        order = Order.objects.create(
-            club=club,
-            table=table,
-            payment_method=request.POST.get('payment_method', 'pay_at_table')
-        )
-        
-        # Create order items
-        for item in cart_items:
-            OrderItem.objects.create(
-                order=order,
-                product=item['product'],
-                quantity=item['quantity'],
-                unit_price=item['product'].price
+            order = place_order(
+                club,
+                table,
+                [(line.product, line.quantity) for line in cart_state.lines],
+                payment_method=request.POST.get('payment_method', 'pay_at_table'),
+                customer_name=request.POST.get('customer_name', '').strip()[:100],
+                customer_phone=request.POST.get('customer_phone', '').strip()[:20],
+                notes=request.POST.get('notes', '').strip(),
+                idempotency_key=idempotency_key,
             )
+        except OutOfStock as e:
+            names = ', '.join(product.name for product in e.products)
+            messages.error(request, f'Sorry, we don\'t have enough {names} left. Please adjust your order.')
+            return redirect('menu:checkout', club_slug=club_slug, table_number=table_number)
         
-        # Clear cart
-        request.session['cart'] = {}
+        cart.clear()
         
         messages.success(request, f'Order #{order.order_number} placed successfully!')
-        return redirect('order_confirmation', order_id=order.id)
+        return redirect('menu:order_confirmation', order_id=order.id)
     
     context = {
         'club': club,
         'table': table,
-        'cart_items': cart_items,
-        'cart_total': cart_total,
+        'cart_items': cart_state.lines,
+        'cart_total': cart_state.total,
+        'idempotency_key': uuid.uuid4().hex,
     }
     
     return render(request, 'menu/checkout.html', context)
@@ -210,10 +267,22 @@ def checkout_view(request, club_slug, table_number):
 
 def order_confirmation(request, order_id):
     """Order confirmation page"""
-    order = get_object_or_404(Order, id=order_id)
+    # Old confirmation links still work once the order has been archived.
+    # The page lists every line with its product, so load them up front.
+    order = get_order(
+        order_id,
+        queryset=Order.objects.select_related('club', 'table').prefetch_related('items__product'),
+        archived_queryset=ArchivedOrder.objects.select_related('club', 'table').prefetch_related('items__product'),
+    )
+    
+    estimate = None
+    if isinstance(order, Order) and order.status in WAITING_STATUSES:
+        category_ids = [item.product.category_id for item in order.items.all()]
+        estimate = estimate_ready(order, category_ids, orders_ahead(order))
     
     context = {
         'order': order,
+        'estimate': estimate,
     }
     
     return render(request, 'menu/order_confirmation.html', context)
\ No newline at end of file
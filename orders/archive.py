@@ -0,0 +1,98 @@
+"""Hot/cold split for finished orders.
+
+Delivered and cancelled orders that haven't changed for
+settings.BUDA_ORDER_ARCHIVE_AFTER_HOURS (default 12, about one night) are
+moved to ArchivedOrder/ArchivedOrderItem. Those tables have the same
+columns and keep the same primary keys, so links to an order keep working
+through get_order(). Each batch is its own short transaction: copy, then
+delete. Live queries (staff board, checkout, confirmation) only ever see a
+night's worth of rows.
+
+Reports read the rollups. The rollup builder reads both tables (see
+admin_dashboard.rollups), so archiving never changes a report.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.http import Http404
+from django.utils import timezone
+
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+ARCHIVE_STATUSES = ('delivered', 'cancelled')
+BATCH_SIZE = 500
+
+
+def archive_age():
+    return timedelta(hours=getattr(settings, 'BUDA_ORDER_ARCHIVE_AFTER_HOURS', 12))
+
+
+def _order_fields():
+    return [field.attname for field in Order._meta.concrete_fields]
+
+
+def _item_fields():
+    return [field.attname for field in OrderItem._meta.concrete_fields]
+
+
+def archive_orders(older_than=None, batch_size=BATCH_SIZE):
+    """
+    Move finished orders untouched for ``older_than`` into the archive.
+
+    Works in batches of ``batch_size`` orders, each in its own transaction,
+    and returns the number of orders moved.
+    """
+    cutoff = timezone.now() - (older_than if older_than is not None else archive_age())
+    finished = Order.objects.filter(status__in=ARCHIVE_STATUSES, updated_at__lt=cutoff)
+    if connection.features.has_select_for_update_skip_locked:
+        # Leave rows a bartender is updating right now for the next run
+        finished = finished.select_for_update(skip_locked=True)
+
+    moved = 0
+    while True:
+        with transaction.atomic():
+            ids = list(finished.order_by('updated_at').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            ArchivedOrder.objects.bulk_create([
+                ArchivedOrder(**row) for row in Order.objects.filter(pk__in=ids).values(*_order_fields())
+            ])
+            items = OrderItem.objects.filter(order_id__in=ids)
+            ArchivedOrderItem.objects.bulk_create([
+                ArchivedOrderItem(**row) for row in items.values(*_item_fields())
+            ])
+            items.delete()
+            Order.objects.filter(pk__in=ids).delete()
+        moved += len(ids)
+    return moved
+
+
+@transaction.atomic
+def restore_order(order_id):
+    """Move one archived order (and its items) back to the live tables."""
+    archived = ArchivedOrder.objects.select_for_update().get(pk=order_id)
+    Order.objects.bulk_create([Order(**{name: getattr(archived, name) for name in _order_fields()})])
+    # bulk_create applies auto_now_add; put the original time back. updated_at
+    # stays "now" so the next archive run leaves the order alone.
+    Order.objects.filter(pk=order_id).update(created_at=archived.created_at)
+    OrderItem.objects.bulk_create([
+        OrderItem(**{name: getattr(item, name) for name in _item_fields()})
+        for item in archived.items.all()
+    ])
+    archived.delete()
+    return Order.objects.get(pk=order_id)
+
+
+def get_order(order_id, queryset=None, archived_queryset=None):
+    """A live order, falling back to the archive; raises Http404 if neither has it."""
+    if queryset is None:
+        queryset = Order.objects.all()
+    if archived_queryset is None:
+        archived_queryset = ArchivedOrder.objects.all()
+    for source in (queryset, archived_queryset):
+        order = source.filter(pk=order_id).first()
+        if order is not None:
+            return order
+    raise Http404('No order matches the given query.')
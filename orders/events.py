@@ -0,0 +1,183 @@
+"""In-process order event channel for the live staff board.
+
+Order placement and status updates publish events after their transaction
+commits; the staff SSE endpoint subscribes per club. Subscribers can be
+threads (WSGI) or asyncio tasks (ASGI). Events only reach subscribers in the
+same process, so run the board behind a single ASGI worker (or swap this
+module for a shared channel layer) when scaling out.
+"""
+
+import asyncio
+import queue
+import threading
+from collections import deque
+
+from django.db import transaction
+from django.utils import timezone
+
+ORDER_CREATED = 'order.created'
+ORDER_STATUS_CHANGED = 'order.status_changed'
+RESYNC = 'resync'
+
+HISTORY_SIZE = 256
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class OrderEvent:
+    __slots__ = ('id', 'club_id', 'type', 'data')
+
+    def __init__(self, id, club_id, type, data):
+        self.id = id
+        self.club_id = club_id
+        self.type = type
+        self.data = data
+
+
+class Subscription:
+    """One connected board. ``club_id=None`` receives every club's events."""
+
+    def __init__(self, club_id=None, loop=None):
+        self.club_id = club_id
+        self.loop = loop
+        self.overflowed = False
+        if loop is None:
+            self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        else:
+            self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def wants(self, event):
+        return self.club_id is None or event.club_id == self.club_id
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except (queue.Full, asyncio.QueueFull):
+            # Too slow to keep up: tell the board to reload instead of buffering forever
+            self.overflowed = True
+
+    def push(self, event):
+        if self.loop is None:
+            self._put(event)
+        else:
+            self.loop.call_soon_threadsafe(self._put, event)
+
+    def get(self, timeout):
+        """Blocking get for WSGI streams; None on timeout (send a keepalive)."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    async def aget(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class Listener:
+    """
+    In-process consumer that handles each event on the publishing thread.
+
+    Unlike a Subscription there is no queue to fall behind on, so it never
+    overflows; ``callback`` must be quick and must not raise.
+    """
+
+    def __init__(self, callback, club_id=None):
+        self.callback = callback
+        self.club_id = club_id
+
+    def wants(self, event):
+        return self.club_id is None or event.club_id == self.club_id
+
+    def push(self, event):
+        self.callback(event)
+
+
+class OrderEventBroker:
+    def __init__(self, history_size=HISTORY_SIZE):
+        self._lock = threading.Lock()
+        self._last_id = 0
+        self._history = deque(maxlen=history_size)
+        self._subscribers = set()
+        self._listeners = set()
+
+    def publish(self, club_id, event_type, data):
+        with self._lock:
+            self._last_id += 1
+            event = OrderEvent(self._last_id, club_id, event_type, data)
+            self._history.append(event)
+            subscribers = [s for s in self._subscribers | self._listeners if s.wants(event)]
+        for subscription in subscribers:
+            subscription.push(event)
+        return event
+
+    def listen(self, callback, club_id=None):
+        """Call ``callback(event)`` for every event published from now on (see Listener)."""
+        listener = Listener(callback, club_id)
+        with self._lock:
+            self._listeners.add(listener)
+        return listener
+
+    def subscribe(self, club_id=None, last_event_id=None, loop=None):
+        """
+        Register a board. With ``last_event_id`` (from an EventSource reconnect)
+        missed events still in history are replayed; if they've already been
+        dropped a resync event is queued instead.
+        """
+        subscription = Subscription(club_id, loop)
+        with self._lock:
+            self._subscribers.add(subscription)
+            if last_event_id is not None:
+                oldest = self._history[0].id if self._history else self._last_id + 1
+                # Ahead of us means this process restarted; behind history means events were dropped
+                if last_event_id > self._last_id or last_event_id + 1 < oldest:
+                    subscription._put(OrderEvent(self._last_id, club_id, RESYNC, {}))
+                else:
+                    for event in self._history:
+                        if event.id > last_event_id and subscription.wants(event):
+                            subscription._put(event)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+            self._listeners.discard(subscription)
+
+    @property
+    def subscriber_count(self):
+        """Connected boards; listeners aren't counted."""
+        return len(self._subscribers)
+
+
+broker = OrderEventBroker()
+
+
+def order_payload(order, items):
+    """Everything a board needs to draw an order card without another request."""
+    return {
+        'id': order.id,
+        'order_number': order.order_number,
+        'club_id': order.club_id,
+        'table': order.table.number,
+        'status': order.status,
+        'status_display': order.get_status_display(),
+        'total_amount': str(order.total_amount),
+        'created_at': timezone.localtime(order.created_at).strftime('%H:%M'),
+        'notes': order.notes,
+        'items': [
+            {
+                'product_id': item.product_id,
+                'category_id': item.product.category_id,
+                'name': item.product.name,
+                'quantity': item.quantity,
+            }
+            for item in items
+        ],
+    }
+
+
+def publish_on_commit(order, items, event_type, **extra):
+    data = {**order_payload(order, items), **extra}
+    # Already committed: a failing consumer mustn't turn that into an error
+    transaction.on_commit(lambda: broker.publish(order.club_id, event_type, data), robust=True)
@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.archive import BATCH_SIZE, archive_age, archive_orders, restore_order
+from orders.models import ArchivedOrder
+
+
+class Command(BaseCommand):
+    help = 'Move finished orders into the archive tables (or restore one with --restore).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-hours', type=float,
+            help=f'Archive orders finished at least this long ago (default {archive_age()}).',
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--restore', type=int, metavar='ORDER_ID', help='Restore one archived order.')
+
+    def handle(self, *args, **options):
+        if options['restore']:
+            try:
+                order = restore_order(options['restore'])
+            except ArchivedOrder.DoesNotExist:
+                raise CommandError(f"Order {options['restore']} is not in the archive.")
+            self.stdout.write(self.style.SUCCESS(f'Restored order #{order.order_number}'))
+            return
+
+        older_than = None
+        if options['older_than_hours'] is not None:
+            older_than = timedelta(hours=options['older_than_hours'])
+        moved = archive_orders(older_than=older_than, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Archived {moved} order(s)'))
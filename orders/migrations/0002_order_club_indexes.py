@@ -0,0 +1,22 @@
+# Generated by Django 5.2 on 2026-10-18 03:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0002_cartentry'),
+        ('orders', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['club', 'status', '-created_at'], name='order_club_status_created'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['club', '-created_at'], name='order_club_created'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2 on 2026-10-18 03:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0002_cartentry'),
+        ('orders', '0002_order_club_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderNumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_number', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='order_number',
+            field=models.CharField(max_length=20),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(fields=('club', 'order_number'), name='order_club_number_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('idempotency_key', ''), _negated=True), fields=('club', 'idempotency_key'), name='order_club_idempotency_key_unique'),
+        ),
+        migrations.AddField(
+            model_name='ordernumbersequence',
+            name='club',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='order_number_sequence', to='menu.club'),
+        ),
+    ]
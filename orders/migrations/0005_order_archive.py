@@ -0,0 +1,68 @@
+# Generated by Django 5.2 on 2026-10-18 03:21
+
+import django.core.validators
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0002_cartentry'),
+        ('orders', '0004_order_rollup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_number', models.CharField(max_length=20)),
+                ('idempotency_key', models.CharField(blank=True, max_length=64)),
+                ('status', models.CharField(choices=[('received', 'Received'), ('in_progress', 'In Progress'), ('ready', 'Ready'), ('delivered', 'Delivered'), ('cancelled', 'Cancelled')], default='received', max_length=20)),
+                ('payment_status', models.CharField(choices=[('pending', 'Pending'), ('paid_at_table', 'Paid at Table'), ('paid_online', 'Paid Online'), ('failed', 'Payment Failed')], default='pending', max_length=20)),
+                ('payment_method', models.CharField(blank=True, max_length=50)),
+                ('customer_name', models.CharField(blank=True, max_length=100)),
+                ('customer_phone', models.CharField(blank=True, max_length=20)),
+                ('subtotal', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10)),
+                ('tax_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10)),
+                ('delivered_at', models.DateTimeField(blank=True, null=True)),
+                ('notes', models.TextField(blank=True)),
+                ('staff_notes', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('club', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_orders', to='menu.club')),
+                ('table', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_orders', to='menu.table')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrderItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(1)])),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('total_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('notes', models.TextField(blank=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='orders.archivedorder')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='menu.product')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['club', '-created_at'], name='archived_order_club_created'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['-created_at'], name='archived_order_created'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='archivedorderitem',
+            unique_together={('order', 'product')},
+        ),
+    ]
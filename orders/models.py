@@ -1,11 +1,38 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 from menu.models import Club, Table, Product
 
 
-class Order(models.Model):
-    """Customer order from a specific table"""
+class OrderNumberSequence(models.Model):
+    """Per-club order number counter"""
+    club = models.OneToOneField(Club, on_delete=models.CASCADE, related_name='order_number_sequence')
+    last_number = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.club.name} - {self.last_number}"
+
+    @classmethod
+    def next_number(cls, club):
+        """
+        Allocate the club's next order number.
+
+        The counter row is bumped with a single UPDATE ... SET last_number =
+        last_number + 1, which takes the row lock, so concurrent checkouts
+        can't read the same value. The lock is held until the surrounding
+        transaction commits, so call this outside other transactions (as
+        place_order does) to keep it to this one statement.
+        """
+        with transaction.atomic():
+            if not cls.objects.filter(club=club).update(last_number=F('last_number') + 1):
+                cls.objects.get_or_create(club=club)
+                cls.objects.filter(club=club).update(last_number=F('last_number') + 1)
+            return cls.objects.filter(club=club).values_list('last_number', flat=True).get()
+
+
+class BaseOrder(models.Model):
+    """Columns shared by live orders and the archive (see archive.py)"""
     STATUS_CHOICES = [
         ('received', 'Received'),
         ('in_progress', 'In Progress'),
@@ -21,9 +48,9 @@ class Order(models.Model):
         ('failed', 'Payment Failed'),
     ]
 
-    club = models.ForeignKey(Club, on_delete=models.CASCADE, related_name='orders')
-    table = models.ForeignKey(Table, on_delete=models.CASCADE, related_name='orders')
-    order_number = models.CharField(max_length=20, unique=True)
+    order_number = models.CharField(max_length=20)
+    # Client-generated per checkout form so a double-tapped "Place order" creates one order
+    idempotency_key = models.CharField(max_length=64, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='received')
     payment_status = models.CharField(max_length=20, choices=PAYMENT_STATUS_CHOICES, default='pending')
     payment_method = models.CharField(max_length=50, blank=True)  # cash, card, snapscan, etc.
@@ -40,6 +67,8 @@ class Order(models.Model):
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # When the order entered its current status; null until its first status change
+    status_changed_at = models.DateTimeField(null=True, blank=True)
     delivered_at = models.DateTimeField(null=True, blank=True)
     
     # Notes
@@ -47,31 +76,63 @@ class Order(models.Model):
     staff_notes = models.TextField(blank=True)
 
     class Meta:
-        ordering = ['-created_at']
+        abstract = True
 
     def __str__(self):
         return f"Order #{self.order_number} - Table {self.table.number}"
 
-    def save(self, *args, **kwargs):
-        if not self.order_number:
-            # Generate order number: club_slug + timestamp
-            import time
-            timestamp = str(int(time.time()))[-6:]  # Last 6 digits of timestamp
-            self.order_number = f"{self.club.slug.upper()}{timestamp}"
-        super().save(*args, **kwargs)
-
-    def calculate_totals(self):
-        """Calculate order totals from order items"""
-        self.subtotal = sum(item.total_price for item in self.items.all())
+    def apply_totals(self, subtotal):
+        """Set subtotal, tax and total from an already-known subtotal (no save)"""
+        self.subtotal = subtotal
         # For now, no tax calculation - can be added later
         self.tax_amount = Decimal('0.00')
         self.total_amount = self.subtotal + self.tax_amount
+
+    def calculate_totals(self):
+        """Calculate order totals from order items"""
+        self.apply_totals(sum((item.total_price for item in self.items.all()), Decimal('0.00')))
         self.save(update_fields=['subtotal', 'tax_amount', 'total_amount'])
 
 
-class OrderItem(models.Model):
-    """Individual items in an order"""
-    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
+class Order(BaseOrder):
+    """Customer order from a specific table"""
+    club = models.ForeignKey(Club, on_delete=models.CASCADE, related_name='orders')
+    table = models.ForeignKey(Table, on_delete=models.CASCADE, related_name='orders')
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['club', 'order_number'], name='order_club_number_unique'),
+            models.UniqueConstraint(
+                fields=['club', 'idempotency_key'],
+                condition=~Q(idempotency_key=''),
+                name='order_club_idempotency_key_unique',
+            ),
+        ]
+        indexes = [
+            # Staff status board: open orders for one club, newest first
+            models.Index(fields=['club', 'status', '-created_at'], name='order_club_status_created'),
+            # Recent orders for one club
+            models.Index(fields=['club', '-created_at'], name='order_club_created'),
+            # Recent orders across clubs (admin dashboard)
+            models.Index(fields=['-created_at'], name='order_created'),
+            # Sales rollup high-water mark scan
+            models.Index(fields=['updated_at'], name='order_updated'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self.order_number:
+            self.order_number = self.format_order_number(self.club, OrderNumberSequence.next_number(self.club))
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def format_order_number(club, number):
+        """Short per-club number, e.g. TEST-CLUB-0042"""
+        return f"{club.slug.upper()[:11]}-{number:04d}"
+
+
+class BaseOrderItem(models.Model):
+    """Columns shared by live order items and the archive"""
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)])
     unit_price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -81,14 +142,72 @@ class OrderItem(models.Model):
     notes = models.TextField(blank=True)
 
     class Meta:
-        unique_together = ['order', 'product']
+        abstract = True
 
     def __str__(self):
         return f"{self.product.name} x{self.quantity} - {self.order.order_number}"
 
+
+class OrderItem(BaseOrderItem):
+    """Individual items in an order"""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
+
+    class Meta:
+        unique_together = ['order', 'product']
+
     def save(self, *args, **kwargs):
         self.total_price = self.quantity * self.unit_price
         super().save(*args, **kwargs)
         
         # Update order totals when item is saved
-        self.order.calculate_totals()
\ No newline at end of file
+        self.order.calculate_totals()
+
+
+class ArchivedOrder(BaseOrder):
+    """Delivered or cancelled order moved out of the live table by archive.py"""
+    club = models.ForeignKey(Club, on_delete=models.CASCADE, related_name='archived_orders')
+    table = models.ForeignKey(Table, on_delete=models.CASCADE, related_name='archived_orders')
+    # Copied from the live row, so no auto_now/auto_now_add here
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['club', '-created_at'], name='archived_order_club_created'),
+            models.Index(fields=['-created_at'], name='archived_order_created'),
+        ]
+
+
+class ArchivedOrderItem(BaseOrderItem):
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='items')
+
+    class Meta:
+        unique_together = ['order', 'product']
+
+
+class OrderStatusEvent(models.Model):
+    """
+    One status change of an order, written by the staff status update.
+
+    ``order_id`` is a plain column rather than a foreign key so the log
+    outlives archiving (archive.py deletes the live row). ``duration`` is how
+    long the order sat in ``from_status``, in seconds.
+    """
+    club = models.ForeignKey(Club, on_delete=models.CASCADE, related_name='order_status_events')
+    order_id = models.PositiveIntegerField()
+    from_status = models.CharField(max_length=20, choices=BaseOrder.STATUS_CHOICES)
+    to_status = models.CharField(max_length=20, choices=BaseOrder.STATUS_CHOICES)
+    duration = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['order_id', 'created_at'], name='order_status_event_order'),
+            models.Index(fields=['club', 'created_at'], name='order_status_event_club'),
+        ]
+
+    def __str__(self):
+        return f"Order {self.order_id}: {self.from_status} -> {self.to_status}"
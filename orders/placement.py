@@ -0,0 +1,104 @@
+"""Order placement: one transaction, one bulk insert, totals computed once."""
+
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+
+from menu.stock import reserve_stock
+
+from .events import ORDER_CREATED, publish_on_commit
+from .models import Order, OrderItem, OrderNumberSequence
+
+
+def build_order_items(lines):
+    """
+    Merge (product, quantity) pairs into unsaved OrderItems.
+
+    Quantities for the same product are summed so the (order, product)
+    unique constraint holds; lines with a non-positive quantity are dropped.
+    """
+    merged = {}
+    for product, quantity in lines:
+        quantity = int(quantity)
+        if quantity <= 0:
+            continue
+        if product.pk in merged:
+            merged[product.pk].quantity += quantity
+        else:
+            merged[product.pk] = OrderItem(
+                product=product,
+                quantity=quantity,
+                unit_price=product.price,
+            )
+    items = list(merged.values())
+    for item in items:
+        item.total_price = item.quantity * item.unit_price
+    return items
+
+
+def find_existing_order(club, idempotency_key):
+    if not idempotency_key:
+        return None
+    return Order.objects.filter(club=club, idempotency_key=idempotency_key).first()
+
+
+def place_order(club, table, lines, payment_method='pay_at_table', idempotency_key='', **order_fields):
+    """
+    Create an Order and all of its OrderItems.
+
+    Runs a fixed number of queries regardless of cart size: the order row is
+    inserted with its totals already set and the items go in with a single
+    bulk_create, so OrderItem.save() (and its calculate_totals() call) is
+    never triggered here. Stock is taken with one conditional update
+    (menu.stock.reserve_stock), which raises OutOfStock and leaves nothing
+    behind if any line can't be covered. Staff boards get an order.created
+    event on commit.
+
+    A repeated ``idempotency_key`` for the same club returns the order that
+    was already placed instead of creating another one.
+
+    The order number is taken in its own transaction first, so the club's
+    counter row is only locked for one UPDATE and concurrent checkouts don't
+    queue behind each other's placement. A checkout that then fails (e.g.
+    OutOfStock) leaves a gap in the numbers.
+    """
+    items = build_order_items(lines)
+    if not items:
+        raise ValueError('Cannot place an order without items')
+
+    existing = find_existing_order(club, idempotency_key)
+    if existing is not None:
+        return existing
+    order_fields = {
+        'order_number': Order.format_order_number(club, OrderNumberSequence.next_number(club)),
+        **order_fields,
+    }
+    try:
+        return _create_order(club, table, items, payment_method, idempotency_key, order_fields)
+    except IntegrityError:
+        # Lost the race against an identical submission
+        existing = find_existing_order(club, idempotency_key)
+        if existing is None:
+            raise
+        return existing
+
+
+@transaction.atomic
+def _create_order(club, table, items, payment_method, idempotency_key, order_fields):
+    reserve_stock(club.id, [(item.product_id, item.quantity) for item in items])
+
+    order = Order(
+        club=club,
+        table=table,
+        payment_method=payment_method,
+        idempotency_key=idempotency_key,
+        **order_fields,
+    )
+    order.apply_totals(sum((item.total_price for item in items), Decimal('0.00')))
+    order.save()
+
+    for item in items:
+        item.order = order
+    OrderItem.objects.bulk_create(items)
+    publish_on_commit(order, items, ORDER_CREATED)
+    return order
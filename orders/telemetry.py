@@ -0,0 +1,189 @@
+"""Prep-time telemetry and the customer wait estimate.
+
+Every staff status change writes an OrderStatusEvent, which records how long
+the order sat in its previous status. Forward moves are also stage samples:
+
+- queue: received -> in_progress
+- prep: in_progress -> ready
+- serve: ready -> delivered
+
+Each sample goes into rolling windows in the cache, keyed by club, stage,
+local hour the stage started, and product category. Every window also has
+an "any" hour and an "any" category bucket. A window keeps its last
+WINDOW_SIZE samples and its p50/p90, recomputed on write. Reading an
+estimate is then a single cache get_many whatever the history size.
+Concurrent writers can drop the odd sample, which is fine for a rolling
+median.
+
+estimate_ready() combines those medians with the number of open orders
+ahead to give an estimated ready time for the confirmation page.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Order, OrderStatusEvent
+
+STAGES = {
+    ('received', 'in_progress'): 'queue',
+    ('in_progress', 'ready'): 'prep',
+    ('ready', 'delivered'): 'serve',
+}
+# Stages still to go before an order in a status is ready
+REMAINING_STAGES = {
+    'received': ('queue', 'prep'),
+    'in_progress': ('prep',),
+}
+WAITING_STATUSES = tuple(REMAINING_STAGES)
+ANY = 'any'
+WINDOW_SIZE = 100
+WINDOW_TTL = 60 * 60 * 24 * 14
+DEFAULT_STAGE_SECONDS = {'queue': 180, 'prep': 420}
+
+
+def _window_key(club_id, stage, hour, category):
+    return f'buda:prep:{club_id}:{stage}:{hour}:{category}'
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def record_status_change(order, previous_status, category_ids, now=None):
+    """
+    Log ``order``'s move out of ``previous_status`` and feed the stage windows.
+
+    Call inside the status update's transaction. The rolling windows are
+    updated on commit, so a rolled back change leaves no sample behind.
+    """
+    now = now or timezone.now()
+    entered_at = OrderStatusEvent.objects.filter(order_id=order.id).order_by('-created_at').values_list(
+        'created_at', flat=True
+    ).first() or order.created_at
+    duration = max(0, int((now - entered_at).total_seconds()))
+    OrderStatusEvent.objects.create(
+        club_id=order.club_id,
+        order_id=order.id,
+        from_status=previous_status,
+        to_status=order.status,
+        duration=duration,
+    )
+
+    stage = STAGES.get((previous_status, order.status))
+    if stage is not None:
+        hour = timezone.localtime(entered_at).hour
+        categories = set(category_ids)
+        transaction.on_commit(lambda: add_sample(order.club_id, stage, hour, categories, duration))
+
+
+def add_sample(club_id, stage, hour, category_ids, seconds):
+    keys = [
+        _window_key(club_id, stage, window_hour, category)
+        for window_hour in (hour, ANY)
+        for category in (*category_ids, ANY)
+    ]
+    windows = cache.get_many(keys)
+    updated = {}
+    for key in keys:
+        samples = windows.get(key, {}).get('samples', [])
+        samples = (samples + [seconds])[-WINDOW_SIZE:]
+        ordered = sorted(samples)
+        updated[key] = {
+            'samples': samples,
+            'p50': _percentile(ordered, 0.5),
+            'p90': _percentile(ordered, 0.9),
+        }
+    cache.set_many(updated, WINDOW_TTL)
+
+
+def stage_stats(club_id, stage, hour, category_ids):
+    """
+    (p50, p90) seconds for a stage, the slowest of the order's categories.
+
+    Falls back from this hour to any hour, then to the club-wide window,
+    then to DEFAULT_STAGE_SECONDS when nothing has been recorded yet.
+    """
+    return _stage_stats(_windows(club_id, [stage], hour, category_ids), club_id, stage, hour, category_ids)
+
+
+def _windows(club_id, stages, hour, category_ids):
+    keys = [
+        _window_key(club_id, stage, window_hour, category)
+        for stage in stages
+        for window_hour in (hour, ANY)
+        for category in (*category_ids, ANY)
+    ]
+    return cache.get_many(keys)
+
+
+def _stage_stats(windows, club_id, stage, hour, category_ids):
+    def lookup(category):
+        for window_hour in (hour, ANY):
+            window = windows.get(_window_key(club_id, stage, window_hour, category))
+            if window is not None:
+                return window['p50'], window['p90']
+        return None
+
+    found = [stats for stats in map(lookup, category_ids) if stats is not None]
+    if found:
+        return max(p50 for p50, _ in found), max(p90 for _, p90 in found)
+    stats = lookup(ANY)
+    if stats is not None:
+        return stats
+    seconds = DEFAULT_STAGE_SECONDS[stage]
+    return seconds, seconds * 3 // 2
+
+
+def estimate_ready(order, category_ids, orders_ahead, now=None):
+    """
+    Estimated ready time for an open order, or None once it's ready.
+
+    Returns ``{'ready_at', 'latest', 'minutes', 'max_minutes'}`` where
+    ``ready_at``/``minutes`` come from the stage medians and ``latest``/
+    ``max_minutes`` from the p90s. A received order waits at least the
+    typical queue time, or longer when there are more orders ahead than the
+    bar gets through in that time (settings.BUDA_PREP_PARALLELISM orders in
+    parallel, default 3).
+    """
+    stages = REMAINING_STAGES.get(order.status)
+    if not stages:
+        return None
+    now = now or timezone.now()
+    hour = timezone.localtime(now).hour
+    category_ids = list(set(category_ids))
+    windows = _windows(order.club_id, stages, hour, category_ids)
+    stats = {stage: _stage_stats(windows, order.club_id, stage, hour, category_ids) for stage in stages}
+
+    typical, slow = 0, 0
+    if 'queue' in stats:
+        parallelism = getattr(settings, 'BUDA_PREP_PARALLELISM', 3)
+        prep_p50, prep_p90 = stats['prep']
+        queue_p50, queue_p90 = stats['queue']
+        typical += max(queue_p50, orders_ahead * prep_p50 // parallelism)
+        slow += max(queue_p90, orders_ahead * prep_p90 // parallelism)
+    typical += stats['prep'][0]
+    slow += stats['prep'][1]
+
+    # Time already spent in the current status counts towards the wait. Not
+    # updated_at: editing a note would restart the clock
+    entered_at = order.status_changed_at or order.created_at
+    elapsed = max(0, int((now - entered_at).total_seconds()))
+    typical = max(60, typical - elapsed)
+    slow = max(typical, slow - elapsed)
+    return {
+        'ready_at': now + timedelta(seconds=typical),
+        'latest': now + timedelta(seconds=slow),
+        'minutes': -(-typical // 60),
+        'max_minutes': -(-slow // 60),
+    }
+
+
+def orders_ahead(order):
+    """Open orders for the same club placed before ``order`` (club/status index)."""
+    return Order.objects.filter(
+        club_id=order.club_id, status__in=WAITING_STATUSES, created_at__lt=order.created_at
+    ).count()
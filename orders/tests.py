@@ -1,3 +1,452 @@
-from django.test import TestCase
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from menu.models import Category, Club, Product, Table
+from menu.snapshot import get_menu_snapshot
+from menu.stock import OutOfStock
+from .archive import archive_orders, restore_order
+from .models import ArchivedOrder, Order, OrderItem, OrderNumberSequence, OrderStatusEvent
+from .placement import place_order
+from .telemetry import add_sample, estimate_ready, stage_stats
+from .transitions import change_status
+
+
+class OrderPlacementTests(TestCase):
+    def setUp(self):
+        self.club = Club.objects.create(name='Test Club', slug='test-club', address='1 Test St')
+        self.table = Table.objects.create(club=self.club, number='7')
+        self.category = Category.objects.create(name='Beers', slug='beers')
+        self.products = [
+            Product.objects.create(
+                club=self.club,
+                category=self.category,
+                name=f'Beer {i}',
+                price=Decimal('25.00') + i,
+                stock_quantity=None,
+            )
+            for i in range(10)
+        ]
+
+    def _place(self, count, **kwargs):
+        return place_order(self.club, self.table, [(p, 2) for p in self.products[:count]], **kwargs)
+
+    def test_totals_computed_in_memory(self):
+        order = self._place(3)
+        order.refresh_from_db()
+        self.assertEqual(order.subtotal, Decimal('156.00'))
+        self.assertEqual(order.tax_amount, Decimal('0.00'))
+        self.assertEqual(order.total_amount, Decimal('156.00'))
+        self.assertEqual(order.items.count(), 3)
+        self.assertEqual(
+            sorted(order.items.values_list('total_price', flat=True)),
+            [Decimal('50.00'), Decimal('52.00'), Decimal('54.00')],
+        )
+
+    def test_query_count_is_constant(self):
+        self._place(1)
+        with CaptureQueriesContext(connection) as single:
+            self._place(1)
+        with CaptureQueriesContext(connection) as many:
+            self._place(10)
+        self.assertEqual(len(single), len(many))
+        self.assertLessEqual(len(many), 12)
+
+    def test_duplicate_lines_are_merged(self):
+        product = self.products[0]
+        order = place_order(self.club, self.table, [(product, 1), (product, 2)])
+        item = order.items.get()
+        self.assertEqual(item.quantity, 3)
+        self.assertEqual(order.total_amount, Decimal('75.00'))
+
+    def test_empty_order_rejected(self):
+        with self.assertRaises(ValueError):
+            place_order(self.club, self.table, [(self.products[0], 0)])
+        self.assertFalse(Order.objects.exists())
+
+    def test_item_save_still_recalculates_totals(self):
+        order = self._place(2)
+        item = order.items.get(product=self.products[0])
+        item.quantity = 5
+        item.save()
+        order.refresh_from_db()
+        self.assertEqual(order.total_amount, Decimal('177.00'))
+
+        OrderItem.objects.filter(order=order, product=self.products[1]).delete()
+        order.calculate_totals()
+        order.refresh_from_db()
+        self.assertEqual(order.total_amount, Decimal('125.00'))
+
+
+class OrderNumberTests(TestCase):
+    def setUp(self):
+        self.club = Club.objects.create(name='Test Club', slug='test-club', address='1 Test St')
+        self.table = Table.objects.create(club=self.club, number='7')
+        category = Category.objects.create(name='Beers', slug='beers')
+        self.product = Product.objects.create(
+            club=self.club, category=category, name='Castle Lager', price=Decimal('25.00'),
+            stock_quantity=None,
+        )
+
+    def test_numbers_increase_per_club(self):
+        other = Club.objects.create(name='Other', slug='other', address='2 Test St')
+        numbers = [OrderNumberSequence.next_number(self.club) for _ in range(3)]
+        self.assertEqual(numbers, [1, 2, 3])
+        self.assertEqual(OrderNumberSequence.next_number(other), 1)
+
+    def test_order_number_format(self):
+        first = place_order(self.club, self.table, [(self.product, 1)])
+        second = place_order(self.club, self.table, [(self.product, 1)])
+        self.assertEqual(first.order_number, 'TEST-CLUB-0001')
+        self.assertEqual(second.order_number, 'TEST-CLUB-0002')
+
+    def test_idempotency_key_returns_existing_order(self):
+        first = place_order(self.club, self.table, [(self.product, 1)], idempotency_key='abc')
+        again = place_order(self.club, self.table, [(self.product, 1)], idempotency_key='abc')
+        self.assertEqual(first.pk, again.pk)
+        self.assertEqual(Order.objects.count(), 1)
+        place_order(self.club, self.table, [(self.product, 1)])
+        place_order(self.club, self.table, [(self.product, 1)])
+        self.assertEqual(Order.objects.count(), 3)
+
+    def test_double_tapped_checkout_creates_one_order(self):
+        self.client.post(
+            reverse('menu:add_to_cart'),
+            data={'product_id': self.product.id, 'quantity': 2},
+            content_type='application/json',
+        )
+        url = reverse('menu:checkout', args=[self.club.slug, self.table.number])
+        first = self.client.post(url, {'payment_method': 'pay_at_table', 'idempotency_key': 'tap'})
+        second = self.client.post(url, {'payment_method': 'pay_at_table', 'idempotency_key': 'tap'})
+        order = Order.objects.get()
+        confirmation = reverse('menu:order_confirmation', args=[order.id])
+        self.assertRedirects(first, confirmation, fetch_redirect_response=False)
+        self.assertRedirects(second, confirmation, fetch_redirect_response=False)
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.club = Club.objects.create(name='Test Club', slug='test-club', address='1 Test St')
+        self.table = Table.objects.create(club=self.club, number='7')
+        category = Category.objects.create(name='Beers', slug='beers')
+        self.lager = Product.objects.create(
+            club=self.club, category=category, name='Castle Lager', price=Decimal('25.00'),
+            stock_quantity=5,
+        )
+        self.cider = Product.objects.create(
+            club=self.club, category=category, name='Savanna Dry', price=Decimal('28.00'),
+            stock_quantity=2,
+        )
+        self.untracked = Product.objects.create(
+            club=self.club, category=category, name='Tap Water', price=Decimal('5.00'),
+            stock_quantity=None,
+        )
+
+    def _stock(self, product):
+        product.refresh_from_db()
+        return product.stock_quantity
+
+    def test_placement_takes_stock(self):
+        place_order(self.club, self.table, [(self.lager, 2), (self.untracked, 9)])
+        self.assertEqual(self._stock(self.lager), 3)
+        self.assertIsNone(self._stock(self.untracked))
+
+    def test_short_line_rejects_whole_order(self):
+        with self.assertRaises(OutOfStock) as ctx:
+            place_order(self.club, self.table, [(self.lager, 2), (self.cider, 3)])
+        self.assertEqual(ctx.exception.products, [self.cider])
+        self.assertEqual(self._stock(self.lager), 5)
+        self.assertEqual(self._stock(self.cider), 2)
+        self.assertFalse(Order.objects.exists())
+
+    def test_selling_out_hides_product_from_menu(self):
+        self.assertIn(self.cider.id, [
+            p['id'] for c in get_menu_snapshot(self.club)['categories'] for p in c['products']
+        ])
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(self.club, self.table, [(self.cider, 2)])
+        self.cider.refresh_from_db()
+        self.assertFalse(self.cider.is_available)
+        self.assertNotIn(self.cider.id, [
+            p['id'] for c in get_menu_snapshot(self.club)['categories'] for p in c['products']
+        ])
+
+    def test_cancelling_releases_stock(self):
+        self.client.force_login(User.objects.create_user('manager', is_staff=True))
+        order = place_order(self.club, self.table, [(self.cider, 2)])
+        url = reverse('staff:update_order_status', args=[order.id])
+        self.client.post(url, data={'status': 'cancelled'}, content_type='application/json')
+        self.cider.refresh_from_db()
+        self.assertEqual(self.cider.stock_quantity, 2)
+        self.assertTrue(self.cider.is_available)
+
+        place_order(self.club, self.table, [(self.cider, 1)])
+        response = self.client.post(url, data={'status': 'received'}, content_type='application/json')
+        self.assertFalse(response.json()['success'])
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'cancelled')
+
+    def test_cancelling_keeps_manually_disabled_product_off(self):
+        sold_out = place_order(self.club, self.table, [(self.cider, 2)])
+        self.cider.refresh_from_db()
+        self.assertTrue(self.cider.sold_out)
+
+        # Staff take the lager off the menu while an order for it is open
+        open_order = place_order(self.club, self.table, [(self.lager, 1)])
+        self.lager.refresh_from_db()
+        self.lager.is_available = False
+        self.lager.stock_quantity = 0
+        self.lager.save()
+
+        change_status(sold_out, 'cancelled')
+        change_status(open_order, 'cancelled')
+        self.cider.refresh_from_db()
+        self.lager.refresh_from_db()
+        self.assertTrue(self.cider.is_available)
+        self.assertFalse(self.cider.sold_out)
+        self.assertEqual(self.lager.stock_quantity, 1)
+        self.assertFalse(self.lager.is_available)
+
+    def test_checkout_reports_short_stock(self):
+        self.client.post(
+            reverse('menu:add_to_cart'),
+            data={'product_id': self.cider.id, 'quantity': 3},
+            content_type='application/json',
+        )
+        url = reverse('menu:checkout', args=[self.club.slug, self.table.number])
+        response = self.client.post(url, {'payment_method': 'pay_at_table', 'idempotency_key': 'k'})
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    THREADS = 8
+    ORDERS_PER_THREAD = 10
+
+    def setUp(self):
+        self.club = Club.objects.create(name='Test Club', slug='test-club', address='1 Test St')
+        self.table = Table.objects.create(club=self.club, number='7')
+        category = Category.objects.create(name='Beers', slug='beers')
+        self.product = Product.objects.create(
+            club=self.club, category=category, name='Castle Lager', price=Decimal('25.00'),
+            stock_quantity=None,
+        )
+
+    def _hammer(self, thread_index):
+        placed = []
+        try:
+            for i in range(self.ORDERS_PER_THREAD):
+                # Every order is submitted twice, as a double tap would
+                key = f'{thread_index}-{i}'
+                for _ in range(2):
+                    while True:
+                        try:
+                            placed.append(place_order(
+                                self.club, self.table, [(self.product, 1)], idempotency_key=key,
+                            ).pk)
+                            break
+                        except OperationalError:
+                            # SQLite refuses concurrent writers instead of queueing them
+                            time.sleep(0.01)
+        finally:
+            connection.close()
+        return placed
+
+    def test_no_duplicate_numbers_or_orders_under_concurrency(self):
+        with ThreadPoolExecutor(max_workers=self.THREADS) as pool:
+            placed = sum(pool.map(self._hammer, range(self.THREADS)), [])
+
+        expected = self.THREADS * self.ORDERS_PER_THREAD
+        self.assertEqual(len(placed), expected * 2)
+        self.assertEqual(len(set(placed)), expected)
+        numbers = list(Order.objects.values_list('order_number', flat=True))
+        self.assertEqual(len(numbers), expected)
+        self.assertEqual(len(set(numbers)), expected)
+        # Retried and duplicate submissions may skip numbers, never reuse them
+        self.assertGreaterEqual(
+            OrderNumberSequence.objects.get(club=self.club).last_number, expected,
+        )
+
+    def test_stock_is_never_oversold(self):
+        self.product.stock_quantity = 25
+        self.product.save()
+
+        def buy(thread_index):
+            placed = 0
+            try:
+                for i in range(self.ORDERS_PER_THREAD):
+                    while True:
+                        try:
+                            place_order(self.club, self.table, [(self.product, 1)])
+                            placed += 1
+                            break
+                        except OutOfStock:
+                            break
+                        except OperationalError:
+                            time.sleep(0.01)
+            finally:
+                connection.close()
+            return placed
+
+        with ThreadPoolExecutor(max_workers=self.THREADS) as pool:
+            placed = sum(pool.map(buy, range(self.THREADS)))
+
+        self.product.refresh_from_db()
+        self.assertEqual(placed, 25)
+        self.assertEqual(Order.objects.count(), 25)
+        self.assertEqual(self.product.stock_quantity, 0)
+        self.assertFalse(self.product.is_available)
+
+
+class OrderArchiveTests(TestCase):
+    def setUp(self):
+        self.club = Club.objects.create(name='Test Club', slug='test-club', address='1 Test St')
+        self.table = Table.objects.create(club=self.club, number='7')
+        category = Category.objects.create(name='Beers', slug='beers')
+        self.product = Product.objects.create(
+            club=self.club, category=category, name='Castle Lager', price=Decimal('25.00'),
+            stock_quantity=None,
+        )
+
+    def _order(self, status, hours_ago, quantity=1):
+        order = place_order(self.club, self.table, [(self.product, quantity)], status=status)
+        Order.objects.filter(pk=order.pk).update(
+            updated_at=timezone.now() - timedelta(hours=hours_ago),
+        )
+        return order
+
+    def test_moves_only_old_finished_orders_in_batches(self):
+        old = [self._order('delivered', 30) for _ in range(5)] + [self._order('cancelled', 30)]
+        recent = self._order('delivered', 1)
+        still_open = self._order('ready', 30)
+
+        self.assertEqual(archive_orders(batch_size=2), 6)
+
+        self.assertEqual(
+            set(Order.objects.values_list('pk', flat=True)), {recent.pk, still_open.pk},
+        )
+        archived = ArchivedOrder.objects.get(pk=old[0].pk)
+        self.assertEqual(archived.order_number, old[0].order_number)
+        self.assertEqual(archived.created_at, old[0].created_at)
+        self.assertEqual(archived.items.get().product, self.product)
+        self.assertEqual(OrderItem.objects.filter(order_id__in=[o.pk for o in old]).count(), 0)
+
+    def test_confirmation_link_survives_archiving(self):
+        order = self._order('delivered', 30)
+        archive_orders()
+        response = self.client.get(reverse('menu:order_confirmation', args=[order.pk]))
+        self.assertContains(response, order.order_number)
+
+    def test_restore_single_order(self):
+        order = self._order('delivered', 30, quantity=3)
+        archive_orders()
+        restored = restore_order(order.pk)
+        self.assertEqual(restored.order_number, order.order_number)
+        self.assertEqual(restored.created_at, order.created_at)
+        self.assertEqual(restored.items.get().quantity, 3)
+        self.assertFalse(ArchivedOrder.objects.exists())
+        # Freshly restored orders aren't archived straight away again
+        self.assertEqual(archive_orders(), 0)
+
+    def test_rollups_include_archived_orders(self):
+        from admin_dashboard.models import SalesReport
+        from admin_dashboard.rollups import rollup_order_day
+
+        first = self._order('delivered', 30)
+        self._order('delivered', 30, quantity=2)
+        archive_orders(older_than=timedelta(hours=1))
+        late = self._order('delivered', 0)
+        Order.objects.filter(pk=late.pk).update(created_at=first.created_at)
+        late.refresh_from_db()
+        rollup_order_day(late)
+        report = SalesReport.objects.get(club=self.club)
+        self.assertEqual((report.total_orders, report.total_revenue), (3, Decimal('100.00')))
+
+
+class PrepTelemetryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('staff', is_staff=True)
+        self.client.force_login(self.user)
+        self.club = Club.objects.create(name='Test Club', slug='test-club', address='1 Test St')
+        self.table = Table.objects.create(club=self.club, number='7')
+        self.category = Category.objects.create(name='Beers', slug='beers')
+        self.product = Product.objects.create(
+            club=self.club, category=self.category, name='Castle Lager', price=Decimal('25.00'),
+            stock_quantity=None,
+        )
+
+    def _set_status(self, order, status):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse('staff:update_order_status', args=[order.id]),
+                data={'status': status},
+                content_type='application/json',
+            )
+
+    def test_status_changes_are_logged_with_durations(self):
+        order = place_order(self.club, self.table, [(self.product, 1)])
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(minutes=4))
+        self._set_status(order, 'in_progress')
+        self._set_status(order, 'ready')
+        events = list(OrderStatusEvent.objects.filter(order_id=order.id))
+        self.assertEqual(
+            [(event.from_status, event.to_status) for event in events],
+            [('received', 'in_progress'), ('in_progress', 'ready')],
+        )
+        self.assertAlmostEqual(events[0].duration, 240, delta=5)
+        self.assertLess(events[1].duration, 5)
+
+    def test_rolling_windows_track_percentiles(self):
+        hour = timezone.localtime().hour
+        for seconds in range(60, 660, 60):
+            add_sample(self.club.id, 'prep', hour, [self.category.id], seconds)
+        self.assertEqual(stage_stats(self.club.id, 'prep', hour, [self.category.id]), (360, 600))
+        # Other hours fall back to the all-day window
+        self.assertEqual(stage_stats(self.club.id, 'prep', (hour + 1) % 24, [self.category.id]), (360, 600))
+        # Nothing recorded yet: defaults
+        self.assertEqual(stage_stats(self.club.id + 1, 'queue', hour, []), (180, 270))
+
+    def test_estimate_grows_with_queue_depth_and_uses_no_queries(self):
+        order = place_order(self.club, self.table, [(self.product, 1)])
+        now = order.updated_at
+        with CaptureQueriesContext(connection) as queries:
+            idle = estimate_ready(order, [self.category.id], 0, now=now)
+            busy = estimate_ready(order, [self.category.id], 12, now=now)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(idle['minutes'], 10)
+        self.assertGreater(busy['ready_at'], idle['ready_at'])
+        order.status = 'ready'
+        self.assertIsNone(estimate_ready(order, [self.category.id], 0))
+
+    def test_estimate_counts_from_the_status_change_not_other_edits(self):
+        order = place_order(self.club, self.table, [(self.product, 1)])
+        now = order.created_at + timedelta(minutes=4)
+        before = estimate_ready(order, [self.category.id], 0, now=now)
+        order.notes = 'No ice'
+        order.save()
+        after = estimate_ready(order, [self.category.id], 0, now=now)
+        self.assertEqual(after['ready_at'], before['ready_at'])
+
+        self._set_status(order, 'in_progress')
+        order.refresh_from_db()
+        self.assertIsNotNone(order.status_changed_at)
+        now = order.status_changed_at + timedelta(minutes=2)
+        self.assertEqual(estimate_ready(order, [self.category.id], 0, now=now)['minutes'], 5)
+
+    def test_confirmation_page_shows_estimate(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            order = place_order(self.club, self.table, [(self.product, 1)])
+        response = self.client.get(reverse('menu:order_confirmation', args=[order.id]))
+        self.assertEqual(response.context['estimate']['minutes'], 10)
+        self.assertContains(response, '10-15 minutes')
@@ -0,0 +1,98 @@
+"""Order status state machine with compare-and-swap updates.
+
+TRANSITIONS lists where each status may go next. change_status() applies a
+move with a single ``UPDATE ... WHERE id = %s AND status = %s``, so the
+status the caller saw works as the row's version. When two bartenders tap
+the same order, one update matches and the other gets StatusConflict
+carrying the status that won. That way an order can't be moved backwards
+and no update is silently lost. Only the changed columns are written (never
+the whole row), and updated_at is set explicitly because queryset updates
+skip auto_now and the sales rollups scan by it.
+
+post_save doesn't fire for queryset updates, so the status_changed signal
+is sent instead. Staff boards get an order.status_changed event on commit.
+"""
+
+from django.db import transaction
+from django.dispatch import Signal
+from django.utils import timezone
+
+from menu.stock import release_stock, reserve_stock
+
+from .events import ORDER_STATUS_CHANGED, publish_on_commit
+from .models import Order
+from .telemetry import record_status_change
+
+TRANSITIONS = {
+    'received': ('in_progress', 'ready', 'cancelled'),
+    'in_progress': ('ready', 'cancelled'),
+    # Sent back to the bar to be remade
+    'ready': ('in_progress', 'delivered', 'cancelled'),
+    'delivered': (),
+    # Undoing a mistaken cancel; the stock is taken again
+    'cancelled': ('received',),
+}
+
+# Sent inside the transaction with ``order`` and ``previous_status``
+status_changed = Signal()
+
+
+class InvalidTransition(Exception):
+    def __init__(self, current_status, new_status):
+        self.current_status = current_status
+        self.new_status = new_status
+        super().__init__(f"Can't move an order from {current_status} to {new_status}")
+
+
+class StatusConflict(Exception):
+    """Someone else changed the order first; ``current_status`` is what they set."""
+
+    def __init__(self, current_status):
+        self.current_status = current_status
+        super().__init__(f'Order was already moved to {current_status}')
+
+
+def can_transition(current_status, new_status):
+    return new_status in TRANSITIONS.get(current_status, ())
+
+
+def change_status(order, new_status, expected_status=None):
+    """
+    Move ``order`` to ``new_status`` if it is still in ``expected_status``.
+
+    ``expected_status`` is the status the client last saw (defaults to
+    ``order.status`` as loaded). Raises InvalidTransition for moves the
+    table doesn't allow, StatusConflict if the row changed underneath, and
+    menu.stock.OutOfStock when reopening a cancelled order can't get its
+    stock back. On success ``order`` is updated in place and returned.
+    """
+    expected_status = expected_status or order.status
+    if not can_transition(expected_status, new_status):
+        raise InvalidTransition(expected_status, new_status)
+
+    now = timezone.now()
+    fields = {'status': new_status, 'updated_at': now, 'status_changed_at': now}
+    if new_status == 'delivered':
+        fields['delivered_at'] = now
+
+    with transaction.atomic():
+        if not Order.objects.filter(pk=order.pk, status=expected_status).update(**fields):
+            current = Order.objects.filter(pk=order.pk).values_list('status', flat=True).first()
+            raise StatusConflict(current)
+
+        # Only the winning update touches stock. Cancelling gives it back and
+        # reopening takes it again; OutOfStock rolls the status back too.
+        if 'cancelled' in (new_status, expected_status):
+            lines = order.items.values_list('product_id', 'quantity')
+            if new_status == 'cancelled':
+                release_stock(order.club_id, lines)
+            else:
+                reserve_stock(order.club_id, lines)
+
+        for name, value in fields.items():
+            setattr(order, name, value)
+        items = list(order.items.select_related('product'))
+        record_status_change(order, expected_status, [item.product.category_id for item in items], now=now)
+        status_changed.send(sender=Order, order=order, previous_status=expected_status)
+        publish_on_commit(order, items, ORDER_STATUS_CHANGED, previous_status=expected_status)
+    return order
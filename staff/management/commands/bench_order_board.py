@@ -0,0 +1,110 @@
+"""Hold many live order boards open against the ASGI app and time event fan-out."""
+
+import asyncio
+import json
+import statistics
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from orders.events import ORDER_CREATED, broker
+
+
+class Command(BaseCommand):
+    help = 'Connect N staff boards to the SSE endpoint in-process (ASGI) and publish order events.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--boards', type=int, default=300, help='Connected boards (default 300).')
+        parser.add_argument('--events', type=int, default=20, help='Events to publish (default 20).')
+
+    def handle(self, *args, **options):
+        user = User.objects.create_user(f'bench-board-{int(time.time())}', is_staff=True)
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        try:
+            result = asyncio.run(self._run(session.session_key, options['boards'], options['events']))
+        finally:
+            session.delete()
+            user.delete()
+
+        connected, connect_seconds, latencies, delivered, expected = result
+        self.stdout.write(f'Boards connected:  {connected} in {connect_seconds:.2f}s')
+        self.stdout.write(f'Events delivered:  {delivered}/{expected}')
+        if latencies:
+            latencies.sort()
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            self.stdout.write(
+                f'Fan-out latency:   p50 {statistics.median(latencies) * 1000:.1f}ms, '
+                f'p99 {p99 * 1000:.1f}ms'
+            )
+
+    async def _run(self, session_key, boards, events):
+        from Buda.asgi import application
+
+        latencies = []
+        delivered = 0
+        disconnect = asyncio.Event()
+
+        async def board(index):
+            request_sent = False
+
+            async def receive():
+                nonlocal request_sent
+                if not request_sent:
+                    request_sent = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                nonlocal delivered
+                if message['type'] != 'http.response.body':
+                    return
+                for chunk in message.get('body', b'').decode().split('\n\n'):
+                    if 'event: order.created' in chunk:
+                        data = json.loads(chunk.split('data: ', 1)[1])
+                        latencies.append(time.perf_counter() - data['sent_at'])
+                        delivered += 1
+
+            scope = {
+                'type': 'http',
+                'asgi': {'version': '3.0'},
+                'http_version': '1.1',
+                'method': 'GET',
+                'scheme': 'http',
+                'path': '/staff/api/events/',
+                'raw_path': b'/staff/api/events/',
+                'query_string': b'',
+                'root_path': '',
+                'headers': [
+                    (b'host', b'localhost'),
+                    (b'cookie', f'{settings.SESSION_COOKIE_NAME}={session_key}'.encode()),
+                ],
+                'client': ('127.0.0.1', 10000 + index),
+                'server': ('localhost', 8000),
+            }
+            await application(scope, receive, send)
+
+        tasks = [asyncio.create_task(board(i)) for i in range(boards)]
+        start = time.perf_counter()
+        while broker.subscriber_count < boards and time.perf_counter() - start < 60:
+            await asyncio.sleep(0.05)
+        connect_seconds = time.perf_counter() - start
+        connected = broker.subscriber_count
+
+        for i in range(events):
+            # Published from a worker thread, as order placement would be
+            await asyncio.to_thread(broker.publish, None, ORDER_CREATED, {'id': i, 'sent_at': time.perf_counter()})
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(0.5)
+
+        disconnect.set()
+        await asyncio.wait(tasks, timeout=30)
+        return connected, connect_seconds, latencies, delivered, connected * events
@@ -0,0 +1,200 @@
+"""Station pick lists: open order items grouped by station and product.
+
+Each Category is prepared at a station (Category.station). A pick list
+sums every open line for a product, e.g. "12x Castle Lager, tables 3, 5,
+9", so the bar can pick a round in one trip instead of one order at a time.
+Lines leave the list when their order moves to ready (or beyond).
+
+Lists are kept in memory and updated from the order event broker: the
+router is a broker listener, so each order event adds or removes that
+order's lines as it is published, whether or not anyone is looking at the
+list. A club is loaded from the database (one query) the first time it is
+asked for, after a resync, and every RESEED_SECONDS. The periodic reload
+bounds staleness when several worker processes each have their own broker.
+Loads run outside the router's lock, so one station's reload doesn't block
+the others; events that arrive meanwhile are replayed onto the new list.
+Events are handled on the publishing thread, so they never query. Loads
+also read every category's station; an order in a category added since
+just marks the lists it touches for a reload.
+"""
+
+import threading
+import time
+from collections import Counter
+
+from menu.models import Category
+from orders.events import ORDER_CREATED, ORDER_STATUS_CHANGED, RESYNC, broker
+from orders.models import OrderItem
+
+PICK_STATUSES = ('received', 'in_progress')
+STATIONS = [station for station, _ in Category.STATION_CHOICES]
+RESEED_SECONDS = 60
+
+
+def _table_sort_key(number):
+    return (0, int(number), '') if number.isdigit() else (1, 0, number)
+
+
+class PickList:
+    """Open lines for one club (or every club), aggregated per station and product."""
+
+    def __init__(self):
+        self._orders = {}
+        self._lines = {station: {} for station in STATIONS}
+
+    def add(self, order_id, table, lines):
+        """``lines`` are (station, product_id, name, quantity); replaces the order if known."""
+        self.remove(order_id)
+        self._orders[order_id] = (table, lines)
+        for station, product_id, name, quantity in lines:
+            line = self._lines.setdefault(station, {}).setdefault(
+                product_id, {'name': name, 'quantity': 0, 'tables': Counter()},
+            )
+            line['quantity'] += quantity
+            line['tables'][table] += quantity
+
+    def remove(self, order_id):
+        entry = self._orders.pop(order_id, None)
+        if entry is None:
+            return
+        table, lines = entry
+        for station, product_id, name, quantity in lines:
+            line = self._lines[station][product_id]
+            line['quantity'] -= quantity
+            line['tables'][table] -= quantity
+            if line['tables'][table] <= 0:
+                del line['tables'][table]
+            if line['quantity'] <= 0:
+                del self._lines[station][product_id]
+
+    def as_dict(self, station=None):
+        stations = [station] if station else list(self._lines)
+        result = {}
+        for name in stations:
+            lines = self._lines.get(name, {})
+            result[name] = sorted(
+                (
+                    {
+                        'product_id': product_id,
+                        'name': line['name'],
+                        'quantity': line['quantity'],
+                        'tables': [
+                            {'table': table, 'quantity': line['tables'][table]}
+                            for table in sorted(line['tables'], key=_table_sort_key)
+                        ],
+                    }
+                    for product_id, line in lines.items()
+                ),
+                key=lambda line: (-line['quantity'], line['name']),
+            )
+        return result
+
+
+class StationRouter:
+    def __init__(self, broker=broker, reseed_seconds=RESEED_SECONDS):
+        self.broker = broker
+        self.reseed_seconds = reseed_seconds
+        self._lock = threading.Lock()
+        self._subscription = None
+        self._lists = {}
+        self._loaded_at = {}
+        self._loading = {}  # club_id -> buffers of events seen while that club loads
+        self._stations = {}
+
+    def pick_list(self, club_id=None, station=None):
+        """Current pick list for a club (None for every club), by station."""
+        with self._lock:
+            if self._subscription is None:
+                self._subscription = self.broker.listen(self._on_event)
+            loaded_at = self._loaded_at.get(club_id)
+            if loaded_at is not None and time.monotonic() - loaded_at <= self.reseed_seconds:
+                return self._lists[club_id].as_dict(station)
+            buffer = []
+            self._loading.setdefault(club_id, []).append(buffer)
+
+        try:
+            pick_list = self._load(club_id)
+        finally:
+            with self._lock:
+                self._loading[club_id].remove(buffer)
+                if not self._loading[club_id]:
+                    del self._loading[club_id]
+
+        with self._lock:
+            # Adding or removing an order twice is harmless, so replay everything seen
+            for event in buffer:
+                self._apply_to([pick_list], event)
+            self._lists[club_id] = pick_list
+            if not any(self._needs_reload(event) for event in buffer):
+                self._loaded_at[club_id] = time.monotonic()
+            return pick_list.as_dict(station)
+
+    def close(self):
+        if self._subscription is not None:
+            self.broker.unsubscribe(self._subscription)
+            self._subscription = None
+
+    def _on_event(self, event):
+        with self._lock:
+            if event.type == RESYNC:
+                self._lists.clear()
+                self._loaded_at.clear()
+                return
+            for club_id, buffers in self._loading.items():
+                if club_id is None or club_id == event.club_id:
+                    for buffer in buffers:
+                        buffer.append(event)
+            keys = [key for key in (event.club_id, None) if key in self._lists]
+            if self._needs_reload(event):
+                for key in keys:
+                    del self._lists[key]
+                    self._loaded_at.pop(key, None)
+                return
+            self._apply_to([self._lists[key] for key in keys], event)
+
+    def _needs_reload(self, event):
+        # An open order in a category whose station only the database knows
+        return (
+            event.type in (ORDER_CREATED, ORDER_STATUS_CHANGED)
+            and event.data['status'] in PICK_STATUSES
+            and any(item['category_id'] not in self._stations for item in event.data['items'])
+        )
+
+    def _apply_to(self, targets, event):
+        if not targets or event.type not in (ORDER_CREATED, ORDER_STATUS_CHANGED):
+            return
+        data = event.data
+        if data['status'] in PICK_STATUSES:
+            lines = [
+                (self._stations.get(item['category_id'], STATIONS[0]), item['product_id'],
+                 item['name'], item['quantity'])
+                for item in data['items']
+            ]
+            for pick_list in targets:
+                pick_list.add(data['id'], data['table'], lines)
+        else:
+            for pick_list in targets:
+                pick_list.remove(data['id'])
+
+    def _load(self, club_id):
+        items = OrderItem.objects.filter(order__status__in=PICK_STATUSES)
+        if club_id is not None:
+            items = items.filter(order__club_id=club_id)
+        orders = {}
+        for row in items.values(
+            'order_id', 'order__table__number', 'product_id', 'product__name',
+            'product__category__station', 'quantity',
+        ):
+            table, lines = orders.setdefault(row['order_id'], (row['order__table__number'], []))
+            lines.append((
+                row['product__category__station'], row['product_id'], row['product__name'], row['quantity'],
+            ))
+        # Every category, so events for orders that aren't open yet can be placed too
+        self._stations = dict(Category.objects.values_list('id', 'station'))
+        pick_list = PickList()
+        for order_id, (table, lines) in orders.items():
+            pick_list.add(order_id, table, lines)
+        return pick_list
+
+
+router = StationRouter()
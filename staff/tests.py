@@ -1,3 +1,398 @@
-from django.test import TestCase
+import json
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import connection
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from admin_dashboard.models import SalesReport, StaffMember
+from menu.models import Category, Club, Product, Table
+from orders.events import (
+    ORDER_CREATED, ORDER_STATUS_CHANGED, RESYNC, SUBSCRIBER_QUEUE_SIZE, OrderEventBroker, broker, order_payload,
+)
+from orders.models import Order
+from orders.placement import place_order
+from orders.transitions import StatusConflict, change_status
+from .stations import StationRouter
+
+
+class OrderEventBrokerTests(TestCase):
+    def setUp(self):
+        self.broker = OrderEventBroker(history_size=3)
+
+    def test_subscribers_only_get_their_club(self):
+        club_board = self.broker.subscribe(club_id=1)
+        all_board = self.broker.subscribe()
+        self.broker.publish(2, ORDER_CREATED, {'id': 10})
+        self.broker.publish(1, ORDER_CREATED, {'id': 11})
+        self.assertEqual(club_board.get(0).data, {'id': 11})
+        self.assertIsNone(club_board.get(0))
+        self.assertEqual([all_board.get(0).data['id'] for _ in range(2)], [10, 11])
+
+    def test_reconnect_replays_missed_events(self):
+        first = self.broker.publish(1, ORDER_CREATED, {'id': 1})
+        self.broker.publish(1, ORDER_STATUS_CHANGED, {'id': 1})
+        board = self.broker.subscribe(club_id=1, last_event_id=first.id)
+        self.assertEqual(board.get(0).type, ORDER_STATUS_CHANGED)
+        self.assertIsNone(board.get(0))
+
+    def test_reconnect_after_history_dropped_asks_for_resync(self):
+        for i in range(5):
+            self.broker.publish(1, ORDER_CREATED, {'id': i})
+        board = self.broker.subscribe(club_id=1, last_event_id=1)
+        self.assertEqual(board.get(0).type, RESYNC)
+
+    def test_unsubscribe(self):
+        board = self.broker.subscribe()
+        self.broker.unsubscribe(board)
+        self.broker.publish(1, ORDER_CREATED, {})
+        self.assertIsNone(board.get(0))
+        self.assertEqual(self.broker.subscriber_count, 0)
+
+
+class OrderBoardEventTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('staff', is_staff=True)
+        self.client.force_login(self.user)
+        self.club = Club.objects.create(name='Test Club', slug='test-club', address='1 Test St')
+        self.table = Table.objects.create(club=self.club, number='7')
+        category = Category.objects.create(name='Beers', slug='beers')
+        self.product = Product.objects.create(
+            club=self.club, category=category, name='Castle Lager', price=Decimal('25.00'),
+            stock_quantity=None,
+        )
+        self.board = broker.subscribe(club_id=self.club.id)
+        self.addCleanup(broker.unsubscribe, self.board)
+
+    def test_placement_publishes_order_created_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            order = place_order(self.club, self.table, [(self.product, 3)])
+        self.assertIsNone(self.board.get(0))
+        for callback in callbacks:
+            callback()
+        event = self.board.get(0)
+        self.assertEqual(event.type, ORDER_CREATED)
+        self.assertEqual(event.data['id'], order.id)
+        self.assertEqual(event.data['table'], '7')
+        self.assertEqual(event.data['items'], [{
+            'product_id': self.product.id,
+            'category_id': self.product.category_id,
+            'name': 'Castle Lager',
+            'quantity': 3,
+        }])
+
+    def test_status_update_publishes_status_changed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            order = place_order(self.club, self.table, [(self.product, 1)])
+        self.board.get(0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse('staff:update_order_status', args=[order.id]),
+                data={'status': 'in_progress'},
+                content_type='application/json',
+            )
+        event = self.board.get(0)
+        self.assertEqual(event.type, ORDER_STATUS_CHANGED)
+        self.assertEqual(event.data['status'], 'in_progress')
+        self.assertEqual(event.data['previous_status'], 'received')
+
+    def test_event_stream_sends_published_events(self):
+        response = self.client.get(reverse('staff:order_events'), {'club': self.club.id})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = iter(response.streaming_content)
+        self.assertEqual(next(stream), b'retry: 3000\n\n')
+        event = broker.publish(self.club.id, ORDER_CREATED, {'id': 42})
+        message = next(stream).decode()
+        self.assertIn(f'id: {event.id}\n', message)
+        self.assertIn('event: order.created\n', message)
+        self.assertEqual(json.loads(message.split('data: ')[1]), {'id': 42})
+        response.close()
+
+    def test_event_stream_requires_login(self):
+        self.client.logout()
+        response = self.client.get(reverse('staff:order_events'))
+        self.assertEqual(response.status_code, 302)
+
+
+class StationPickListTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('staff', is_staff=True)
+        self.client.force_login(self.user)
+        self.club = Club.objects.create(name='Test Club', slug='test-club', address='1 Test St')
+        self.tables = {number: Table.objects.create(club=self.club, number=number) for number in ('3', '5', '10')}
+        beers = Category.objects.create(name='Beers', slug='beers', station='bar')
+        food = Category.objects.create(name='Food', slug='food', station='kitchen')
+        self.lager = Product.objects.create(
+            club=self.club, category=beers, name='Castle Lager', price=Decimal('25.00'), stock_quantity=None,
+        )
+        self.chips = Product.objects.create(
+            club=self.club, category=food, name='Chips', price=Decimal('30.00'), stock_quantity=None,
+        )
+        self.router = StationRouter(broker)
+        self.addCleanup(self.router.close)
+
+    def _place(self, table, lines):
+        with self.captureOnCommitCallbacks(execute=True):
+            return place_order(self.club, self.tables[table], lines)
+
+    def _set_status(self, order, status):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse('staff:update_order_status', args=[order.id]),
+                data={'status': status},
+                content_type='application/json',
+            )
+
+    def test_lines_are_aggregated_per_station_across_tables(self):
+        self._place('10', [(self.lager, 2)])
+        self._place('3', [(self.lager, 1), (self.chips, 1)])
+        self._place('3', [(self.lager, 3)])
+        lists = self.router.pick_list(self.club.id)
+        self.assertEqual(lists['bar'], [{
+            'product_id': self.lager.id,
+            'name': 'Castle Lager',
+            'quantity': 6,
+            'tables': [{'table': '3', 'quantity': 4}, {'table': '10', 'quantity': 2}],
+        }])
+        self.assertEqual([line['name'] for line in lists['kitchen']], ['Chips'])
+
+    def test_events_are_applied_without_reloading(self):
+        first = self._place('3', [(self.lager, 1)])
+        self.router.pick_list(self.club.id)
+        self._place('5', [(self.lager, 2)])
+        self._set_status(first, 'in_progress')
+        with CaptureQueriesContext(connection) as queries:
+            lists = self.router.pick_list(self.club.id, 'bar')
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(lists['bar'][0]['quantity'], 3)
+
+    def test_lines_expire_when_order_is_ready(self):
+        order = self._place('3', [(self.lager, 2), (self.chips, 1)])
+        self._place('5', [(self.lager, 1)])
+        self.router.pick_list(self.club.id)
+        self._set_status(order, 'ready')
+        lists = self.router.pick_list(self.club.id)
+        self.assertEqual(lists['bar'][0]['tables'], [{'table': '5', 'quantity': 1}])
+        self.assertEqual(lists['kitchen'], [])
+        # A reload from the database agrees with the incremental state
+        fresh = StationRouter(broker)
+        self.addCleanup(fresh.close)
+        self.assertEqual(fresh.pick_list(self.club.id), lists)
+
+    def test_unwatched_list_keeps_up_without_reloading(self):
+        self.router.pick_list(self.club.id)
+        orders = [self._place('3', [(self.lager, 1)]) for _ in range(SUBSCRIBER_QUEUE_SIZE + 20)]
+        self._set_status(orders[0], 'ready')
+        with CaptureQueriesContext(connection) as queries:
+            lists = self.router.pick_list(self.club.id, 'bar')
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(lists['bar'][0]['quantity'], len(orders) - 1)
+
+    def test_events_during_a_load_are_replayed(self):
+        first = self._place('3', [(self.lager, 1)])
+        load = self.router._load
+
+        def load_then_change(club_id):
+            pick_list = load(club_id)
+            # Committed after the load's query ran
+            self._set_status(first, 'ready')
+            self._place('5', [(self.chips, 2)])
+            return pick_list
+
+        with mock.patch.object(self.router, '_load', side_effect=load_then_change):
+            lists = self.router.pick_list(self.club.id)
+        self.assertEqual(lists['bar'], [])
+        self.assertEqual(lists['kitchen'][0]['tables'], [{'table': '5', 'quantity': 2}])
+
+    def test_order_in_a_new_category_reloads_instead_of_querying_on_publish(self):
+        self.router.pick_list(self.club.id)
+        shots = Category.objects.create(name='Shots', slug='shots', station='kitchen')
+        tequila = Product.objects.create(
+            club=self.club, category=shots, name='Tequila', price=Decimal('20.00'), stock_quantity=None,
+        )
+        with self.captureOnCommitCallbacks():
+            place_order(self.club, self.tables['3'], [(tequila, 2)])
+        order = Order.objects.latest('id')
+        data = order_payload(order, order.items.select_related('product'))
+        with CaptureQueriesContext(connection) as queries:
+            broker.publish(self.club.id, ORDER_CREATED, data)
+        self.assertEqual(len(queries), 0)
+        lists = self.router.pick_list(self.club.id)
+        self.assertEqual(lists['kitchen'][0]['name'], 'Tequila')
+
+    def test_pick_list_data_endpoint(self):
+        self._place('3', [(self.chips, 2)])
+        response = self.client.get(reverse('staff:pick_list_data'), {'club': self.club.id, 'station': 'kitchen'})
+        data = response.json()
+        self.assertEqual(list(data['stations']), ['kitchen'])
+        self.assertEqual(data['stations']['kitchen'][0]['quantity'], 2)
+        response = self.client.get(reverse('staff:pick_list_data'), {'station': 'pool'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(BUDA_ROLLUP_ASYNC=False)
+class StatusTransitionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('staff', is_staff=True)
+        self.client.force_login(self.user)
+        self.club = Club.objects.create(name='Test Club', slug='test-club', address='1 Test St')
+        self.table = Table.objects.create(club=self.club, number='7')
+        category = Category.objects.create(name='Beers', slug='beers')
+        self.product = Product.objects.create(
+            club=self.club, category=category, name='Castle Lager', price=Decimal('25.00'),
+            stock_quantity=None,
+        )
+        self.order = place_order(self.club, self.table, [(self.product, 2)])
+
+    def _post(self, status, **extra):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                reverse('staff:update_order_status', args=[self.order.id]),
+                data={'status': status, **extra},
+                content_type='application/json',
+            )
+
+    def test_update_is_a_compare_and_swap_on_status(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self._post('in_progress', **{'from': 'received'})
+        self.assertTrue(response.json()['success'])
+        update = next(q['sql'] for q in queries if q['sql'].startswith('UPDATE "orders_order"'))
+        self.assertIn('"status" = \'received\'', update.split('WHERE')[1])
+        self.assertNotIn('"notes"', update)
+
+    def test_stale_tap_gets_a_conflict(self):
+        self._post('in_progress', **{'from': 'received'})
+        response = self._post('ready', **{'from': 'received'})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['status'], 'in_progress')
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'in_progress')
+
+    def test_lost_race_raises_conflict(self):
+        stale = Order.objects.get(pk=self.order.pk)
+        change_status(self.order, 'in_progress')
+        with self.assertRaises(StatusConflict) as raised:
+            change_status(stale, 'cancelled')
+        self.assertEqual(raised.exception.current_status, 'in_progress')
+
+    def test_orders_cannot_move_backwards(self):
+        self._post('ready')
+        self._post('delivered')
+        response = self._post('in_progress')
+        self.assertEqual(response.status_code, 409)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'delivered')
+        self.assertIsNotNone(self.order.delivered_at)
+
+    def test_delivery_bumps_updated_at_and_rolls_up_the_day(self):
+        before = self.order.updated_at
+        self._post('ready')
+        self._post('delivered')
+        self.order.refresh_from_db()
+        self.assertGreater(self.order.updated_at, before)
+        report = SalesReport.objects.get(club=self.club)
+        self.assertEqual(report.total_orders, 1)
+
+    def test_reopening_a_cancelled_order_rolls_up_the_day(self):
+        self._post('cancelled')
+        self.assertEqual(SalesReport.objects.get(club=self.club).cancelled_orders, 1)
+        self._post('received')
+        self.assertEqual(SalesReport.objects.get(club=self.club).cancelled_orders, 0)
+
+
+class StaffScopingTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Beers', slug='beers')
+        self.clubs = []
+        for slug in ('club-a', 'club-b'):
+            club = Club.objects.create(name=slug, slug=slug, address='1 Test St')
+            table = Table.objects.create(club=club, number='1')
+            product = Product.objects.create(
+                club=club, category=category, name=f'Lager {slug}', price=Decimal('25.00'),
+                stock_quantity=None,
+            )
+            for i, status in enumerate(['received', 'in_progress', 'ready', 'delivered']):
+                place_order(club, table, [(product, 1)], order_number=f'{slug}-{i}', status=status)
+            self.clubs.append((club, product))
+        self.user = User.objects.create_user('bartender')
+        StaffMember.objects.create(
+            user=self.user, club=self.clubs[0][0], role='bartender', employee_id='B1',
+        )
+        self.client.force_login(self.user)
+
+    def test_dashboard_shows_only_own_club_grouped_by_status(self):
+        response = self.client.get(reverse('staff:dashboard'))
+        self.assertEqual(
+            [o.order_number for o in response.context['received_orders']], ['club-a-0'],
+        )
+        self.assertEqual(
+            [o.order_number for o in response.context['in_progress_orders']], ['club-a-1'],
+        )
+        self.assertEqual([o.order_number for o in response.context['ready_orders']], ['club-a-2'])
+
+    def test_dashboard_order_query_count_is_flat_across_venues(self):
+        self.client.get(reverse('staff:dashboard'))
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('staff:dashboard'))
+        order_queries = [q for q in ctx.captured_queries if 'FROM "orders_order"' in q['sql']]
+        self.assertEqual(len(order_queries), 1)
+        self.assertIn('"club_id" = ', order_queries[0]['sql'])
+
+    def test_cannot_update_other_clubs_orders_or_products(self):
+        other_order = Order.objects.get(order_number='club-b-0')
+        response = self.client.post(
+            reverse('staff:update_order_status', args=[other_order.id]),
+            data={'status': 'in_progress'},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 404)
+        other_product = self.clubs[1][1]
+        response = self.client.post(reverse('staff:toggle_product_availability', args=[other_product.id]))
+        self.assertEqual(response.status_code, 404)
+
+    def _restock(self, product, quantity):
+        return self.client.post(
+            reverse('staff:update_stock', args=[product.id]),
+            data={'stock_quantity': quantity},
+            content_type='application/json',
+        )
+
+    def test_restock_relists_only_checkout_sell_outs(self):
+        _, product = self.clubs[0]
+        Product.objects.filter(pk=product.pk).update(stock_quantity=0, is_available=False, sold_out=True)
+        self._restock(product, 10)
+        product.refresh_from_db()
+        self.assertEqual((product.is_available, product.sold_out, product.stock_quantity), (True, False, 10))
+
+        Product.objects.filter(pk=product.pk).update(stock_quantity=0, is_available=False, sold_out=False)
+        self._restock(product, 10)
+        product.refresh_from_db()
+        self.assertFalse(product.is_available)
+
+    def test_product_page_lists_sold_out_products(self):
+        _, product = self.clubs[0]
+        switched_off = Product.objects.create(
+            club=product.club, category=product.category, name='Off menu', price=Decimal('20.00'),
+            is_available=False,
+        )
+        Product.objects.filter(pk=product.pk).update(stock_quantity=0, is_available=False, sold_out=True)
+        # product_management.html isn't in this tree, so read the context it renders
+        with mock.patch('staff.views.render', return_value=HttpResponse()) as render:
+            self.client.get(reverse('staff:product_management'))
+        products = list(render.call_args.args[2]['products'])
+        self.assertIn(product, products)
+        self.assertNotIn(switched_off, products)
+
+    def test_admin_without_membership_sees_every_club(self):
+        admin = User.objects.create_user('admin', is_staff=True)
+        self.client.force_login(admin)
+        response = self.client.get(reverse('staff:dashboard'))
+        self.assertEqual(len(response.context['received_orders']), 2)
+
+    def test_users_without_membership_are_denied(self):
+        self.client.force_login(User.objects.create_user('guest'))
+        self.assertEqual(self.client.get(reverse('staff:dashboard')).status_code, 403)
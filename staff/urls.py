@@ -5,6 +5,9 @@ app_name = 'staff'
 
 urlpatterns = [
     path('', views.dashboard, name='dashboard'),
+    path('api/events/', views.order_events, name='order_events'),
+    path('pick-list/', views.pick_list, name='pick_list'),
+    path('api/pick-list/', views.pick_list_data, name='pick_list_data'),
     path('order/<int:order_id>/', views.order_detail, name='order_detail'),
     path('api/order/<int:order_id>/status/', views.update_order_status, name='update_order_status'),
     path('products/', views.product_management, name='product_management'),
@@ -1,43 +1,189 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse
+from django.core.exceptions import PermissionDenied
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db.models import Q
+import asyncio
 import json
 
-from orders.models import Order, OrderItem
-from menu.models import Club, Product
+from admin_dashboard.models import StaffMember
+from orders.archive import get_order
+from orders.events import broker
+from orders.models import ArchivedOrder, Order, OrderItem
+from orders.transitions import InvalidTransition, StatusConflict, change_status
+from menu.models import Category, Club, Product
+from menu.stock import OutOfStock
+from .stations import STATIONS, router
+
+
+OPEN_STATUSES = ['received', 'in_progress', 'ready']
+
+
+def get_staff_club(request):
+    """
+    Club the current user works at.
+
+    Staff members are scoped to their StaffMember.club; admins (is_staff)
+    without a membership see every club and get None. Anyone else is denied.
+    """
+    if not hasattr(request, '_staff_club'):
+        member = StaffMember.objects.select_related('club').filter(
+            user=request.user, is_active=True
+        ).first()
+        if member is not None:
+            request._staff_club = member.club
+        elif request.user.is_staff:
+            request._staff_club = None
+        else:
+            raise PermissionDenied
+    return request._staff_club
+
+
+def scope_to_club(queryset, club):
+    return queryset if club is None else queryset.filter(club=club)
 
 
 @login_required
 def dashboard(request):
-    """Staff dashboard showing all orders"""
-    # Get all active orders for the staff member's club
-    # For now, we'll show all orders - in production, filter by staff member's club
-    orders = Order.objects.filter(
-        status__in=['received', 'in_progress', 'ready']
-    ).select_related('table', 'club').prefetch_related('items__product').order_by('-created_at')
-    
-    # Group orders by status
-    received_orders = orders.filter(status='received')
-    in_progress_orders = orders.filter(status='in_progress')
-    ready_orders = orders.filter(status='ready')
+    """Staff dashboard showing the open orders for the staff member's club"""
+    club = get_staff_club(request)
+    
+    # One query for every open order, grouped by status in Python
+    orders = scope_to_club(Order.objects.filter(status__in=OPEN_STATUSES), club).select_related(
+        'table', 'club'
+    ).prefetch_related('items__product').order_by('-created_at')
+    
+    orders_by_status = {status: [] for status in OPEN_STATUSES}
+    for order in orders:
+        orders_by_status[order.status].append(order)
     
     context = {
-        'received_orders': received_orders,
-        'in_progress_orders': in_progress_orders,
-        'ready_orders': ready_orders,
+        'club': club,
+        'received_orders': orders_by_status['received'],
+        'in_progress_orders': orders_by_status['in_progress'],
+        'ready_orders': orders_by_status['ready'],
     }
     
     return render(request, 'staff/dashboard.html', context)
 
 
+SSE_HEARTBEAT_SECONDS = 15
+
+
+def _sse_message(event):
+    return f"id: {event.id}\nevent: {event.type}\ndata: {json.dumps(event.data)}\n\n"
+
+
+def _sse_stream(club_id, last_event_id):
+    """Blocking stream for WSGI servers (holds one worker thread per board)"""
+    subscription = broker.subscribe(club_id, last_event_id)
+    try:
+        yield 'retry: 3000\n\n'
+        while not subscription.overflowed:
+            event = subscription.get(SSE_HEARTBEAT_SECONDS)
+            yield _sse_message(event) if event else ': keepalive\n\n'
+        yield 'event: resync\ndata: {}\n\n'
+    finally:
+        broker.unsubscribe(subscription)
+
+
+async def _sse_astream(club_id, last_event_id):
+    """Async stream for ASGI servers, where hundreds of boards share one event loop"""
+    subscription = broker.subscribe(club_id, last_event_id, loop=asyncio.get_running_loop())
+    try:
+        yield 'retry: 3000\n\n'
+        while not subscription.overflowed:
+            event = await subscription.aget(SSE_HEARTBEAT_SECONDS)
+            yield _sse_message(event) if event else ': keepalive\n\n'
+        yield 'event: resync\ndata: {}\n\n'
+    finally:
+        broker.unsubscribe(subscription)
+
+
+@login_required
+def order_events(request):
+    """Server-sent events stream of order.created / order.status_changed for the board"""
+    club = get_staff_club(request)
+    club_id = request.GET.get('club') or None
+    last_event_id = request.headers.get('Last-Event-ID')
+    try:
+        club_id = int(club_id) if club_id else None
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return JsonResponse({'success': False, 'message': 'Invalid data'}, status=400)
+    if club is not None:
+        # Staff members only ever hear about their own club
+        club_id = club.id
+    
+    if isinstance(request, ASGIRequest):
+        stream = _sse_astream(club_id, last_event_id)
+    else:
+        stream = _sse_stream(club_id, last_event_id)
+    
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _pick_list_scope(request):
+    """Club id for a pick list: staff get their own club, admins may pick one with ?club="""
+    club = get_staff_club(request)
+    if club is not None:
+        return club.id
+    club_id = request.GET.get('club')
+    return int(club_id) if club_id else None
+
+
+@login_required
+def pick_list(request):
+    """Aggregated pick list per station (bar, kitchen) for open orders"""
+    club = get_staff_club(request)
+    try:
+        club_id = _pick_list_scope(request)
+    except ValueError:
+        club_id = None
+    
+    pick_lists = router.pick_list(club_id)
+    context = {
+        'club': club,
+        'club_id': club_id,
+        'stations': [
+            {'value': value, 'label': label, 'lines': pick_lists[value]}
+            for value, label in Category.STATION_CHOICES
+        ],
+    }
+    
+    return render(request, 'staff/pick_list.html', context)
+
+
+@login_required
+def pick_list_data(request):
+    """Pick list as JSON, optionally for one ?station="""
+    station = request.GET.get('station') or None
+    try:
+        club_id = _pick_list_scope(request)
+    except ValueError:
+        return JsonResponse({'success': False, 'message': 'Invalid data'}, status=400)
+    if station is not None and station not in STATIONS:
+        return JsonResponse({'success': False, 'message': 'Invalid station'}, status=400)
+    
+    return JsonResponse({'success': True, 'stations': router.pick_list(club_id, station)})
+
+
 @login_required
 def order_detail(request, order_id):
     """Detailed view of a specific order"""
-    order = get_object_or_404(Order, id=order_id)
+    club = get_staff_club(request)
+    order = get_order(
+        order_id,
+        scope_to_club(Order.objects.all(), club),
+        scope_to_club(ArchivedOrder.objects.all(), club),
+    )
     
     context = {
         'order': order,
@@ -49,7 +195,13 @@ def order_detail(request, order_id):
 @csrf_exempt
 @require_http_methods(["POST"])
 def update_order_status(request, order_id):
-    """Update order status via AJAX"""
+    """
+    Update order status via AJAX.
+    
+    The body may carry ``from``, the status the board showed; the update only
+    applies if the order is still in it. A lost race or a move the state
+    machine doesn't allow returns 409 with the order's current status.
+    """
     if not request.user.is_authenticated:
         return JsonResponse({'success': False, 'message': 'Authentication required'})
     
@@ -57,38 +209,46 @@ def update_order_status(request, order_id):
         data = json.loads(request.body)
         new_status = data.get('status')
         
-        valid_statuses = ['received', 'in_progress', 'ready', 'delivered', 'cancelled']
-        if new_status not in valid_statuses:
+        if new_status not in dict(Order.STATUS_CHOICES):
             return JsonResponse({'success': False, 'message': 'Invalid status'})
         
-        order = get_object_or_404(Order, id=order_id)
-        order.status = new_status
-        
-        if new_status == 'delivered':
-            from django.utils import timezone
-            order.delivered_at = timezone.now()
-        
-        order.save()
+        club = get_staff_club(request)
+        order = get_object_or_404(
+            scope_to_club(Order.objects.select_related('table'), club), id=order_id
+        )
+        change_status(order, new_status, expected_status=data.get('from'))
         
         return JsonResponse({
             'success': True,
-            'message': f'Order status updated to {order.get_status_display()}'
+            'message': f'Order status updated to {order.get_status_display()}',
+            'status': order.status,
         })
         
+    except (InvalidTransition, StatusConflict) as e:
+        return JsonResponse({
+            'success': False,
+            'message': str(e),
+            'status': getattr(e, 'current_status', None),
+        }, status=409)
+    except OutOfStock as e:
+        return JsonResponse({'success': False, 'message': str(e)})
     except (ValueError, json.JSONDecodeError):
         return JsonResponse({'success': False, 'message': 'Invalid data'})
-    except Order.DoesNotExist:
-        return JsonResponse({'success': False, 'message': 'Order not found'})
 
 
 @login_required
 def product_management(request):
     """Manage product availability and stock"""
-    # Get all products for the staff member's club
-    # For now, show all products - in production, filter by staff member's club
-    products = Product.objects.filter(is_available=True).select_related('club', 'category').order_by('category__display_order', 'display_order')
+    club = get_staff_club(request)
+    # Checkout sell-outs stay listed so they can be restocked here
+    products = scope_to_club(
+        Product.objects.filter(Q(is_available=True) | Q(sold_out=True)), club
+    ).select_related(
+        'club', 'category'
+    ).order_by('category__display_order', 'display_order')
     
     context = {
+        'club': club,
         'products': products,
     }
     
@@ -103,7 +263,8 @@ def toggle_product_availability(request, product_id):
         return JsonResponse({'success': False, 'message': 'Authentication required'})
     
     try:
-        product = get_object_or_404(Product, id=product_id)
+        club = get_staff_club(request)
+        product = get_object_or_404(scope_to_club(Product.objects.all(), club), id=product_id)
         product.is_available = not product.is_available
         product.save()
         
@@ -129,7 +290,11 @@ def update_stock(request, product_id):
         data = json.loads(request.body)
         stock_quantity = int(data.get('stock_quantity', 0))
         
-        product = get_object_or_404(Product, id=product_id)
+        club = get_staff_club(request)
+        product = get_object_or_404(scope_to_club(Product.objects.all(), club), id=product_id)
+        if product.sold_out and stock_quantity > 0:
+            # Restocking brings back a product checkout sold out, not one switched off by hand
+            product.is_available = True
         product.stock_quantity = stock_quantity
         product.save()
         